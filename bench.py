@@ -0,0 +1,1447 @@
+import argparse
+import json
+import os
+import random
+import tempfile
+import time
+import tracemalloc
+import urllib.request
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+
+from rules import RULES
+from fuzzy import FuzzyMatcher
+from content import check
+from render import FUZZY_HINT, rule_card
+from search import TopicIndex
+
+# --- Бенчмарки ---
+# Запуск: python bench.py <имя> [параметры]. main.py здесь не импортируется
+# целиком ради бота: всё, что нужно, собирается из отдельных модулей.
+
+WORDS = sorted({
+    word
+    for key, data in RULES.items()
+    for word in (key + " " + data["title"].lower()).split()
+    if word.isalpha() and len(word) > 2
+})
+
+
+def titles(rules):
+    return ((key, data["title"]) for key, data in rules.items())
+
+
+def topic_list(rules):
+    # Весь список тем одним сообщением, как /rules до страниц
+    lines = ["📑 <b>Все доступные темы:</b>\n"]
+    lines.extend(f"- {data['title']}" for data in rules.values())
+    return "\n".join(lines) + "\n"
+
+
+def synthetic_rules(n, seed=0):
+    """RULES из n тем, собранных из слов настоящих ключей и заголовков."""
+    rnd = random.Random(seed)
+    rules = {}
+    real = list(RULES.values())
+    while len(rules) < n:
+        words = rnd.sample(WORDS, rnd.randint(2, 4))
+        key = " ".join(words) + f" {len(rules)}"
+        data = rnd.choice(real)
+        rules[key] = {
+            "title": "📘 " + key.capitalize(),
+            "rule": data["rule"],
+            "examples": list(data["examples"]),
+        }
+    return rules
+
+
+def sample_queries(rules, count, seed=1):
+    """Половина запросов — куски настоящих ключей, половина — промахи."""
+    rnd = random.Random(seed)
+    keys = list(rules)
+    queries = []
+    for i in range(count):
+        if i % 2:
+            key = rnd.choice(keys)
+            start = rnd.randrange(max(1, len(key) - 6))
+            queries.append(key[start:start + rnd.randint(4, 12)])
+        else:
+            queries.append(" ".join(rnd.sample(WORDS, 2)) + "щ")
+    return queries
+
+
+def linear_first(rules, query):
+    for key, data in rules.items():
+        if query in key or query in data["title"].lower():
+            return key
+    return None
+
+
+def timed(fn, queries):
+    start = time.perf_counter()
+    for query in queries:
+        fn(query)
+    return (time.perf_counter() - start) / len(queries)
+
+
+def percentile(values, p):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * p / 100))]
+
+
+def with_typo(text, rnd):
+    i = rnd.randrange(len(text))
+    return text[:i] + text[i + 1:] if rnd.random() < 0.5 else text[:i] + rnd.choice("аоеи") + text[i + 1:]
+
+
+def short_queries(rules, count, seed=3):
+    """Запросы в 1-3 буквы и частые слова: у их n-грамм длинные списки тем."""
+    rnd = random.Random(seed)
+    keys = list(rules)
+    queries = ["о", "ни", "глагол", "ение", "ого"]
+    while len(queries) < count:
+        key = rnd.choice(keys)
+        size = rnd.randint(1, 3)
+        start = rnd.randrange(max(1, len(key) - size))
+        queries.append(key[start:start + size].strip() or "а")
+    return queries
+
+
+def linear_matches(rules, query, limit):
+    found = []
+    for key, data in rules.items():
+        if query in key or query in data["title"].lower():
+            found.append(key)
+            if len(found) == limit:
+                break
+    return found
+
+
+def bench_search(args):
+    print(f"{'темы':>8} {'запросы':>9} {'сборка, с':>10} {'цикл, мкс':>11} {'индекс, мкс':>12} {'ускорение':>10}")
+    for n in args.sizes:
+        rules = synthetic_rules(n)
+        start = time.perf_counter()
+        index = TopicIndex(titles(rules))
+        build = time.perf_counter() - start
+
+        for kind, queries in (("смесь", sample_queries(rules, args.queries)),
+                              ("короткие", short_queries(rules, args.queries))):
+            for query in queries:
+                assert index.first(query) == linear_first(rules, query), query
+                found = [index.keys[tid] for tid in index.matches(query, 4)]
+                assert found == linear_matches(rules, query, 4), query
+
+            linear = timed(lambda q: linear_first(rules, q), queries)
+            indexed = timed(index.first, queries)
+            print(f"{n:>8} {kind:>9} {build:>10.2f} {linear * 1e6:>11.1f} {indexed * 1e6:>12.1f} "
+                  f"{linear / indexed:>9.1f}x")
+
+
+def bench_fuzzy(args):
+    print(f"{'темы':>8} {'сборка, с':>10} {'опечатки p50/p99, мс':>22} {'промахи p50/p99, мс':>21} {'найдено':>8}")
+    rnd = random.Random(2)
+    for n in args.sizes:
+        rules = synthetic_rules(n)
+        start = time.perf_counter()
+        matcher = FuzzyMatcher(titles(rules))
+        build = time.perf_counter() - start
+
+        keys = rnd.sample(list(rules), min(args.queries, n))
+        typos = [with_typo(" ".join(key.split()[:2]), rnd) for key in keys]
+        misses = ["".join(rnd.sample("абвгдежзийклмнопрстуфхцчшщ", 9)) for _ in keys]
+        report = []
+        found = 0
+        for queries in (typos, misses):
+            latencies = []
+            for query in queries:
+                t = time.perf_counter()
+                found += matcher.match(query) is not None and queries is typos
+                latencies.append((time.perf_counter() - t) * 1000)
+            report.append(f"{percentile(latencies, 50):.2f}/{percentile(latencies, 99):.2f}")
+        print(f"{n:>8} {build:>10.2f} {report[0]:>22} {report[1]:>21} {found / len(keys):>8.0%}")
+
+
+def old_card(data):
+    text = f"<b>{data['title']}</b>\n\n"
+    text += f"<b>Правило:</b> {data['rule']}\n\n"
+    text += "<b>Примеры:</b>\n" + "\n".join(data["examples"])
+    return text
+
+
+def old_topic_list(rules):
+    text = "📑 <b>Все доступные темы:</b>\n\n"
+    for key, data in rules.items():
+        text += f"- {data['title']}\n"
+    return text
+
+
+class Rendered:
+    def __init__(self, rules):
+        self.cards = {
+            key: check(rule_card(data), f"тема {key!r}", reserve=len(FUZZY_HINT))
+            for key, data in rules.items()
+        }
+        self.topic_list = topic_list(rules)
+
+    def card(self, key):
+        return self.cards[key]
+
+
+def cpu_per_call(fn, repeat):
+    start = time.process_time()
+    for _ in range(repeat):
+        fn()
+    return (time.process_time() - start) / repeat * 1e6
+
+
+def bench_render(args):
+    start = time.process_time()
+    rendered = Rendered(RULES)
+    print(f"сборка всех ответов: {(time.process_time() - start) * 1000:.2f} мс CPU, "
+          f"самый длинный {max(map(len, rendered.cards.values()))} симв., "
+          f"список тем {len(rendered.topic_list)} симв. (лимит 4096)")
+
+    keys = list(RULES)
+    print(f"{'':>12} {'до, мкс':>9} {'после, мкс':>11}")
+    before = cpu_per_call(lambda: [old_card(RULES[k]) for k in keys], args.repeat) / len(keys)
+    after = cpu_per_call(lambda: [rendered.card(k) for k in keys], args.repeat) / len(keys)
+    print(f"{'тема':>12} {before:>9.2f} {after:>11.2f}")
+    before = cpu_per_call(lambda: old_topic_list(RULES), args.repeat)
+    after = cpu_per_call(lambda: rendered.topic_list, args.repeat)
+    print(f"{'/rules':>12} {before:>9.2f} {after:>11.2f}")
+
+
+def import_bot():
+    # bot.py при импорте только загружает контент; без BOT_TOKEN фоновый
+    # запуск из main.py тоже ничего не делает
+    os.environ.pop("BOT_TOKEN", None)
+    import bot
+    return bot
+
+
+def load_updates(path, count):
+    """Записанные обновления (JSONL) или синтетические, если файла нет."""
+    if path:
+        from record import read
+        return [update for _, update in read(path)]
+
+    from fake_api import make_update
+
+    queries = sample_queries(RULES, count) + ["/rules", "/start", "/help"]
+    return [
+        make_update(i + 1, 1000 + i % 50, queries[i % len(queries)])
+        for i in range(count)
+    ]
+
+
+def bench_webhook(args):
+    updates = load_updates(args.updates, args.count)
+    bodies = [json.dumps(u).encode() for u in updates]
+    headers = {"Content-Type": "application/json"}
+    if args.secret:
+        headers["X-Telegram-Bot-Api-Secret-Token"] = args.secret
+
+    if args.url:
+        # Внешний сервер (например, gunicorn -w 4 main:app): меряем только приём
+        def post(body):
+            req = urllib.request.Request(args.url, data=body, headers=headers)
+            with urllib.request.urlopen(req) as resp:
+                return resp.status
+    else:
+        bot = import_bot()
+        from fake_api import FakeBotAPI, FakeRequest
+
+        api = FakeBotAPI(latency=args.latency)
+        import main
+        main.WEBHOOK_SECRET = args.secret
+        main.bot = bot
+        bot.start_webhook(bot.build_application("123:FAKE", FakeRequest(api), rate_limit=False,
+                                               sessions=False))
+        client = main.app.test_client()
+
+        def post(body):
+            return client.post("/webhook", data=body, headers=headers).status_code
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(args.threads) as pool:
+        statuses = Counter(pool.map(post, bodies))
+    ingest = time.perf_counter() - start
+    print(f"принято {len(bodies)} обновлений за {ingest:.2f} с: "
+          f"{len(bodies) / ingest:.0f} в секунду, ответы {dict(statuses)}")
+
+    if not args.url:
+        while len(api.sent) < len(bodies) and time.perf_counter() - start < 60:
+            time.sleep(0.01)
+        total = time.perf_counter() - start
+        print(f"обработано {len(api.sent)} за {total:.2f} с: {len(api.sent) / total:.0f} в секунду")
+        bot.stop_webhook()
+
+
+def traced(fn):
+    tracemalloc.start()
+    start = time.perf_counter()
+    result = fn()
+    elapsed = time.perf_counter() - start
+    size = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    return result, elapsed, size
+
+
+def bench_content(args):
+    from content import ContentStore, compile_content
+
+    print(f"{'темы':>8} {'файл, КБ':>9} {'dict, МБ':>9} {'открытие, мс':>13} {'хранилище, МБ':>14} {'тема, мкс':>10}")
+    for n in args.sizes:
+        rules = synthetic_rules(n)
+        with tempfile.TemporaryDirectory() as tmp:
+            # Список всех тем на таком объёме в одно сообщение не влезает
+            path = compile_content(rules, os.path.join(tmp, "rules.sqlite"))
+            _, _, dict_size = traced(lambda: json.loads(json.dumps(rules)))
+            store, opened, store_size = traced(lambda: ContentStore(path))
+            keys = random.Random(3).sample(list(rules), min(n, 1000))
+            start = time.perf_counter()
+            for key in keys:
+                store._rule(key)
+            per_topic = (time.perf_counter() - start) / len(keys)
+            print(f"{n:>8} {os.path.getsize(path) / 1024:>9.0f} {dict_size / 2**20:>9.1f} "
+                  f"{opened * 1000:>13.2f} {store_size / 2**20:>14.2f} {per_topic * 1e6:>10.1f}")
+            store.close()
+
+
+def bench_records(args):
+    import timeit
+    from content import Rule
+    from render import rule_card
+
+    print(f"{'темы':>8} {'словари, МБ':>12} {'Rule, МБ':>9} {'байт на тему':>13} "
+          f"{'словарь, нс':>12} {'поле, нс':>9}")
+    for n in args.sizes:
+        rules = synthetic_rules(n) if n else RULES
+        raw = json.dumps(rules)
+        # Готовые ответы — одни и те же строки в обоих вариантах, в разницу не входят
+        cards = {key: rule_card(data) for key, data in rules.items()}
+
+        # Как было: RULES из словарей и рядом словарь готовых ответов
+        dicts, _, dict_size = traced(lambda: (json.loads(raw), dict(cards)))
+        records, _, record_size = traced(lambda: {
+            key: Rule(key, data["title"], data["rule"], data["examples"], data.get("section"), cards[key])
+            for key, data in json.loads(raw).items()
+        })
+        data = dicts[0][next(iter(rules))]
+        rule = records[next(iter(rules))]
+        repeat = 1_000_000
+        by_key = timeit.timeit(lambda: data["title"], number=repeat) / repeat
+        by_slot = timeit.timeit(lambda: rule.title, number=repeat) / repeat
+        print(f"{len(rules):>8} {dict_size / 2**20:>12.2f} {record_size / 2**20:>9.2f} "
+              f"{(dict_size - record_size) / len(rules):>13.0f} {by_key * 1e9:>12.1f} {by_slot * 1e9:>9.1f}")
+
+
+def bench_cache(args):
+    import logging
+    from cache import EVICTIONS, LOOKUPS, ResultCache
+    from inline import normalize_query
+
+    bot = import_bot()
+    logging.disable(logging.INFO)
+    rnd = random.Random(9)
+    # Словарь класса: куски ключей, промахи и опечатки; частота — по Ципфу
+    words = sample_queries(RULES, args.distinct // 2)
+    words += [with_typo(key, rnd) for key in rnd.choices(list(RULES), k=args.distinct - len(words))]
+    rnd.shuffle(words)
+    weights = [1 / (i + 1) ** args.zipf for i in range(len(words))]
+    stream = [normalize_query(q) for q in rnd.choices(words, weights, k=args.count)]
+    snap = bot.SNAPSHOT
+
+    def uncached(query):
+        return bot.find_reply(snap, query)
+
+    cache = ResultCache(args.size)
+
+    def cached(query):
+        found = cache.get(query)
+        if found is None:
+            found = bot.find_reply(snap, query)
+            cache.put(query, found)
+        return found
+
+    print(f"{args.count} запросов, разных {len(set(stream))}, кэш на {args.size}")
+    print(f"{'':>10} {'мкс/запрос':>11} {'p50, мкс':>9} {'p99, мкс':>9}")
+    for name, fn in (("без кэша", uncached), ("с кэшем", cached)):
+        latencies = []
+        for query in stream:
+            start = time.perf_counter()
+            fn(query)
+            latencies.append((time.perf_counter() - start) * 1e6)
+        print(f"{name:>10} {sum(latencies) / len(latencies):>11.1f} {percentile(latencies, 50):>9.1f} "
+              f"{percentile(latencies, 99):>9.1f}")
+    assert all(cached(q) == uncached(q) for q in set(stream))
+    hits, misses = LOOKUPS.value("hit"), LOOKUPS.value("miss")
+    kinds = Counter(uncached(q)[0] for q in stream)
+    print(f"попаданий {hits / (hits + misses):.1%}, вытеснено {EVICTIONS.value('size')}, "
+          f"ответы в потоке: {dict(kinds)}")
+
+
+def bench_morph(args):
+    import morph
+
+    forms = ["глаголы", "о глаголах", "существительных", "приставкой", "безударных гласных",
+             "падежей", "суффиксами", "прилагательные", "местоимениями", "предложений"]
+    queries = [forms[i % len(forms)] for i in range(args.queries)]
+    cold = timed(lambda q: tuple(morph._stemmer.stemWords(morph.words(q))), queries)
+    warm = timed(morph.normalize, queries)
+    print(f"нормализация запроса: без кэша {cold * 1e6:.1f} мкс, с кэшем {warm * 1e6:.2f} мкс")
+
+    print(f"{'темы':>8} {'сборка, с':>10} {'поиск, мкс':>11}")
+    for n in args.sizes:
+        rules = synthetic_rules(n)
+        start = time.perf_counter()
+        index = morph.LemmaIndex(titles(rules))
+        build = time.perf_counter() - start
+        print(f"{n:>8} {build:>10.2f} {timed(index.lookup, queries) * 1e6:>11.1f}")
+
+
+def bench_fulltext(args):
+    import fulltext
+
+    def texts(rules):
+        return [(k, d["title"], d["rule"], d["examples"]) for k, d in rules.items()]
+
+    real = fulltext.TextIndex(texts(RULES))
+    for query in args.show:
+        found = [real.keys[tid] for tid in real.matches(query, 4)]
+        print(f"{query!r}: {found or 'нет'}")
+
+    # Частые основы есть в доле всех тем, редкая (номер в ключе) — в одной:
+    # поиск стоит столько, сколько тем в списке самой короткой основы
+    print(f"\n{'темы':>8} {'сборка, с':>10} {'запрос':>22} {'кандидатов':>11} {'мкс':>8}")
+    for n in args.sizes:
+        rules = synthetic_rules(n)
+        start = time.perf_counter()
+        index = fulltext.TextIndex(texts(rules))
+        build = time.perf_counter() - start
+        for query in ("подлежащее", "глагол время", f"глагол {n // 2}"):
+            postings = [index._postings.get(term, {}) for term in fulltext.query_terms(query)]
+            repeat = [query] * args.queries
+            spent = timed(lambda q: index.matches(q, 4), repeat)
+            print(f"{n:>8} {build:>10.2f} {query:>22} {min(map(len, postings)):>11} {spent * 1e6:>8.1f}")
+
+
+HIT_FORMS = ["глагол", "глаголы", "безударные гласные", "падеж", "суффикс", "о существительных",
+             "приставкой", "местоимение", "обращение", "корень слова"]
+
+
+def scenarios(rules, count, seed=4):
+    rnd = random.Random(seed)
+    keys = list(rules)
+    hits = HIT_FORMS + [k[:rnd.randint(5, 12)] for k in rnd.sample(keys, min(len(keys), 200))]
+    return {
+        "попадание": [rnd.choice(hits) for _ in range(count)],
+        "промах": ["".join(rnd.sample("бвгджзклмнпрстфхцчшщ", 8)) for _ in range(count)],
+        "опечатка": [with_typo(rnd.choice(keys), rnd) for _ in range(count)],
+        "кнопка": [rnd.choice(["📚 Синтаксис", "📦 Части речи", "✍️ Орфография", "⚡ Глаголы"])
+                   for _ in range(count)],
+        "/rules": ["/rules"] * count,
+        "/start": ["/start"] * count,
+        "/help": ["/help"] * count,
+    }
+
+
+async def drive(application, texts):
+    from telegram import Update
+    from fake_api import make_update
+
+    updates = [
+        Update.de_json(make_update(i + 1, 1000 + i % 100, text), application.bot)
+        for i, text in enumerate(texts)
+    ]
+    latencies = []
+    start = time.perf_counter()
+    for update in updates:
+        t = time.perf_counter()
+        await application.process_update(update)
+        latencies.append((time.perf_counter() - t) * 1000)
+    return len(updates) / (time.perf_counter() - start), latencies
+
+
+def bench_pages(args):
+    import asyncio
+    import logging
+
+    from telegram import Update
+
+    from fake_api import FakeBotAPI, FakeRequest, make_callback, make_update
+    from pages import TopicPages
+    from render import LIMIT
+    from search import Numbering
+
+    print(f"{'темы':>8} {'один список, симв.':>19} {'страниц':>8} {'сборка, с':>10} {'память, МБ':>11} "
+          f"{'1 тема, мс':>11} {'страница, мкс':>14}")
+    for n in args.sizes:
+        rules = synthetic_rules(n)
+        titles = [(key, data["title"]) for key, data in rules.items()]
+        numbering = Numbering(rules)
+        pages, build, size = traced(lambda: TopicPages(titles, numbering))
+        # Перезагрузка с одной изменённой темой: кнопки остальных общие
+        key, title = titles[n // 2]
+        start = time.perf_counter()
+        pages.updated(numbering, {key: title}, {key: title + "!"})
+        reload = time.perf_counter() - start
+        numbers = [i * 7919 % len(pages) for i in range(args.flips)]
+        flip = timed(pages.page, numbers)
+        print(f"{n:>8} {len(topic_list(rules)):>19} {len(pages):>8} {build:>10.3f} {size / 1e6:>11.1f} "
+              f"{reload * 1000:>11.1f} {flip * 1e6:>14.2f}")
+
+    # Листание через настоящий Application: на нажатие — один editMessageText
+    bot = import_bot()
+    logging.disable(logging.INFO)
+    api = FakeBotAPI()
+    application = bot.build_application("123:FAKE", FakeRequest(api), rate_limit=False, sessions=False)
+    pages = bot.SNAPSHOT.pages
+    presses = [make_callback(i + 1, 1000 + i % 100, f"page:{i % len(pages)}") for i in range(args.flips)]
+
+    async def run():
+        await application.initialize()
+        await application.process_update(Update.de_json(make_update(1, 1000, "/rules"), application.bot))
+        latencies = []
+        start = time.perf_counter()
+        for data in presses:
+            update = Update.de_json(data, application.bot)
+            t = time.perf_counter()
+            await application.process_update(update)
+            latencies.append((time.perf_counter() - t) * 1000)
+        await application.shutdown()
+        return len(presses) / (time.perf_counter() - start), latencies
+
+    rate, latencies = asyncio.run(run())
+    print(f"\nлистание /rules ({len(bot.SNAPSHOT.numbering)} тем, {len(pages)} стр., лимит сообщения {LIMIT}): "
+          f"{rate:.0f} нажатий/с, p50 {percentile(latencies, 50):.2f} мс, p99 {percentile(latencies, 99):.2f} мс")
+    print(f"вызовы Bot API: {dict(api.calls)}")
+
+
+def bench_handlers(args):
+    import asyncio
+    import logging
+    from content import ContentStore, compile_content
+    from fake_api import FakeBotAPI, FakeRequest
+
+    bot = import_bot()
+    logging.disable(logging.INFO)
+    api = FakeBotAPI(latency=args.latency)
+    # Лимитер отправки здесь выключен: меряем сами обработчики, а не 30/с
+    application = bot.build_application("123:FAKE", FakeRequest(api), rate_limit=args.rate_limit,
+                                        sessions=False)
+
+    slow = []
+
+    async def run(rules):
+        await application.initialize()
+        print(f"{'':>10} {'в секунду':>10} {'p50, мс':>8} {'p95, мс':>8} {'p99, мс':>8}")
+        for name, texts in scenarios(rules, args.count).items():
+            rate, latencies = await drive(application, texts)
+            if args.max_p99 and percentile(latencies, 99) > args.max_p99:
+                slow.append(f"{name} на {len(rules)} темах")
+            print(f"{name:>10} {rate:>10.0f} {percentile(latencies, 50):>8.2f} "
+                  f"{percentile(latencies, 95):>8.2f} {percentile(latencies, 99):>8.2f}")
+        await application.shutdown()
+
+    for n in args.sizes:
+        if n:
+            rules = synthetic_rules(n)
+            tmp = tempfile.TemporaryDirectory()
+            path = compile_content(rules, os.path.join(tmp.name, "rules.sqlite"))
+            bot.load_content(ContentStore(path))
+        else:
+            rules = RULES
+        print(f"\n=== {len(rules)} тем ===")
+        asyncio.run(run(rules))
+
+    if slow:
+        raise SystemExit(f"p99 выше {args.max_p99} мс: " + ", ".join(slow))
+
+
+def bench_ratelimit(args):
+    import asyncio
+    import logging
+    from telegram import Update
+    from fake_api import FakeBotAPI, FakeRequest, make_update
+
+    bot = import_bot()
+    logging.disable(logging.CRITICAL)  # без очереди будут сотни трейсбеков RetryAfter
+    # Чуть ниже лимита API: ровно на границе скользящее окно даёт редкие 429
+    bot.SEND_RATE = args.rate * 0.95
+    texts = sample_queries(RULES, args.count)
+
+    async def burst(rate_limit):
+        api = FakeBotAPI(flood_limit=args.rate)
+        application = bot.build_application("123:FAKE", FakeRequest(api), rate_limit=rate_limit,
+                                            sessions=False)
+        await application.initialize()
+        updates = [
+            Update.de_json(make_update(i + 1, 1000 + i % args.chats, text), application.bot)
+            for i, text in enumerate(texts)
+        ]
+        start = time.perf_counter()
+        await asyncio.gather(*(application.process_update(u) for u in updates))
+        elapsed = time.perf_counter() - start
+        await application.shutdown()
+        flood = sum(n for (_, code), n in api.errors.items() if code == 429)
+        print(f"{'с очередью' if rate_limit else 'без очереди':>12}: доставлено {len(api.sent)}/{len(updates)} "
+              f"за {elapsed:.1f} с ({len(api.sent) / elapsed:.0f} в секунду), ответов 429: {flood}")
+
+    print(f"{args.count} ответов в {args.chats} чатов, лимит поддельного API {args.rate} в секунду")
+    asyncio.run(burst(False))
+    asyncio.run(burst(True))
+
+
+def bench_reload(args):
+    import logging
+    import shutil
+    from content import ContentStore, compile_content
+    from snapshot import Snapshot
+
+    logging.disable(logging.INFO)
+    print(f"{'темы':>8} {'изменено':>9} {'сборка файла, мс':>17} {'снимок, мс':>11} "
+          f"{'с нуля, мс':>11} {'память, МБ':>11}")
+    for n in args.sizes:
+        rules = synthetic_rules(n)
+        with tempfile.TemporaryDirectory() as tmp:
+            path = compile_content(rules, os.path.join(tmp, "rules.sqlite"))
+            start = time.perf_counter()
+            snapshot = Snapshot.build(ContentStore(path))
+            full = time.perf_counter() - start
+            for changes in args.changes:
+                changed = dict(rules)
+                for key in random.Random(changes).sample(list(rules), min(changes, n)):
+                    data = dict(changed[key])
+                    data["title"] += " новое"
+                    data["rule"] += " Новое правило."
+                    changed[key] = data
+                # Новый файл собирается из копии старого: старый снимок читает свой
+                new_path = os.path.join(tmp, f"rules-{changes}.sqlite")
+                shutil.copyfile(path, new_path)
+                start = time.perf_counter()
+                compile_content(changed, new_path, previous=new_path)
+                compiled = time.perf_counter() - start
+
+                store = ContentStore(new_path)
+                start = time.perf_counter()
+                snapshot.updated(store)
+                reload = time.perf_counter() - start
+                # Память сверх старого снимка, пока живы оба
+                _, _, extra = traced(lambda: snapshot.updated(store))
+                print(f"{n:>8} {changes:>9} {compiled * 1000:>17.1f} {reload * 1000:>11.1f} "
+                      f"{full * 1000:>11.1f} {extra / 2**20:>11.1f}")
+                store.close()
+
+
+def bench_concurrency(args):
+    import asyncio
+    import logging
+    from telegram import Update
+    from telegram.ext import SimpleUpdateProcessor
+    from fake_api import FakeBotAPI, FakeRequest, make_update
+
+    bot = import_bot()
+    logging.disable(logging.INFO)
+    # Точные ключи: у соседних сообщений чата разные ответы, и перестановка видна
+    keys = list(RULES)
+    texts = [keys[i % len(keys)] for i in range(args.chats * args.per_chat)]
+
+    class TimedAPI(FakeBotAPI):
+        def on_sendMessage(self, params):
+            self.times.append(time.perf_counter())
+            return super().on_sendMessage(params)
+
+    async def run(concurrency, ordered=True):
+        api = TimedAPI(latency=args.latency, jitter=args.jitter)
+        api.times = []
+        application = bot.build_application("123:FAKE", FakeRequest(api), rate_limit=False,
+                                            concurrency=concurrency, sessions=False)
+        if not ordered:
+            application._update_processor = SimpleUpdateProcessor(concurrency)
+        await application.initialize()
+        await application.start()
+        updates = [
+            Update.de_json(make_update(i + 1, 1000 + i % args.chats, text), application.bot)
+            for i, text in enumerate(texts)
+        ]
+        queued = {}
+        start = time.perf_counter()
+        for update in updates:
+            queued.setdefault(update.effective_chat.id, []).append(time.perf_counter())
+            application.update_queue.put_nowait(update)
+        await application.update_queue.join()
+        elapsed = time.perf_counter() - start
+        await application.stop()
+        await application.shutdown()
+
+        # Каждое обновление даёт ровно один ответ, i-й ответ чата — на i-е сообщение
+        replies = {}
+        latencies = []
+        for (chat, text), sent in zip(api.sent, api.times):
+            replies.setdefault(chat, []).append(text)
+            latencies.append((sent - queued[chat][len(replies[chat]) - 1]) * 1000)
+        return len(updates) / elapsed, latencies, replies
+
+    print(f"{args.chats} чатов по {args.per_chat} сообщений, задержка API "
+          f"{args.latency * 1000:.0f}+{args.jitter * 1000:.0f} мс")
+    print(f"{'':>16} {'в секунду':>10} {'p50, мс':>9} {'p99, мс':>9} {'чатов не по порядку':>20}")
+    expected = None
+    for concurrency in [1] + args.limits:
+        for ordered in (True, False) if concurrency > 1 else (True,):
+            rate, latencies, replies = asyncio.run(run(concurrency, ordered))
+            if expected is None:
+                expected = replies
+            name = f"{concurrency}" + ("" if ordered else " без порядка")
+            broken = sum(replies[chat] != expected[chat] for chat in expected)
+            print(f"{name:>16} {rate:>10.0f} {percentile(latencies, 50):>9.1f} "
+                  f"{percentile(latencies, 99):>9.1f} {broken:>20}")
+
+
+def bench_sessions(args):
+    import asyncio
+    import logging
+    import sqlite3
+    from telegram import Update
+    from telegram.ext import TypeHandler
+    from fake_api import FakeBotAPI, FakeRequest, make_update
+    from sessions import SessionPersistence
+
+    bot = import_bot()
+    logging.disable(logging.INFO)
+    keys = list(RULES)
+    texts = [keys[i % len(keys)] for i in range(args.count)]
+
+    class EachUpdate(SessionPersistence):
+        # Для сравнения: после каждого обновления его сессия сразу пишется
+        # своей транзакцией с fsync (см. save). Пачки Application не
+        # пишет: до его интервала прогон не доживает
+        def __init__(self, path):
+            super().__init__(path, update_interval=3600)
+            self._db.execute("PRAGMA synchronous=FULL")
+
+        async def update_chat_data(self, chat_id, data):
+            pass
+
+        async def save(self, update, context):
+            self._commit({update.effective_chat.id: json.dumps(context.chat_data, ensure_ascii=False)})
+
+    def counted(sessions):
+        commit = sessions._commit
+        sessions.commits = 0
+
+        def wrapper(batch):
+            sessions.commits += 1
+            commit(batch)
+        sessions._commit = wrapper
+        return sessions
+
+    async def run(make_sessions):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "sessions.sqlite")
+            sessions = make_sessions(path)
+            if sessions:
+                counted(sessions)
+            application = bot.build_application("123:FAKE", FakeRequest(FakeBotAPI()), rate_limit=False,
+                                                sessions=sessions)
+            if isinstance(sessions, EachUpdate):
+                application.add_handler(TypeHandler(Update, sessions.save), group=1)
+            await application.initialize()
+            await application.start()
+            start = time.perf_counter()
+            for i, text in enumerate(texts):
+                application.update_queue.put_nowait(
+                    Update.de_json(make_update(i + 1, 1000 + i % args.chats, text), application.bot))
+                if i % 500 == 499:
+                    # Поток, а не один всплеск: даём записи идти параллельно
+                    await asyncio.sleep(0)
+            await application.update_queue.join()
+            await application.stop()
+            await application.shutdown()
+            elapsed = time.perf_counter() - start
+            if not sessions:
+                return args.count / elapsed, 0, 0
+            saved = sqlite3.connect(path).execute("SELECT count(*) FROM chats").fetchone()[0]
+            return args.count / elapsed, sessions.commits, saved
+
+    print(f"{args.count} сообщений от {args.chats} чатов")
+    print(f"{'':>22} {'в секунду':>10} {'транзакций':>11} {'сессий в файле':>15}")
+    for name, make in (
+        ("без сессий", lambda path: False),
+        (f"пачками раз в {args.interval:g} с", lambda path: SessionPersistence(path, args.interval)),
+        ("по одной с fsync", EachUpdate),
+    ):
+        rate, commits, saved = asyncio.run(run(make))
+        print(f"{name:>22} {rate:>10.0f} {commits:>11} {saved:>15}")
+
+
+def bench_quiz(args):
+    import quiz
+
+    class Bank(set):
+        pass
+
+    print(f"{'вопросов':>9} {'учеников':>9} {'куча, мкс':>10} {'перебор, мкс':>13} {'память, МБ':>11}")
+    for items in args.items:
+        bank = Bank(f"q{i}" for i in range(items))
+        bank.order = sorted(bank)
+        rnd = random.Random(5)
+        now = time.time()
+
+        def pupils():
+            # Каждый ученик уже прошёл весь банк: повторения разбросаны на сутки вперёд
+            states = []
+            for _ in range(args.users):
+                state = quiz.state({})
+                for qid in bank.order:
+                    quiz.grade(state, qid, rnd.random() < 0.7, now - 3600 + rnd.random() * 86400)
+                states.append(state)
+            return states
+
+        states, _, size = traced(pupils)
+        picks = [rnd.randrange(args.users) for _ in range(args.answers)]
+
+        start = time.perf_counter()
+        for i, user in enumerate(picks):
+            state = states[user]
+            qid = quiz.next_question(state, bank, now + i)
+            quiz.grade(state, qid, i % 3 != 0, now + i)
+        heap = (time.perf_counter() - start) / len(picks)
+
+        # То же без кучи: время повторения каждого вопроса в словаре и поиск минимума
+        due = [{qid: when for when, qid in state["due"]} for state in states]
+        start = time.perf_counter()
+        for i, user in enumerate(picks):
+            times = due[user]
+            qid = min(times, key=times.__getitem__)
+            times[qid] = now + i + quiz.INTERVALS[0]
+        scan = (time.perf_counter() - start) / len(picks)
+        print(f"{items:>9} {args.users:>9} {heap * 1e6:>10.2f} {scan * 1e6:>13.2f} {size / 2**20:>11.1f}")
+
+
+def bench_broadcast(args):
+    import asyncio
+    import datetime
+    import logging
+    from broadcast import Broadcaster
+    from fake_api import FakeBotAPI, FakeRequest
+
+    bot = import_bot()
+    logging.disable(logging.CRITICAL)
+    bot.SEND_RATE = args.rate * 0.95
+    rnd = random.Random(6)
+    chats = list(range(10_000, 10_000 + args.subscribers))
+    blocked = set(rnd.sample(chats, args.subscribers * 2 // 100))
+    missing = set(rnd.sample([c for c in chats if c not in blocked], args.subscribers // 100))
+    flaky = set(rnd.sample(chats, args.subscribers // 100))
+
+    api = FakeBotAPI(flood_limit=args.rate, latency=args.latency)
+    for chat_id in blocked:
+        api.fail("sendMessage", 403, "Forbidden: bot was blocked by the user", times=None, chat_id=chat_id)
+    for chat_id in missing:
+        api.fail("sendMessage", 400, "Bad Request: chat not found", times=None, chat_id=chat_id)
+    for chat_id in flaky:
+        api.fail("sendMessage", 502, "Bad Gateway", chat_id=chat_id)
+
+    async def run(path, stop_after):
+        application = bot.build_application("123:FAKE", FakeRequest(api), sessions=False)
+        await application.initialize()
+        broadcaster = Broadcaster(application.bot, path)
+        if stop_after is None:
+            # Другой процесс: прежний владелец не отпустил рассылку, ждём аренду
+            broadcaster.owner += ":resumed"
+        else:
+            for chat_id in chats:
+                await broadcaster.subscribe(chat_id)
+        key, text = bot.rule_of_the_day(datetime.date.today())
+        broadcast_id = await broadcaster.create("bench", key, text)
+        task = asyncio.create_task(broadcaster.run(broadcast_id))
+        while stop_after is not None and len(api.sent) < stop_after and not task.done():
+            await asyncio.sleep(0.05)
+        if not task.done():
+            if stop_after is not None:
+                # Передеплой: задачу отменяют, статусы успевают записаться
+                task.cancel()
+        try:
+            await task
+        except asyncio.CancelledError:
+            pass
+        report = await broadcaster.report(broadcast_id)
+        await broadcaster.stop()
+        await application.shutdown()
+        return report
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "broadcast.sqlite")
+        start = time.perf_counter()
+        first = asyncio.run(run(path, args.subscribers // 2))
+        second = asyncio.run(run(path, None))
+        elapsed = time.perf_counter() - start
+
+    received = Counter(chat_id for chat_id, _ in api.sent)
+    duplicates = sum(n - 1 for n in received.values() if n > 1)
+    lost = [c for c in chats if c not in blocked | missing and not received[c]]
+    flood = sum(n for (_, code), n in api.errors.items() if code == 429)
+    print(f"{args.subscribers} подписчиков, лимит поддельного API {args.rate} в секунду, "
+          f"заблокировали бота {len(blocked)}, удалённых чатов {len(missing)}, сбоев 502 {len(flaky)}")
+    print(f"до передеплоя: {first}")
+    print(f"после:         {second}")
+    print(f"доставлено {len(received)} за {elapsed:.1f} с ({len(received) / elapsed:.0f} в секунду), "
+          f"повторов {duplicates}, потеряно {len(lost)}, ответов 429: {flood}")
+    if duplicates or lost or second.get("pending"):
+        raise SystemExit("рассылка отработала неверно")
+
+
+def memory():
+    """(RSS, PSS) процесса в байтах. PSS делит общие страницы между процессами,
+    поэтому сумма PSS — сколько памяти на самом деле занято."""
+    found = {}
+    with open("/proc/self/smaps_rollup") as f:
+        for line in f:
+            name, _, value = line.partition(":")
+            if name in ("Rss", "Pss"):
+                found[name] = int(value.split()[0]) * 1024
+    return found["Rss"], found["Pss"]
+
+
+def bench_shards(args):
+    import logging
+    import multiprocessing
+    from content import ContentStore, compile_content
+    from fake_api import FakeBotAPI, FakeRequest, make_update
+    from shard import Shards, serve
+    from snapshot import Snapshot
+
+    bot = import_bot()
+    logging.disable(logging.WARNING)
+    rules = synthetic_rules(args.topics)
+    keys = list(rules)
+    rnd = random.Random(7)
+    updates = [make_update(i + 1, 1000 + i % args.chats, rnd.choice(keys)) for i in range(args.count)]
+    bodies = [json.dumps(u).encode() for u in updates]
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = compile_content(rules, os.path.join(tmp, "rules.sqlite"))
+        bot.publish(Snapshot.build(ContentStore(path)))
+        print(f"{args.topics} тем, {args.count} обновлений из {args.chats} чатов, ядер {os.cpu_count()}")
+        print(f"{'воркеры':>8} {'контент':>9} {'в секунду':>10} {'RSS всего, МБ':>14} {'PSS всего, МБ':>14}")
+        for private in (False, True):
+            for count in args.workers:
+                results = multiprocessing.get_context("fork").SimpleQueue()
+
+                def target(index, conn):
+                    bot.SNAPSHOT.store.reopen()
+                    if private:
+                        # Как без общего контента: каждый процесс собирает всё сам
+                        bot.publish(Snapshot.build(ContentStore(path)))
+                    api = FakeBotAPI(latency=args.latency)
+                    application = bot.build_application("123:FAKE", FakeRequest(api), rate_limit=False,
+                                                        sessions=False)
+
+                    async def start(application):
+                        await application.initialize()
+                        await application.start()
+                        results.put(None)
+
+                    async def stop(application):
+                        await application.stop()
+                        results.put((len(api.sent), memory()))
+                        await application.shutdown()
+
+                    serve(conn, application, start, stop)
+
+                shards = Shards(count, target)
+                for _ in range(count):
+                    results.get()
+                start = time.perf_counter()
+                for update, body in zip(updates, bodies):
+                    shards.route(update, body)
+                shards.stop(timeout=600)
+                reports = [results.get() for _ in range(count)]
+                elapsed = time.perf_counter() - start
+
+                sent = sum(n for n, _ in reports)
+                assert sent == len(updates), (sent, len(updates))
+                rss, pss = memory()
+                rss += sum(m[0] for _, m in reports)
+                pss += sum(m[1] for _, m in reports)
+                name = "свой" if private else "общий"
+                print(f"{count:>8} {name:>9} {len(updates) / elapsed:>10.0f} {rss / 2**20:>14.0f} {pss / 2**20:>14.0f}")
+
+
+def import_times(module):
+    """Время импорта module и самые долгие пакеты в нём по -X importtime."""
+    import subprocess
+    import sys
+
+    env = dict(os.environ)
+    env.pop("BOT_TOKEN", None)
+
+    def run(code):
+        result = subprocess.run([sys.executable, "-X", "importtime", "-c", code], capture_output=True,
+                                text=True, env=env, cwd=os.path.dirname(os.path.abspath(__file__)))
+        found = {}
+        for line in result.stderr.splitlines():
+            if not line.startswith("import time:") or "cumulative" in line:
+                continue
+            _, cumulative, name = line[len("import time:"):].split("|")
+            # Отступы вложенности не годятся: main.py импортирует бота в
+            # соседнем потоке, и уровни перемешиваются. Считаем по пакетам
+            package = name.strip().split(".")[0]
+            found[package] = max(found.get(package, 0), int(cumulative) / 1e6)
+        return found
+
+    # Что импортирует сам интерпретатор при старте, в список не входит
+    startup = run("pass")
+    found = run(f"import {module}")
+    total = found.pop(module)
+    return total, sorted(((t, name) for name, t in found.items() if name not in startup), reverse=True)
+
+
+def free_port():
+    import socket
+
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def bench_startup(args):
+    import subprocess
+    import sys
+
+    here = os.path.dirname(os.path.abspath(__file__))
+    port = free_port()
+    env = dict(os.environ, PORT=str(port))
+    # Без токена бот не запускается, но импорт и индексы проходят как обычно
+    env.pop("BOT_TOKEN", None)
+
+    def get(path):
+        try:
+            with urllib.request.urlopen(f"http://127.0.0.1:{port}{path}", timeout=1) as resp:
+                return json.loads(resp.read()) if path != "/" else resp.status
+        except OSError:
+            return None
+
+    print(f"{'запуск':>7} {'первый ответ /, с':>18} {'бот и индексы готовы, с':>24}")
+    for run in range(1, args.runs + 1):
+        start = time.perf_counter()
+        proc = subprocess.Popen([sys.executable, "main.py"], cwd=here, env=env,
+                                stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        try:
+            while get("/") is None:
+                time.sleep(0.005)
+            live = time.perf_counter() - start
+            while True:
+                status = get("/healthz")
+                if status and ("import" in status["stages"] or status["error"]):
+                    break
+                time.sleep(0.01)
+        finally:
+            proc.terminate()
+            proc.wait()
+        stages = status["stages"]
+        print(f"{run:>7} {live:>18.3f} {stages.get('import', float('nan')):>24.3f}")
+
+    for module in ("main", "bot"):
+        total, top = import_times(module)
+        print(f"\nimport {module}: {total:.3f} с, дольше всего:")
+        for seconds, name in top[:args.top]:
+            print(f"  {seconds * 1000:>8.1f} мс  {name}")
+
+
+def process_cpu(pid):
+    """Секунды процессора (user + sys) процесса pid."""
+    with open(f"/proc/{pid}/stat") as f:
+        fields = f.read().rsplit(")", 1)[1].split()
+    return (int(fields[11]) + int(fields[12])) / os.sysconf("SC_CLK_TCK")
+
+
+def bench_replay(args):
+    import signal
+    import subprocess
+    import sys
+
+    from fake_api import FakeBotAPI, FakeServer
+    from record import read
+
+    if args.file:
+        entries = sorted(((t or 0, u) for t, u in read(args.file)), key=lambda e: e[0])
+    else:
+        entries = [(i / args.rate, u) for i, u in enumerate(load_updates(None, args.count))]
+    # getUpdates отдаёт обновления по возрастанию update_id, а в записи
+    # могут быть и перезапуски бота
+    for i, (_, update) in enumerate(entries):
+        update["update_id"] = i + 1
+    speed = None if args.speed == "max" else float(args.speed)
+
+    api = FakeBotAPI(latency=args.latency, jitter=args.jitter, error_rate=args.error_rate)
+    server = FakeServer(api)
+    here = os.path.dirname(os.path.abspath(__file__))
+    tmp = tempfile.mkdtemp()
+    port = free_port()
+    # Бот — обычный python main.py, только Bot API у него поддельный
+    env = dict(os.environ, BOT_TOKEN="123:FAKE", BOT_API_URL=server.url, BOT_MODE="polling",
+               PORT=str(port), SESSION_DB=os.path.join(tmp, "sessions.sqlite"),
+               BROADCAST_DB=os.path.join(tmp, "broadcast.sqlite"), RECORD_UPDATES="")
+    if args.no_limits:
+        env.update(SEND_RATE="1000000", CHAT_RATE="1000000")
+    log = os.path.join(tmp, "bot.log")
+    with open(log, "w") as output:
+        proc = subprocess.Popen([sys.executable, "main.py"], cwd=here, env=env, stdout=output,
+                                stderr=subprocess.STDOUT)
+    try:
+        deadline = time.monotonic() + 60
+        while True:
+            try:
+                with urllib.request.urlopen(f"http://127.0.0.1:{port}/readyz", timeout=1):
+                    break
+            except OSError:
+                if proc.poll() is not None or time.monotonic() > deadline:
+                    raise SystemExit(f"бот не запустился, см. {log}")
+                time.sleep(0.05)
+
+        span = entries[-1][0] - entries[0][0]
+        pace = "подряд" if speed is None else f"{speed:g}×, {span / speed:.1f} с"
+        print(f"{len(entries)} обновлений ({pace}), Bot API: задержка {args.latency * 1000:g} мс, "
+              f"ошибки {args.error_rate:.0%}")
+        start = time.perf_counter()
+        cpu = time.process_time(), process_cpu(proc.pid)
+        for t, update in entries:
+            if speed is not None:
+                pause = start + (t - entries[0][0]) / speed - time.perf_counter()
+                if pause > 0:
+                    time.sleep(pause)
+            api.publish(update)
+        offered = time.perf_counter() - start
+        deadline = time.perf_counter() + args.wait
+        while api.unanswered and time.perf_counter() < deadline:
+            time.sleep(0.005)
+        total = (api.answered_at or time.perf_counter()) - start
+        cpu = time.process_time() - cpu[0], process_cpu(proc.pid) - cpu[1]
+    finally:
+        proc.send_signal(signal.SIGINT)
+        try:
+            proc.wait(15)
+        except subprocess.TimeoutExpired:
+            proc.kill()
+        server.stop()
+
+    latencies = [t * 1000 for t in api.latencies]
+    answered = len(latencies)
+    print(f"отправлено за {offered:.2f} с ({len(entries) / max(offered, 1e-9):.0f}/с), "
+          f"отвечено {answered} за {total:.2f} с ({answered / total:.0f}/с), без ответа {api.unanswered}")
+    if latencies:
+        print(f"от обновления до ответа, мс: p50 {percentile(latencies, 50):.1f}, "
+              f"p95 {percentile(latencies, 95):.1f}, p99 {percentile(latencies, 99):.1f}, "
+              f"max {max(latencies):.1f}")
+    calls = {m: n for m, n in api.calls.items() if m != "getUpdates"}
+    print(f"вызовы Bot API: {calls}, getUpdates {api.calls['getUpdates']}, ошибки {dict(api.errors)}")
+    print(f"процессор: бот {cpu[1]:.2f} с, поддельный API и этот процесс {cpu[0]:.2f} с; лог бота: {log}")
+
+
+def blocking_io(seconds):
+    time.sleep(seconds)
+
+
+def busy(seconds):
+    end = time.perf_counter() + seconds
+    total = 0
+    while time.perf_counter() < end:
+        total += sum(range(100))
+    return total
+
+
+def bench_loopwatch(args):
+    import asyncio
+    import logging
+
+    import health
+    from loopwatch import Watchdog
+
+    logging.disable(logging.WARNING)
+    tmp = tempfile.mkdtemp()
+
+    async def spin(watch):
+        watchdog = Watchdog(args.interval, args.threshold, tmp, args.keep).start() if watch else None
+        start = time.perf_counter()
+        for _ in range(args.spins):
+            await asyncio.sleep(0)
+        spent = time.perf_counter() - start
+        if watchdog is not None:
+            watchdog.stop()
+        return spent / args.spins
+
+    base = asyncio.run(spin(False))
+    watched = asyncio.run(spin(True))
+    print(f"итерация loop: без сторожа {base * 1e6:.2f} мкс, со сторожем {watched * 1e6:.2f} мкс")
+
+    async def stalls():
+        watchdog = Watchdog(args.interval, args.threshold, tmp, args.keep).start()
+        await asyncio.sleep(0.5)
+        # Профиль снимается со стека потока loop: в нём видна блокирующая функция
+        for name, block in (("time.sleep", blocking_io), ("CPU", busy), ("time.sleep", blocking_io)):
+            block(args.stall)
+            await asyncio.sleep(args.interval * 3)
+            status = health.status()["loop"]
+            print(f"{name:>10} {args.stall:g} с: наибольшее опоздание {status['max_lag']:.2f} с, зависаний "
+                  f"{status['stalls']}, профиль {os.path.basename(status['last_profile'] or '-')}")
+            with open(status["last_profile"], encoding="utf-8") as f:
+                header, top = f.readline().strip(), f.readline().rsplit(" ", 1)
+            frames = top[0].split(";")
+            print(f"{'':>10} {header[2:]}; чаще всего ({top[1].strip()}): ...;{';'.join(frames[-2:])}")
+        watchdog.stop()
+
+    asyncio.run(stalls())
+    print(f"профилей на диске: {len(os.listdir(tmp))} (хранится не больше {args.keep})")
+
+
+SINK = """
+import sys, time
+rate = float(sys.argv[1])
+stdin = sys.stdin.buffer
+while True:
+    chunk = stdin.read1(65536)
+    if not chunk:
+        break
+    if rate:
+        time.sleep(len(chunk) / rate)
+"""
+
+
+def bench_logging(args):
+    import asyncio
+    import io
+    import logging
+    import subprocess
+    import sys
+    from types import SimpleNamespace
+
+    import logs
+    import metrics
+
+    httpx = logging.getLogger("httpx")
+    search = logging.getLogger("bot")
+
+    async def handler(update, context):
+        # Как обычное обновление: строка httpx на вызов Bot API и иногда своя
+        httpx.info('HTTP Request: %s %s "%s %d %s"', "POST",
+                   "https://api.telegram.org/bot123:ABC/sendMessage", "HTTP/1.1", 200, "OK")
+        if update.update_id % 5 == 0:
+            search.info("Нечёткое совпадение %r -> %r (%.2f)", "глогол", "глагол", 0.91)
+        if update.update_id % 100 == 0:
+            search.warning("Event loop занят %.0f мс", 120.0)
+        logs.annotate(result="substring", topic="глагол")
+        await asyncio.sleep(0)
+
+    wrapped = metrics.timed("message", handler)
+    updates = [
+        SimpleNamespace(update_id=i, effective_chat=SimpleNamespace(id=1000 + i % 50),
+                        effective_user=SimpleNamespace(id=1000 + i % 50))
+        for i in range(args.count)
+    ]
+
+    async def drive():
+        # thread_time — процессор самого потока event loop, без ожидания GIL
+        latencies = []
+        start, cpu = time.perf_counter(), time.thread_time()
+        for update in updates:
+            begin = time.perf_counter()
+            await wrapped(update, None)
+            latencies.append((time.perf_counter() - begin) * 1e6)
+        return time.perf_counter() - start, time.thread_time() - cpu, latencies
+
+    def direct(stream):
+        # Как было: basicConfig, запись в stdout прямо из event loop
+        root = logging.getLogger()
+        for handler in list(root.handlers):
+            root.removeHandler(handler)
+        output = logging.StreamHandler(stream)
+        output.setFormatter(logging.Formatter(logs.TEXT_FORMAT))
+        root.addHandler(output)
+        root.setLevel(logging.INFO)
+
+    modes = [
+        ("без логов", None),
+        ("basicConfig", direct),
+        ("очередь, json", lambda stream: logs.setup(stream, "json", "")),
+        (f"очередь, {args.sample}", lambda stream: logs.setup(stream, "json", args.sample)),
+    ]
+    rate = f"{args.sink_rate / 1e6:g} МБ/с" if args.sink_rate else "без ограничения"
+    print(f"{args.count} обновлений, stdout читается со скоростью {rate}")
+    print(f"{'':>22} {'loop, с':>8} {'мкс/обн.':>9} {'CPU loop':>9} {'p99, мкс':>9} {'max, мс':>8} {'дописать, с':>12} "
+          f"{'записей':>8} {'потеряно':>9} {'из них WARNING+':>16}")
+    for name, configure in modes:
+        sink = subprocess.Popen([sys.executable, "-c", SINK, str(args.sink_rate)], stdin=subprocess.PIPE)
+        stream = io.TextIOWrapper(sink.stdin, encoding="utf-8", write_through=True)
+        counted = Counter()
+        logging.disable(logging.NOTSET)
+        if configure is None:
+            logging.disable(logging.CRITICAL)
+        else:
+            configure(stream)
+        logs.dropped.clear()
+        for handler in logging.getLogger().handlers:
+            handler.addFilter(lambda record: counted.update(["records"]) or True)
+        spent, cpu, latencies = asyncio.run(drive())
+        start = time.perf_counter()
+        logs.stop()
+        logging.disable(logging.CRITICAL)
+        stream.close()
+        sink.wait()
+        flush = time.perf_counter() - start
+        print(f"{name:>22} {spent:>8.2f} {spent / args.count * 1e6:>9.1f} {cpu / args.count * 1e6:>9.1f} {percentile(latencies, 99):>9.1f} "
+              f"{max(latencies) / 1e3:>8.1f} {flush:>12.2f} {counted['records']:>8} {sum(logs.dropped.values()):>9} "
+              f"{sum(n for level, n in logs.dropped.items() if logging.getLevelName(level) >= logging.WARNING):>16}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Бенчмарки бота")
+    sub = parser.add_subparsers(dest="name", required=True)
+
+    p = sub.add_parser("search", help="индекс тем против линейного прохода")
+    p.add_argument("--sizes", type=int, nargs="+", default=[100, 10_000, 100_000])
+    p.add_argument("--queries", type=int, default=500)
+    p.set_defaults(func=bench_search)
+
+    p = sub.add_parser("fuzzy", help="время поиска с опечатками")
+    p.add_argument("--sizes", type=int, nargs="+", default=[100, 10_000, 100_000])
+    p.add_argument("--queries", type=int, default=300)
+    p.set_defaults(func=bench_fuzzy)
+
+    p = sub.add_parser("render", help="CPU на сборку ответа до и после кэша")
+    p.add_argument("--repeat", type=int, default=2000)
+    p.set_defaults(func=bench_render)
+
+    p = sub.add_parser("webhook", help="поток записанных обновлений в /webhook")
+    p.add_argument("--updates", help="JSONL с записанными обновлениями")
+    p.add_argument("--count", type=int, default=5000)
+    p.add_argument("--threads", type=int, default=8)
+    p.add_argument("--url", help="адрес запущенного сервера вместо встроенного")
+    p.add_argument("--secret", default=None)
+    p.add_argument("--latency", type=float, default=0.0, help="задержка поддельного Bot API, с")
+    p.set_defaults(func=bench_webhook)
+
+    p = sub.add_parser("content", help="собранный rules.sqlite против словаря в памяти")
+    p.add_argument("--sizes", type=int, nargs="+", default=[100, 10_000, 100_000])
+    p.set_defaults(func=bench_content)
+
+    p = sub.add_parser("records", help="темы записями Rule против словарей RULES")
+    p.add_argument("--sizes", type=int, nargs="+", default=[0, 100_000], help="0 — настоящие RULES")
+    p.set_defaults(func=bench_records)
+
+    p = sub.add_parser("cache", help="кэш ответов на повторяющемся потоке запросов")
+    p.add_argument("--count", type=int, default=20_000)
+    p.add_argument("--distinct", type=int, default=2000, help="сколько разных запросов в словаре")
+    p.add_argument("--zipf", type=float, default=1.1)
+    p.add_argument("--size", type=int, default=4096)
+    p.set_defaults(func=bench_cache)
+
+    p = sub.add_parser("morph", help="нормализация словоформ и поиск по основам")
+    p.add_argument("--sizes", type=int, nargs="+", default=[100, 10_000, 100_000])
+    p.add_argument("--queries", type=int, default=2000)
+    p.set_defaults(func=bench_morph)
+
+    p = sub.add_parser("fulltext", help="BM25 по текстам правил и примерам")
+    p.add_argument("--sizes", type=int, nargs="+", default=[1000, 10_000, 100_000])
+    p.add_argument("--queries", type=int, default=200)
+    p.add_argument("--show", nargs="+", default=["подлежащее", "сказуемое", "вопросы кто что", "чередоваться"])
+    p.set_defaults(func=bench_fulltext)
+
+    p = sub.add_parser("pages", help="страницы /rules: сборка, перезагрузка и листание")
+    p.add_argument("--sizes", type=int, nargs="+", default=[100, 10_000, 100_000])
+    p.add_argument("--flips", type=int, default=2000)
+    p.set_defaults(func=bench_pages)
+
+    p = sub.add_parser("handlers", help="нагрузка на обработчики через настоящий Application")
+    p.add_argument("--sizes", type=int, nargs="+", default=[0, 10_000, 100_000],
+                   help="число синтетических тем, 0 — настоящий rules.py")
+    p.add_argument("--count", type=int, default=2000)
+    p.add_argument("--latency", type=float, default=0.0, help="задержка поддельного Bot API, с")
+    p.add_argument("--max-p99", type=float, help="завершиться с ошибкой, если p99 выше, мс")
+    p.add_argument("--rate-limit", action="store_true", help="включить лимитер отправки")
+    p.set_defaults(func=bench_handlers)
+
+    p = sub.add_parser("ratelimit", help="всплеск ответов против поддельного API с 429")
+    p.add_argument("--count", type=int, default=600)
+    p.add_argument("--chats", type=int, default=200)
+    p.add_argument("--rate", type=float, default=100, help="лимит в секунду (у Telegram ~30)")
+    p.set_defaults(func=bench_ratelimit)
+
+    p = sub.add_parser("reload", help="перезагрузка контента против сборки индексов с нуля")
+    p.add_argument("--sizes", type=int, nargs="+", default=[10_000, 100_000])
+    p.add_argument("--changes", type=int, nargs="+", default=[1, 10, 100, 1000])
+    p.set_defaults(func=bench_reload)
+
+    p = sub.add_parser("concurrency", help="параллельная обработка с порядком внутри чата")
+    p.add_argument("--chats", type=int, default=50)
+    p.add_argument("--per-chat", type=int, default=10)
+    p.add_argument("--latency", type=float, default=0.05, help="задержка поддельного Bot API, с")
+    p.add_argument("--jitter", type=float, default=0.05, help="случайная добавка к задержке, с")
+    p.add_argument("--limits", type=int, nargs="+", default=[8, 64, 256])
+    p.set_defaults(func=bench_concurrency)
+
+    p = sub.add_parser("sessions", help="поток обновлений с сохранением сессий и без")
+    p.add_argument("--count", type=int, default=20_000)
+    p.add_argument("--chats", type=int, default=2000)
+    p.add_argument("--interval", type=float, default=5, help="период записи пачки, с")
+    p.set_defaults(func=bench_sessions)
+
+    p = sub.add_parser("quiz", help="выбор следующего вопроса викторины: куча против перебора")
+    p.add_argument("--items", type=int, nargs="+", default=[42, 200, 1000])
+    p.add_argument("--users", type=int, default=2000)
+    p.add_argument("--answers", type=int, default=100_000)
+    p.set_defaults(func=bench_quiz)
+
+    p = sub.add_parser("broadcast", help="рассылка с ошибками API и передеплоем посередине")
+    p.add_argument("--subscribers", type=int, default=3000)
+    p.add_argument("--rate", type=float, default=200, help="лимит в секунду (у Telegram ~30)")
+    p.add_argument("--latency", type=float, default=0.02, help="задержка поддельного Bot API, с")
+    p.set_defaults(func=bench_broadcast)
+
+    p = sub.add_parser("shards", help="несколько процессов-воркеров с общим контентом")
+    p.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4])
+    p.add_argument("--topics", type=int, default=20_000)
+    p.add_argument("--count", type=int, default=5000)
+    p.add_argument("--chats", type=int, default=500)
+    p.add_argument("--latency", type=float, default=0.0, help="задержка поддельного Bot API, с")
+    p.set_defaults(func=bench_shards)
+
+    p = sub.add_parser("replay", help="запись обновлений через настоящий бот и поддельный Bot API по HTTP")
+    p.add_argument("--file", help="JSONL из RECORD_UPDATES; без него — синтетический поток")
+    p.add_argument("--count", type=int, default=2000)
+    p.add_argument("--rate", type=float, default=100, help="обновлений в секунду в синтетическом потоке")
+    p.add_argument("--speed", default="1", help="1, 10, ... или max")
+    p.add_argument("--latency", type=float, default=0.05, help="задержка Bot API, с")
+    p.add_argument("--jitter", type=float, default=0.0)
+    p.add_argument("--error-rate", type=float, default=0.0, help="доля ответов бота с ошибкой 500")
+    p.add_argument("--wait", type=float, default=30, help="сколько ждать ответов после последнего обновления")
+    p.add_argument("--no-limits", action="store_true", help="снять SEND_RATE и CHAT_RATE")
+    p.set_defaults(func=bench_replay)
+
+    p = sub.add_parser("loopwatch", help="сторож event loop: накладные расходы и профили зависаний")
+    p.add_argument("--spins", type=int, default=200_000)
+    p.add_argument("--interval", type=float, default=0.1)
+    p.add_argument("--threshold", type=float, default=0.5)
+    p.add_argument("--stall", type=float, default=1.5, help="на сколько секунд блокировать loop")
+    p.add_argument("--keep", type=int, default=2)
+    p.set_defaults(func=bench_loopwatch)
+
+    p = sub.add_parser("logging", help="время event loop на логи: basicConfig против очереди")
+    p.add_argument("--count", type=int, default=20_000)
+    p.add_argument("--sink-rate", type=float, default=2_000_000, help="байт/с, 0 — без ограничения")
+    p.add_argument("--sample", default="httpx=0.1")
+    p.set_defaults(func=bench_logging)
+
+    p = sub.add_parser("startup", help="время до первого ответа HTTP и -X importtime")
+    p.add_argument("--runs", type=int, default=3)
+    p.add_argument("--top", type=int, default=8)
+    p.set_defaults(func=bench_startup)
+
+    args = parser.parse_args()
+    args.func(args)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,588 @@
+import os
+import sys
+import time
+import shlex
+import atexit
+import datetime
+import asyncio
+import logging
+from threading import Event, Thread
+from telegram import Bot, Update, InlineKeyboardMarkup, ReplyKeyboardMarkup
+from telegram.error import BadRequest
+from telegram.request import HTTPXRequest
+from telegram.ext import (
+    Application,
+    CommandHandler,
+    MessageHandler,
+    InlineQueryHandler,
+    CallbackQueryHandler,
+    TypeHandler,
+    ContextTypes,
+    filters,
+)
+from content import open_store
+from snapshot import Snapshot, Reloader
+from pages import PAGE_PREFIX, SECTION_PREFIX, TOPIC_PREFIX, topic_data
+from render import (
+    FUZZY_HINT, NOT_FOUND, NO_HISTORY, QUIZ_EMPTY, QUIZ_DONE, TOPIC_GONE, HELP, ALL_TOPICS_BUTTON, HELP_BUTTON,
+    DAILY_HEADER, SUBSCRIBED, UNSUBSCRIBED, history_list,
+)
+from ratelimit import PriorityRateLimiter
+from concurrency import ChatOrderedProcessor
+from shard import Shards, poll, report_lag, serve
+from sessions import SESSION_DB, SessionPersistence, remember
+from record import Recorder
+import quiz
+from broadcast import Broadcaster
+from inline import CACHE_TIME, normalize_query
+import metrics
+import health
+import logs
+from loopwatch import LAG_INTERVAL, Watchdog
+
+# --- Бот: обработчики, Application и его запуск ---
+# Модуль тяжёлый (python-telegram-bot, индексы), поэтому main.py
+# импортирует его в фоне, когда порт уже открыт.
+logger = logging.getLogger(__name__)
+
+# --- Webhook: Telegram присылает обновления POST-запросом ---
+# Application работает в отдельном потоке со своим event loop, а Flask
+# только кладёт обновление в его update_queue. С SHARDS > 1 Flask отдаёт
+# обновление процессу-воркеру его чата.
+# Воркер gunicorn должен быть один: лимит отправки, порядок обновлений
+# чата, chat_data и викторина живут в процессе, и несколько воркеров
+# gunicorn делили бы их неправильно. Масштабируется бот через SHARDS —
+# они раскладывают чаты по процессам и делят SEND_RATE.
+tg_app = None
+tg_loop = None
+shards = None
+recorder = None
+
+metrics.REGISTRY.add(metrics.Gauge(
+    "bot_update_queue_depth", "Обновления, ждущие обработки",
+    lambda: tg_app.update_queue.qsize() if tg_app is not None else 0,
+))
+metrics.REGISTRY.add(metrics.Gauge(
+    "bot_send_queue_depth", "Сообщения, ждущие окна в лимите Telegram",
+    lambda: tg_app.bot.rate_limiter.pending if tg_app is not None and tg_app.bot.rate_limiter else 0,
+))
+metrics.REGISTRY.add(metrics.Gauge(
+    "bot_updates_in_flight", "Обновления, которые обрабатываются прямо сейчас",
+    lambda: tg_app.update_processor.current_concurrent_updates if tg_app is not None else 0,
+))
+metrics.REGISTRY.add(metrics.Gauge(
+    "bot_search_cache_entries", "Запросы в кэше ответов",
+    lambda: len(SNAPSHOT.results) if SNAPSHOT is not None else 0,
+))
+metrics.REGISTRY.add(metrics.ReadCounter(
+    "bot_log_records_dropped_total", "Записи лога, которым не хватило места в очереди",
+    lambda: {(level,): count for level, count in logs.dropped.items()}, ("level",),
+))
+
+def receive(data, body=None):
+    """Обновление из /webhook. False — принять некуда, Telegram повторит позже."""
+    if shards is not None:
+        accepted = shards.route(data, body)
+    elif tg_loop is None:
+        accepted = False
+    else:
+        update = Update.de_json(data, tg_app.bot)
+        tg_loop.call_soon_threadsafe(tg_app.update_queue.put_nowait, update)
+        accepted = True
+    # Непринятое Telegram пришлёт ещё раз: в записи оно было бы дважды
+    if accepted and recorder is not None:
+        recorder.write(data, body)
+    return accepted
+
+# --- Переменные окружения ---
+BOT_TOKEN = os.environ.get("BOT_TOKEN")
+# webhook — обновления приходят в /webhook; polling — старый режим с
+# getUpdates. В обоих — один воркер gunicorn, больше процессов даёт SHARDS
+BOT_MODE = os.environ.get("BOT_MODE", "webhook")
+WEBHOOK_URL = os.environ.get("WEBHOOK_URL")
+WEBHOOK_SECRET = os.environ.get("WEBHOOK_SECRET")
+# Лимиты отправки: всего в секунду и в один чат в секунду
+SEND_RATE = float(os.environ.get("SEND_RATE", 30))
+CHAT_RATE = float(os.environ.get("CHAT_RATE", 1))
+# Сколько обновлений обрабатывать одновременно (1 — по одному, как раньше)
+# и сколько обновлений одного чата держать в очереди, остальные отбрасываются
+CONCURRENT_UPDATES = int(os.environ.get("CONCURRENT_UPDATES", 64))
+CHAT_QUEUE_LIMIT = int(os.environ.get("CHAT_QUEUE_LIMIT", 100))
+# first — первая подходящая тема, как раньше; best — точное совпадение важнее
+SEARCH_MODE = os.environ.get("SEARCH_MODE", "first")
+# Во сколько (время сервера, ЧЧ:ММ) рассылать правило дня; пусто — не рассылать
+BROADCAST_AT = os.environ.get("BROADCAST_AT", "")
+# Как часто (в секундах) проверять rules.py и rules.sqlite; 0 — не проверять
+RELOAD_INTERVAL = float(os.environ.get("RELOAD_INTERVAL", 0))
+# Сколько процессов-воркеров обрабатывают обновления; 0 или 1 — всё в одном процессе
+SHARDS = int(os.environ.get("SHARDS", 0))
+# Адрес Bot API; для bench.py replay — поддельный сервер из fake_api.py
+BOT_API_URL = os.environ.get("BOT_API_URL", "https://api.telegram.org")
+# Файл, куда записывать входящие обновления (см. record.py); пусто — не записывать
+RECORD_UPDATES = os.environ.get("RECORD_UPDATES", "")
+
+# --- Темы и индексы ---
+# Сами тексты лежат в собранном rules.sqlite и читаются по одной теме;
+# в памяти только индексы для поиска. Всё это — один снимок: обработчик
+# берёт SNAPSHOT один раз и дальше работает с ним, даже если контент
+# в это время перезагрузился.
+SNAPSHOT = None
+
+def load_content(store):
+    publish(Snapshot.build(store))
+
+def publish(snapshot):
+    global SNAPSHOT
+    SNAPSHOT = snapshot
+
+load_content(open_store())
+health.mark("content")
+
+# --- Клавиатура ---
+def main_keyboard():
+    # По две кнопки разделов в ряд, последним рядом — «Все темы» и «Помощь»
+    buttons = SNAPSHOT.section_buttons
+    keyboard = [buttons[i:i + 2] for i in range(0, len(buttons), 2)]
+    keyboard.append([ALL_TOPICS_BUTTON, HELP_BUTTON])
+    return ReplyKeyboardMarkup(keyboard, resize_keyboard=True)
+
+# --- Кнопки тем ---
+# Те же готовые кнопки, что на страницах /rules (см. pages.py)
+# Сколько ещё подходящих тем предлагать кнопками под ответом
+MORE_TOPICS = 3
+
+def topic_keyboard(snap, tids):
+    return InlineKeyboardMarkup([[snap.pages.button(tid)] for tid in tids])
+
+# --- Команды ---
+async def cmd_start(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    await update.message.reply_text(
+        "👋 Привет! Я бот по русскому языку для 3 класса.\n\n"
+        "Выбирай раздел на клавиатуре или напиши название темы.\n"
+        "Команды:\n"
+        "/rules — список всех тем\n"
+        "/last — последняя открытая тема\n"
+        "/history — недавние темы\n"
+        "/quiz — викторина по правилам\n"
+        "/subscribe — правило дня каждый день\n"
+        "/help — подсказка.",
+        reply_markup=main_keyboard()
+    )
+
+async def cmd_help(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    await update.message.reply_text(HELP)
+
+async def cmd_rules(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    text, markup = SNAPSHOT.pages.page(0)
+    await update.message.reply_text(text, parse_mode="HTML", reply_markup=markup)
+
+async def cmd_last(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    snap = SNAPSHOT
+    key = context.chat_data.get("last")
+    if key is None or key not in snap.numbering.tids:
+        await update.message.reply_text(NO_HISTORY)
+        return
+    await update.message.reply_text(snap.store.card(key), parse_mode="HTML")
+
+async def cmd_history(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    snap = SNAPSHOT
+    # Темы, удалённые после перезагрузки контента, пропускаем
+    keys = [k for k in context.chat_data.get("history", ()) if k in snap.numbering.tids]
+    if not keys:
+        await update.message.reply_text(NO_HISTORY)
+        return
+    titles = [snap.store.rule(k).title for k in keys]
+    await update.message.reply_text(history_list(titles), parse_mode="HTML")
+
+async def send_question(message, context):
+    bank = SNAPSHOT.quiz
+    qid = quiz.next_question(quiz.state(context.chat_data), bank, time.time())
+    if qid is None:
+        await message.reply_text(QUIZ_EMPTY)
+        return
+    text, keyboard = bank.card(qid)
+    await message.reply_text(text, parse_mode="HTML", reply_markup=keyboard)
+
+async def cmd_quiz(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    await send_question(update.message, context)
+
+async def handle_quiz_answer(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    callback = update.callback_query
+    _, qid, choice = callback.data.split(":")
+    bank = SNAPSHOT.quiz
+    state = quiz.state(context.chat_data)
+    # Старые сообщения с кнопками остаются в чате: отвечать можно только на текущий вопрос
+    if state["asked"] != qid or qid not in bank:
+        await callback.answer(QUIZ_DONE)
+        return
+    correct, result = bank.check(qid, int(choice))
+    quiz.grade(state, qid, correct, time.time())
+    await callback.answer()
+    await callback.edit_message_text(result, parse_mode="HTML")
+    await send_question(callback.message, context)
+
+async def handle_page(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    callback = update.callback_query
+    await show_page(callback, SNAPSHOT.pages.page(int(callback.data.split(":")[1])))
+
+async def handle_section_page(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    callback = update.callback_query
+    _, section, page = callback.data.split(":")
+    snap = SNAPSHOT
+    # Раздел могли убрать из SECTIONS после перезагрузки: тогда — все темы
+    await show_page(callback, snap.sections.page(int(section), int(page)) or snap.pages.page(0))
+
+async def show_page(callback, page):
+    text, markup = page
+    await callback.answer()
+    try:
+        await callback.edit_message_text(text, parse_mode="HTML", reply_markup=markup)
+    except BadRequest as exc:
+        # Кнопка старого сообщения после перезагрузки тем может вести на
+        # ту же страницу, что уже показана
+        if "not modified" not in str(exc):
+            raise
+
+async def handle_topic_button(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    callback = update.callback_query
+    snap = SNAPSHOT
+    tid = int(callback.data.split(":")[1])
+    keys = snap.numbering.keys
+    key = keys[tid] if tid < len(keys) else None
+    if key is None or topic_data(tid, key) != callback.data:
+        await callback.answer(TOPIC_GONE)
+        return
+    logs.annotate(topic=key)
+    remember(context.chat_data, key)
+    await callback.answer()
+    await callback.message.reply_text(snap.store.card(key), parse_mode="HTML")
+
+async def cmd_subscribe(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    await context.bot_data["broadcaster"].subscribe(update.effective_chat.id)
+    await update.message.reply_text(SUBSCRIBED)
+
+async def cmd_unsubscribe(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    await context.bot_data["broadcaster"].unsubscribe(update.effective_chat.id)
+    await update.message.reply_text(UNSUBSCRIBED)
+
+def find_reply(snap, query):
+    """(способ, ключ темы или None, готовый ответ, кнопки или None) для текстового запроса."""
+    key = snap.index.lookup(query, SEARCH_MODE)
+    if key is not None:
+        return "substring", key, snap.store.card(key), None
+    # «глаголы», «о существительных» — ищем по основам слов
+    key = snap.lemmas.lookup(query)
+    if key is not None:
+        return "morph", key, snap.store.card(key), None
+    # «подлежащее», «ться» — в текстах правил и примерах; лучшая тема
+    # отвечает, следующие предлагаются кнопками
+    found = snap.fulltext.matches(query, 1 + MORE_TOPICS)
+    if found:
+        key = snap.numbering.keys[found[0]]
+        markup = topic_keyboard(snap, found[1:]) if len(found) > 1 else None
+        return "fulltext", key, snap.store.card(key), markup
+    # Совпадений нет — пробуем найти тему с опечаткой
+    found = snap.fuzzy.match(query)
+    if found is not None:
+        key, score = found
+        logger.info("Нечёткое совпадение %r -> %r (%.2f)", query, key, score)
+        return "fuzzy", key, FUZZY_HINT + snap.store.card(key), None
+    return "miss", None, NOT_FOUND, None
+
+async def handle_message(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    snap = SNAPSHOT
+    payload = snap.buttons.get(update.message.text)
+    if payload is not None:
+        metrics.MESSAGES.inc("button")
+        text, markup = payload
+        await update.message.reply_text(text, parse_mode="HTML", reply_markup=markup)
+        return
+
+    query = normalize_query(update.message.text)
+    # Повторные запросы, в том числе промахи, поиск не проходят
+    found = snap.results.get(query)
+    if found is None:
+        found = find_reply(snap, query)
+        snap.results.put(query, found)
+    result, key, reply, markup = found
+    metrics.MESSAGES.inc(result)
+    logs.annotate(result=result, topic=key)
+    if key is None:
+        await update.message.reply_text(reply)
+        return
+    remember(context.chat_data, key)
+    await update.message.reply_text(reply, parse_mode="HTML", reply_markup=markup)
+
+async def handle_inline(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    await update.inline_query.answer(SNAPSHOT.inline.results(update.inline_query.query), cache_time=CACHE_TIME)
+
+# --- Правило дня ---
+def rule_of_the_day(day):
+    # Темы по кругу в порядке RULES; текст собирается один раз на всю рассылку
+    snap = SNAPSHOT
+    order = snap.numbering.order
+    key = snap.numbering.keys[order[day.toordinal() % len(order)]]
+    return key, DAILY_HEADER + snap.store.card(key)
+
+async def on_start(application):
+    # Следит за тем event loop, в котором работает Application
+    if LAG_INTERVAL > 0:
+        application.bot_data["watchdog"] = Watchdog(report=report_lag).start()
+    broadcaster = application.bot_data["broadcaster"] = Broadcaster(application.bot)
+    if BROADCAST_AT:
+        broadcaster.start(datetime.time.fromisoformat(BROADCAST_AT), rule_of_the_day)
+        logger.info("📅 Правило дня: каждый день в %s, подписчиков %d",
+                    BROADCAST_AT, await broadcaster.subscribers())
+    health.ready()
+
+async def on_stop(application):
+    broadcaster = application.bot_data.pop("broadcaster", None)
+    if broadcaster is not None:
+        await broadcaster.stop()
+    watchdog = application.bot_data.pop("watchdog", None)
+    if watchdog is not None:
+        watchdog.stop()
+
+# --- Основной запуск ---
+def build_application(token=None, request=None, rate_limit=True, concurrency=None, sessions=True):
+    # Все вызовы Bot API идут через MeteredRequest ради метрик
+    builder = (
+        Application.builder()
+        .token(token or BOT_TOKEN)
+        .request(metrics.MeteredRequest(request or HTTPXRequest(connection_pool_size=256)))
+        .get_updates_request(metrics.MeteredRequest(request or HTTPXRequest()))
+        .concurrent_updates(ChatOrderedProcessor(concurrency or CONCURRENT_UPDATES, CHAT_QUEUE_LIMIT))
+        .post_init(on_start)
+        .post_stop(on_stop)
+        .base_url(f"{BOT_API_URL}/bot")
+    )
+    if rate_limit:
+        builder = builder.rate_limiter(PriorityRateLimiter(SEND_RATE, CHAT_RATE))
+    # sessions: True — файл SESSION_DB, False — без сохранения, или готовое хранилище
+    if sessions is True:
+        sessions = SessionPersistence() if SESSION_DB else None
+    if sessions:
+        builder = builder.persistence(sessions)
+    application = builder.build()
+
+    application.add_handler(CommandHandler("start", metrics.timed("start", cmd_start)))
+    application.add_handler(CommandHandler("help", metrics.timed("help", cmd_help)))
+    application.add_handler(CommandHandler("rules", metrics.timed("rules", cmd_rules)))
+    application.add_handler(CommandHandler("last", metrics.timed("last", cmd_last)))
+    application.add_handler(CommandHandler("history", metrics.timed("history", cmd_history)))
+    application.add_handler(CommandHandler("quiz", metrics.timed("quiz", cmd_quiz)))
+    application.add_handler(CommandHandler("subscribe", metrics.timed("subscribe", cmd_subscribe)))
+    application.add_handler(CommandHandler("unsubscribe", metrics.timed("unsubscribe", cmd_unsubscribe)))
+    application.add_handler(CallbackQueryHandler(
+        metrics.timed("quiz_answer", handle_quiz_answer), pattern=rf"^{quiz.PREFIX}:"
+    ))
+    application.add_handler(CallbackQueryHandler(
+        metrics.timed("topic_button", handle_topic_button), pattern=rf"^{TOPIC_PREFIX}:"
+    ))
+    application.add_handler(CallbackQueryHandler(
+        metrics.timed("rules_page", handle_page), pattern=rf"^{PAGE_PREFIX}:"
+    ))
+    application.add_handler(CallbackQueryHandler(
+        metrics.timed("section_page", handle_section_page), pattern=rf"^{SECTION_PREFIX}:"
+    ))
+    application.add_handler(MessageHandler(
+        filters.TEXT & ~filters.COMMAND, metrics.timed("message", handle_message)
+    ))
+    application.add_handler(InlineQueryHandler(metrics.timed("inline", handle_inline)))
+    return application
+
+async def _register_webhook(bot):
+    # Все воркеры регистрируют один и тот же адрес, поэтому сначала
+    # проверяем, не сделано ли это уже
+    info = await bot.get_webhook_info()
+    if info.url != WEBHOOK_URL:
+        await bot.set_webhook(WEBHOOK_URL, secret_token=WEBHOOK_SECRET)
+        logger.info("🔗 Webhook установлен: %s", WEBHOOK_URL)
+
+async def _start_webhook(application, register=True):
+    global tg_app, tg_loop
+    await application.initialize()
+    if WEBHOOK_URL and register:
+        await _register_webhook(application.bot)
+    await application.start()
+    # /webhook принимает обновления с этого момента: post_init отмечает готовность
+    tg_app, tg_loop = application, asyncio.get_running_loop()
+    # post_init и post_stop сами вызываются только в run_polling
+    await application.post_init(application)
+
+async def _stop_webhook(application):
+    await application.post_stop(application)
+    await application.stop()
+    await application.shutdown()
+
+def start_webhook(application):
+    loop = asyncio.new_event_loop()
+    started = Event()
+    errors = []
+
+    def run():
+        asyncio.set_event_loop(loop)
+        try:
+            loop.run_until_complete(_start_webhook(application))
+        except Exception as exc:
+            errors.append(exc)
+            return
+        finally:
+            started.set()
+        loop.run_forever()
+
+    Thread(target=run, daemon=True, name="telegram").start()
+    started.wait()
+    if errors:
+        raise errors[0]
+    atexit.register(stop_webhook)
+
+def stop_webhook():
+    global tg_app, tg_loop
+    if tg_loop is None:
+        return
+    application, loop = tg_app, tg_loop
+    tg_app = tg_loop = None
+    asyncio.run_coroutine_threadsafe(_stop_webhook(application), loop).result(timeout=10)
+    loop.call_soon_threadsafe(loop.stop)
+
+# --- Воркеры (SHARDS > 1) ---
+async def _start_shard(application):
+    # Адрес webhook регистрирует главный процесс
+    await _start_webhook(application, register=False)
+
+async def _register(bot):
+    async with bot:
+        await _register_webhook(bot)
+
+def run_shard(index, conn):
+    global SEND_RATE
+    # Лимит Telegram общий на бота и делится между воркерами; лимит на чат
+    # остаётся прежним — чат живёт в одном воркере
+    SEND_RATE /= SHARDS
+    SNAPSHOT.store.reopen()
+    sessions = SessionPersistence(shard=(index, SHARDS)) if SESSION_DB else False
+    application = build_application(sessions=sessions)
+    if RELOAD_INTERVAL > 0:
+        # Новый снимок воркер собирает у себя, общим остаётся только файл
+        Reloader(lambda: SNAPSHOT, publish, RELOAD_INTERVAL).start()
+    logger.info("✅ Воркер %d запущен (pid %s)", index, os.getpid())
+    serve(conn, application, _start_shard, _stop_webhook)
+
+def make_bot():
+    return Bot(BOT_TOKEN, base_url=f"{BOT_API_URL}/bot")
+
+def recorded(route):
+    """route, который записывает принятое обновление, если запись включена."""
+    if recorder is None:
+        return route
+
+    def route_and_write(data, body=None):
+        accepted = route(data, body)
+        if accepted:
+            recorder.write(data, body)
+        return accepted
+    return route_and_write
+
+async def record_update(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    recorder.write(update.to_dict())
+
+def start_shards():
+    global shards
+    # Воркеры запускаются первыми: кроме этого потока, в процессе пока
+    # только Flask, который ждёт запросов
+    shards = Shards(SHARDS, run_shard)
+    atexit.register(shards.stop)
+    if BOT_MODE == "polling":
+        Thread(target=lambda: asyncio.run(poll(make_bot(), recorded(shards.route))), daemon=True,
+               name="polling").start()
+    elif WEBHOOK_URL:
+        asyncio.run(_register(make_bot()))
+    logger.info("✅ Бот запущен (%s, воркеров %d, pid %s)...", BOT_MODE, SHARDS, os.getpid())
+    health.ready()
+
+def run_polling(application):
+    global tg_app
+    tg_app = application
+    # run_polling работает не в главном потоке: сигналы достаются Flask
+    # и gunicorn, а остановка приходит через atexit
+    loop = asyncio.new_event_loop()
+    asyncio.set_event_loop(loop)
+    stopped = Event()
+
+    def stop():
+        if not loop.is_closed():
+            loop.call_soon_threadsafe(application.stop_running)
+            stopped.wait(10)
+
+    atexit.register(stop)
+    try:
+        application.run_polling(drop_pending_updates=True, stop_signals=None)
+    finally:
+        stopped.set()
+
+def gunicorn_workers(argv=None, environ=None):
+    """Число воркеров gunicorn, как его считает gunicorn: --workers/-w из
+    командной строки и GUNICORN_CMD_ARGS, иначе WEB_CONCURRENCY. Без gunicorn — 1."""
+    argv = sys.argv if argv is None else argv
+    environ = os.environ if environ is None else environ
+    if not argv or "gunicorn" not in os.path.basename(argv[0]):
+        return 1
+    workers = environ.get("WEB_CONCURRENCY") or 1
+    args = shlex.split(environ.get("GUNICORN_CMD_ARGS", "")) + list(argv[1:])
+    for i, arg in enumerate(args):
+        if arg in ("-w", "--workers") and i + 1 < len(args):
+            workers = args[i + 1]
+        elif arg.startswith("--workers="):
+            workers = arg.partition("=")[2]
+        elif arg.startswith("-w") and arg[2:].isdigit():
+            workers = arg[2:]
+    try:
+        return int(workers)
+    except ValueError:
+        return 1
+
+def main():
+    """Запуск бота; вызывается из main.py в фоновом потоке."""
+    global recorder
+    if not BOT_TOKEN:
+        logger.error("❌ BOT_TOKEN не найден!")
+        health.fail("BOT_TOKEN не найден")
+        return
+    if BOT_MODE == "webhook" and not WEBHOOK_URL:
+        # Без адреса Telegram не знает, куда слать обновления, и бот молча
+        # ничего не получает
+        logger.error("❌ BOT_MODE=webhook, но WEBHOOK_URL не задан (или BOT_MODE=polling)")
+        health.fail("WEBHOOK_URL не задан для BOT_MODE=webhook")
+        return
+    workers = gunicorn_workers()
+    if workers > 1:
+        # Каждый воркер поднял бы своё Application, см. комментарий у tg_app
+        logger.error("❌ Воркеров gunicorn %d, а нужен один: больше процессов даёт SHARDS", workers)
+        health.fail(f"воркеров gunicorn {workers}, нужен один (используй SHARDS)")
+        return
+
+    if RECORD_UPDATES:
+        recorder = Recorder(RECORD_UPDATES)
+        atexit.register(recorder.close)
+        logger.info("📼 Входящие обновления записываются в %s", RECORD_UPDATES)
+
+    if SHARDS > 1:
+        start_shards()
+        return
+
+    application = build_application()
+    if RELOAD_INTERVAL > 0:
+        Reloader(lambda: SNAPSHOT, publish, RELOAD_INTERVAL).start()
+        logger.info("🔄 Перезагрузка контента: проверка раз в %g с", RELOAD_INTERVAL)
+
+    if BOT_MODE == "polling":
+        # getUpdates делает сам Application: записываем раньше всех обработчиков
+        if recorder is not None:
+            application.add_handler(TypeHandler(Update, record_update), group=-1)
+        logger.info("✅ Бот запущен (polling)...")
+        run_polling(application)
+        return
+
+    start_webhook(application)
+    logger.info("✅ Бот запущен (webhook, pid %s)...", os.getpid())
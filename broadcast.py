@@ -0,0 +1,250 @@
+import asyncio
+import datetime
+import logging
+import os
+import socket
+import sqlite3
+import threading
+import time
+
+from telegram.error import BadRequest, ChatMigrated, Forbidden, NetworkError, RetryAfter
+
+import metrics
+from ratelimit import PRIORITY_BULK
+
+# --- Рассылка «правило дня» ---
+# Подписчики лежат в SQLite. Рассылка на день создаётся один раз: текст
+# собирается сразу и хранится вместе с ней, а для каждого подписчика
+# заводится строка со статусом (pending, sent, blocked, failed).
+# Отправляют WORKERS задач одновременно, а скорость держит общий лимитер
+# бота с приоритетом PRIORITY_BULK, так что ответы ученикам идут первыми.
+# Статусы пишутся пачками раз в CHECKPOINT_SECONDS. После падения или
+# передеплоя рассылка продолжается с pending; повторно может уйти только
+# то, что было отправлено после последней записи статусов.
+logger = logging.getLogger(__name__)
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+BROADCAST_DB = os.environ.get("BROADCAST_DB", os.path.join(HERE, "broadcast.sqlite"))
+WORKERS = 64
+CHECKPOINT_SECONDS = 1.0
+MAX_ATTEMPTS = 3
+# Рассылку, владелец которой молчит дольше LEASE секунд, забирает другой процесс
+LEASE = 60
+CHECK_INTERVAL = 30
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS subscribers (chat_id INTEGER PRIMARY KEY, since REAL NOT NULL);
+CREATE TABLE IF NOT EXISTS broadcasts (
+    id INTEGER PRIMARY KEY,
+    day TEXT NOT NULL UNIQUE,
+    key TEXT NOT NULL,
+    text TEXT NOT NULL,
+    created REAL NOT NULL,
+    finished REAL,
+    owner TEXT,
+    heartbeat REAL
+);
+CREATE TABLE IF NOT EXISTS deliveries (
+    broadcast_id INTEGER NOT NULL,
+    chat_id INTEGER NOT NULL,
+    status TEXT NOT NULL,
+    error TEXT,
+    updated REAL,
+    PRIMARY KEY (broadcast_id, chat_id)
+);
+CREATE INDEX IF NOT EXISTS deliveries_status ON deliveries (broadcast_id, status);
+"""
+
+DELIVERIES = metrics.REGISTRY.add(metrics.Counter(
+    "bot_broadcast_messages_total", "Сообщения рассылки по итоговому статусу", ("status",)))
+
+
+class Broadcaster:
+    def __init__(self, bot, path=BROADCAST_DB, workers=WORKERS, checkpoint=CHECKPOINT_SECONDS):
+        self.bot = bot
+        self.workers = workers
+        self.checkpoint = checkpoint
+        self.owner = f"{socket.gethostname()}:{os.getpid()}"
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.executescript(SCHEMA)
+        # Соединение одно, а запросы идут из разных потоков asyncio.to_thread
+        self._lock = threading.Lock()
+        self._results = []
+        self._scheduler = None
+
+    def _execute(self, sql, params=()):
+        with self._lock, self._db:
+            return self._db.execute(sql, params).fetchall()
+
+    async def _query(self, sql, params=()):
+        return await asyncio.to_thread(self._execute, sql, params)
+
+    # --- Подписчики ---
+    async def subscribe(self, chat_id):
+        await self._query("INSERT OR IGNORE INTO subscribers VALUES (?, ?)", (chat_id, time.time()))
+
+    async def unsubscribe(self, chat_id):
+        await self._query("DELETE FROM subscribers WHERE chat_id = ?", (chat_id,))
+
+    async def subscribers(self):
+        return (await self._query("SELECT count(*) FROM subscribers"))[0][0]
+
+    # --- Рассылки ---
+    def _create(self, day, key, text):
+        with self._lock, self._db:
+            cursor = self._db.execute(
+                "INSERT OR IGNORE INTO broadcasts (day, key, text, created) VALUES (?, ?, ?, ?)",
+                (day, key, text, time.time()),
+            )
+            if cursor.rowcount:
+                # Список получателей фиксируется в момент создания
+                self._db.execute(
+                    "INSERT INTO deliveries (broadcast_id, chat_id, status)"
+                    " SELECT ?, chat_id, 'pending' FROM subscribers",
+                    (cursor.lastrowid,),
+                )
+            return self._db.execute("SELECT id FROM broadcasts WHERE day = ?", (day,)).fetchone()[0]
+
+    async def create(self, day, key, text):
+        """id рассылки на день day; если её ещё нет — создаёт с текстом text."""
+        return await asyncio.to_thread(self._create, day, key, text)
+
+    def _acquire(self, broadcast_id):
+        now = time.time()
+        with self._lock, self._db:
+            cursor = self._db.execute(
+                "UPDATE broadcasts SET owner = ?, heartbeat = ? WHERE id = ? AND finished IS NULL"
+                " AND (owner IS NULL OR owner = ? OR heartbeat < ?)",
+                (self.owner, now, broadcast_id, self.owner, now - LEASE),
+            )
+            return cursor.rowcount == 1
+
+    def _flush(self, broadcast_id):
+        results, self._results = self._results, []
+        with self._lock, self._db:
+            self._db.executemany(
+                "UPDATE deliveries SET status = ?, error = ?, updated = ?"
+                " WHERE broadcast_id = ? AND chat_id = ?",
+                results,
+            )
+            # Отписка тех, кто заблокировал бота или удалил чат
+            self._db.executemany(
+                "DELETE FROM subscribers WHERE chat_id = ?",
+                [(chat_id,) for status, _, _, _, chat_id in results if status == "blocked"],
+            )
+            self._db.execute("UPDATE broadcasts SET heartbeat = ? WHERE id = ?", (time.time(), broadcast_id))
+
+    def _release(self, broadcast_id):
+        # Завершена ли рассылка, видно только по базе: получатели, которых
+        # воркеры уже взяли из очереди, но не успели отправить до остановки,
+        # остаются pending
+        with self._lock, self._db:
+            left = self._db.execute(
+                "SELECT count(*) FROM deliveries WHERE broadcast_id = ? AND status = 'pending'",
+                (broadcast_id,),
+            ).fetchone()[0]
+            self._db.execute(
+                "UPDATE broadcasts SET owner = NULL, finished = ? WHERE id = ?",
+                (None if left else time.time(), broadcast_id),
+            )
+        return left
+
+    async def _checkpoints(self, broadcast_id):
+        # Аренда продлевается на каждом шаге, даже если записать нечего:
+        # долгий RetryAfter не должен отдать рассылку другому процессу
+        while True:
+            await asyncio.sleep(self.checkpoint)
+            await asyncio.to_thread(self._flush, broadcast_id)
+
+    async def _send(self, broadcast_id, text, chat_id):
+        status, error = "failed", None
+        for attempt in range(1, MAX_ATTEMPTS + 1):
+            try:
+                await self.bot.send_message(chat_id, text, parse_mode="HTML", rate_limit_args=PRIORITY_BULK)
+            except Forbidden as exc:
+                status, error = "blocked", str(exc)
+            except BadRequest as exc:
+                # «chat not found» и подобное: повтор не поможет
+                status = "blocked" if "chat not found" in str(exc).lower() else "failed"
+                error = str(exc)
+            except ChatMigrated as exc:
+                error = f"чат переехал в {exc.new_chat_id}"
+            except (RetryAfter, NetworkError) as exc:
+                # Лимитер уже выждал retry_after; сетевые ошибки повторяем с паузой
+                error = str(exc)
+                if attempt < MAX_ATTEMPTS:
+                    await asyncio.sleep(attempt)
+                    continue
+            else:
+                status = "sent"
+            break
+        self._results.append((status, error, time.time(), broadcast_id, chat_id))
+        DELIVERIES.inc(status)
+
+    async def run(self, broadcast_id):
+        """Отправляет рассылку всем, кому она ещё не ушла. Возвращает, скольким
+        получателям отправляли в этот раз, или None, если рассылку ведёт другой процесс."""
+        if not await asyncio.to_thread(self._acquire, broadcast_id):
+            return None
+        text = (await self._query("SELECT text FROM broadcasts WHERE id = ?", (broadcast_id,)))[0][0]
+        pending = await self._query(
+            "SELECT chat_id FROM deliveries WHERE broadcast_id = ? AND status = 'pending'", (broadcast_id,)
+        )
+        queue = asyncio.Queue()
+        for chat_id, in pending:
+            queue.put_nowait(chat_id)
+        logger.info("Рассылка %s: осталось %d получателей", broadcast_id, len(pending))
+
+        async def worker():
+            while not queue.empty():
+                await self._send(broadcast_id, text, queue.get_nowait())
+
+        start = time.perf_counter()
+        checkpoints = asyncio.create_task(self._checkpoints(broadcast_id))
+        try:
+            await asyncio.gather(*(worker() for _ in range(min(self.workers, len(pending)))))
+        finally:
+            checkpoints.cancel()
+            # Сюда попадаем и при остановке бота: отправленное не уйдёт второй раз
+            await asyncio.to_thread(self._flush, broadcast_id)
+            await asyncio.to_thread(self._release, broadcast_id)
+        logger.info("Рассылка %s завершена за %.1f с", broadcast_id, time.perf_counter() - start)
+        return len(pending)
+
+    async def unfinished(self):
+        return [row[0] for row in await self._query("SELECT id FROM broadcasts WHERE finished IS NULL ORDER BY id")]
+
+    async def report(self, broadcast_id):
+        """Статус -> число получателей."""
+        return dict(await self._query(
+            "SELECT status, count(*) FROM deliveries WHERE broadcast_id = ? GROUP BY status", (broadcast_id,)
+        ))
+
+    # --- Расписание ---
+    async def _schedule(self, at, pick):
+        created = None
+        while True:
+            now = datetime.datetime.now()
+            if now.time() >= at and now.date() != created:
+                created = now.date()
+                key, text = pick(created)
+                await self.create(created.isoformat(), key, text)
+            # Заодно продолжаются рассылки, прерванные падением или передеплоем
+            for broadcast_id in await self.unfinished():
+                await self.run(broadcast_id)
+            await asyncio.sleep(CHECK_INTERVAL)
+
+    def start(self, at, pick):
+        """Каждый день после at (время сервера) рассылает pick(дата) -> (ключ, текст)."""
+        self._scheduler = asyncio.create_task(self._schedule(at, pick))
+
+    async def stop(self):
+        if self._scheduler is not None:
+            self._scheduler.cancel()
+            try:
+                await self._scheduler
+            except asyncio.CancelledError:
+                pass
+            self._scheduler = None
+        self._db.close()
@@ -0,0 +1,51 @@
+import time
+from collections import OrderedDict
+
+import metrics
+
+# --- Кэш ответов на текстовые запросы ---
+# Класс пишет одно и то же: тридцать «глагол» за минуту. Готовый ответ
+# (и промах — он самый дорогой, доходит до нечёткого поиска) хранится по
+# нормализованному запросу не дольше TTL секунд, самые давние вытесняются.
+# Хранить можно и промахи, и находки нечёткого поиска: его работа на запрос
+# ограничена числом шагов, а не временем (см. fuzzy.py), поэтому под
+# нагрузкой он отвечает так же, как на свободной машине.
+# Кэш принадлежит снимку контента, поэтому после перезагрузки тем он
+# начинается с нуля сам.
+SIZE = 4096
+TTL = 600
+
+LOOKUPS = metrics.REGISTRY.add(metrics.Counter(
+    "bot_search_cache_total", "Обращения к кэшу ответов", ("result",)))
+EVICTIONS = metrics.REGISTRY.add(metrics.Counter(
+    "bot_search_cache_evictions_total", "Записи, вытесненные из кэша ответов", ("reason",)))
+
+
+class ResultCache:
+    def __init__(self, size=SIZE, ttl=TTL):
+        self.size = size
+        self.ttl = ttl
+        self._entries = OrderedDict()  # запрос -> (когда устареет, ответ)
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, query):
+        """Ответ на query или None, если его нет или он устарел."""
+        entry = self._entries.get(query)
+        if entry is not None:
+            if entry[0] > time.monotonic():
+                self._entries.move_to_end(query)
+                LOOKUPS.inc("hit")
+                return entry[1]
+            del self._entries[query]
+            EVICTIONS.inc("ttl")
+        LOOKUPS.inc("miss")
+        return None
+
+    def put(self, query, value):
+        self._entries[query] = (time.monotonic() + self.ttl, value)
+        self._entries.move_to_end(query)
+        if len(self._entries) > self.size:
+            self._entries.popitem(last=False)
+            EVICTIONS.inc("size")
@@ -0,0 +1,238 @@
+from itertools import chain
+
+# --- Общие части соседних снимков ---
+# Индексы нового снимка собираются из старых (см. snapshot.py), а старые
+# при этом не меняются: на них доживают начатые ответы. Копировать словари
+# и списки индекса целиком значило бы платить за перезагрузку по числу тем.
+# Поэтому здесь они разбиты на корзины: копия делит все корзины со
+# старой версией, а запись копирует только ту корзину, в которую пишет, —
+# один раз на копию. Перезагрузка стоит столько корзин, сколько задели
+# изменённые темы.
+BUCKETS = 4096  # корзин в ChunkMap
+CHUNK = 1024  # элементов в куске Chunks
+BLOCK = 512  # номеров тем в блоке TidSet и TidMap
+_MASK = BUCKETS - 1
+_LOW = CHUNK - 1
+_SHIFT = CHUNK.bit_length() - 1
+_BLOCK_SHIFT = BLOCK.bit_length() - 1
+
+
+class ChunkMap:
+    """Словарь, разбитый на BUCKETS корзин по хэшу ключа."""
+
+    __slots__ = ("_buckets", "_own", "_len")
+
+    def __init__(self, items=()):
+        self._buckets = [None] * BUCKETS
+        self._own = set()  # корзины, которые принадлежат только этой копии
+        self._len = 0
+        for key, value in items:
+            self[key] = value
+
+    def copy(self):
+        new = ChunkMap.__new__(ChunkMap)
+        new._buckets = list(self._buckets)
+        new._own = set()
+        new._len = self._len
+        # Корзины теперь общие: на месте не пишет ни одна из копий
+        self._own = set()
+        return new
+
+    def _write(self, key):
+        slot = hash(key) & _MASK
+        bucket = self._buckets[slot]
+        if slot not in self._own:
+            bucket = self._buckets[slot] = dict(bucket) if bucket else {}
+            self._own.add(slot)
+        return bucket
+
+    def __len__(self):
+        return self._len
+
+    def __contains__(self, key):
+        bucket = self._buckets[hash(key) & _MASK]
+        return bucket is not None and key in bucket
+
+    def __iter__(self):
+        return chain.from_iterable(bucket for bucket in self._buckets if bucket)
+
+    def get(self, key, default=None):
+        bucket = self._buckets[hash(key) & _MASK]
+        return default if bucket is None else bucket.get(key, default)
+
+    def __getitem__(self, key):
+        bucket = self._buckets[hash(key) & _MASK]
+        if bucket is None:
+            raise KeyError(key)
+        return bucket[key]
+
+    def __setitem__(self, key, value):
+        bucket = self._write(key)
+        self._len += key not in bucket
+        bucket[key] = value
+
+    def __delitem__(self, key):
+        del self._write(key)[key]
+        self._len -= 1
+
+
+class Chunks:
+    """Список, разбитый на куски по CHUNK элементов. Chunks(other) — копия other."""
+
+    __slots__ = ("_chunks", "_own", "_len")
+
+    def __init__(self, items=()):
+        if isinstance(items, Chunks):
+            self._chunks = list(items._chunks)
+            self._own = set()
+            self._len = items._len
+            items._own = set()
+            return
+        items = list(items)
+        self._chunks = [items[i:i + CHUNK] for i in range(0, len(items), CHUNK)]
+        self._own = set(range(len(self._chunks)))
+        self._len = len(items)
+
+    def copy(self):
+        return Chunks(self)
+
+    def _write(self, chunk):
+        if chunk not in self._own:
+            self._chunks[chunk] = list(self._chunks[chunk])
+            self._own.add(chunk)
+        return self._chunks[chunk]
+
+    def __len__(self):
+        return self._len
+
+    def __iter__(self):
+        return chain.from_iterable(self._chunks)
+
+    def __getitem__(self, i):
+        return self._chunks[i >> _SHIFT][i & _LOW]
+
+    def __setitem__(self, i, value):
+        self._write(i >> _SHIFT)[i & _LOW] = value
+
+    def append(self, value):
+        if not self._len & _LOW:
+            self._own.add(len(self._chunks))
+            self._chunks.append([])
+        self._write(len(self._chunks) - 1).append(value)
+        self._len += 1
+
+    def extend(self, values):
+        for value in values:
+            self.append(value)
+
+
+class _Blocks:
+    # Блок — темы с номерами из одного отрезка длиной BLOCK
+    __slots__ = ("_blocks", "_own", "_len")
+    kind = None
+
+    def __init__(self, other=()):
+        if isinstance(other, _Blocks):
+            self._blocks = dict(other._blocks)
+            self._len = other._len
+            other._own = set()
+        else:
+            self._blocks = {}
+            self._len = 0
+        self._own = set()
+
+    def _write(self, tid):
+        number = tid >> _BLOCK_SHIFT
+        block = self._blocks.get(number)
+        if number not in self._own:
+            block = self._blocks[number] = self.kind(block or ())
+            self._own.add(number)
+        return block
+
+    def _drop(self, tid):
+        number = tid >> _BLOCK_SHIFT
+        if not self._blocks[number]:
+            del self._blocks[number]
+            self._own.discard(number)
+
+    def __len__(self):
+        return self._len
+
+    def __contains__(self, tid):
+        block = self._blocks.get(tid >> _BLOCK_SHIFT)
+        return block is not None and tid in block
+
+    def __iter__(self):
+        return chain.from_iterable(self._blocks.values())
+
+    def _common(self, others):
+        # Блоки, которые есть у всех: только в них может быть пересечение
+        for number, block in self._blocks.items():
+            parts = [other._blocks.get(number) for other in others]
+            if all(parts):
+                yield block, parts
+
+
+class TidSet(_Blocks):
+    """Множество номеров тем по блокам. TidSet(other) — копия other."""
+
+    __slots__ = ()
+    kind = set
+
+    def add(self, tid):
+        block = self._write(tid)
+        size = len(block)
+        block.add(tid)
+        self._len += len(block) - size
+
+    def discard(self, tid):
+        if tid in self:
+            self._write(tid).discard(tid)
+            self._len -= 1
+            self._drop(tid)
+
+    def intersection(self, *others):
+        """Множество номеров, которые есть во всех."""
+        if not others:
+            return set().union(*self._blocks.values())
+        blocks = [other._blocks for other in others]
+        found = set()
+        for number in self._blocks.keys() & set.intersection(*map(set, blocks)):
+            found.update(self._blocks[number].intersection(*[b[number] for b in blocks]))
+        return found
+
+
+class TidMap(_Blocks):
+    """Словарь номер темы -> значение по блокам. TidMap(other) — копия other."""
+
+    __slots__ = ()
+    kind = dict
+
+    def __getitem__(self, tid):
+        return self._blocks[tid >> _BLOCK_SHIFT][tid]
+
+    def __setitem__(self, tid, value):
+        block = self._write(tid)
+        self._len += tid not in block
+        block[tid] = value
+
+    def pop(self, tid, default=None):
+        if tid not in self:
+            return default
+        value = self._write(tid).pop(tid)
+        self._len -= 1
+        self._drop(tid)
+        return value
+
+    def join(self, *others):
+        """Пары (номер, [значение здесь, значения в others...]) для номеров, которые есть во всех."""
+        for block, parts in self._common(others):
+            for tid, value in block.items():
+                values = [value]
+                for part in parts:
+                    other = part.get(tid)
+                    if other is None:
+                        break
+                    values.append(other)
+                else:
+                    yield tid, values
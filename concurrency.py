@@ -0,0 +1,72 @@
+import asyncio
+import logging
+
+from telegram import Update
+from telegram.ext import BaseUpdateProcessor
+
+import metrics
+
+# --- Параллельная обработка обновлений с порядком внутри чата ---
+# Пока один ответ ждёт Bot API, остальные ученики не должны стоять в
+# очереди за ним. Одновременно обрабатывается не больше
+# max_concurrent_updates обновлений, но обновления одного чата идут строго
+# друг за другом: каждое ждёт, пока закончится предыдущее из того же чата.
+# Ждущее обновление ещё не занимает место в общем лимите.
+logger = logging.getLogger(__name__)
+
+DROPPED = metrics.REGISTRY.add(metrics.Counter(
+    "bot_updates_dropped_total", "Обновления, отброшенные из-за длинной очереди чата"))
+
+
+def chat_key(update):
+    """Чей порядок соблюдать: чат, а без чата (инлайн-запросы) — пользователь."""
+    if isinstance(update, Update):
+        if update.effective_chat is not None:
+            return update.effective_chat.id
+        if update.effective_user is not None:
+            return ("user", update.effective_user.id)
+    return None
+
+
+class ChatOrderedProcessor(BaseUpdateProcessor):
+    def __init__(self, max_concurrent_updates, max_chat_pending=100):
+        super().__init__(max_concurrent_updates)
+        self.max_chat_pending = max_chat_pending
+        # Чат -> (future последнего обновления в очереди чата, сколько их ждёт)
+        self._tails = {}
+
+    async def initialize(self):
+        pass
+
+    async def shutdown(self):
+        pass
+
+    async def do_process_update(self, update, coroutine):
+        await coroutine
+
+    async def process_update(self, update, coroutine):
+        chat = chat_key(update)
+        if chat is None:
+            return await super().process_update(update, coroutine)
+
+        # Application создаёт задачи в порядке очереди, и до первого await
+        # каждая успевает встать в хвост своего чата — порядок сохраняется
+        previous, pending = self._tails.get(chat, (None, 0))
+        if pending >= self.max_chat_pending:
+            coroutine.close()
+            DROPPED.inc()
+            logger.warning("Очередь чата %s длиннее %d, обновление пропущено", chat, pending)
+            return
+        done = asyncio.get_running_loop().create_future()
+        self._tails[chat] = (done, pending + 1)
+        try:
+            if previous is not None:
+                await previous
+            await super().process_update(update, coroutine)
+        finally:
+            done.set_result(None)
+            tail, pending = self._tails[chat]
+            if tail is done:
+                del self._tails[chat]
+            else:
+                self._tails[chat] = (tail, pending - 1)
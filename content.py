@@ -0,0 +1,395 @@
+import ast
+import hashlib
+import json
+import logging
+import os
+import runpy
+import shutil
+import sqlite3
+import sys
+from functools import lru_cache
+from sys import intern
+
+from render import LIMIT, rule_card, FUZZY_HINT
+from quiz import build_questions
+
+# --- Сборка rules.py в компактный файл SQLite ---
+# rules.py остаётся исходником. Сборка проверяет его (дубли ключей,
+# неполные темы), заранее готовит HTML-ответы и пишет всё в один файл.
+# Бот открывает файл только на чтение и достаёт темы по одной.
+logger = logging.getLogger(__name__)
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+SOURCE = os.path.join(HERE, "rules.py")
+CONTENT_DB = os.environ.get("CONTENT_DB", os.path.join(HERE, "rules.sqlite"))
+CACHE_SIZE = 256
+# Файл читается через mmap: страницы берутся из кэша ОС, общего для всех
+# процессов бота, а не копируются в кэш SQLite каждого соединения
+MMAP_SIZE = 256 * 2**20
+# Меняется вместе со схемой: старый файл тогда пересоберётся сам
+FORMAT = "5"
+
+FIELDS = {"title", "rule", "examples"}
+OPTIONAL = {"section"}
+
+SCHEMA = """
+CREATE TABLE meta (name TEXT PRIMARY KEY, value TEXT NOT NULL);
+CREATE TABLE topics (
+    key TEXT PRIMARY KEY,
+    pos INTEGER NOT NULL,
+    title TEXT NOT NULL,
+    rule TEXT NOT NULL,
+    examples TEXT NOT NULL,
+    card TEXT NOT NULL,
+    section TEXT,
+    digest TEXT NOT NULL
+);
+CREATE INDEX topics_pos ON topics (pos);
+CREATE TABLE questions (
+    id TEXT PRIMARY KEY,
+    pos INTEGER NOT NULL,
+    key TEXT NOT NULL,
+    question TEXT NOT NULL,
+    choices TEXT NOT NULL,
+    answer INTEGER NOT NULL
+);
+CREATE TABLE sections (
+    name TEXT PRIMARY KEY,
+    pos INTEGER NOT NULL,
+    button TEXT NOT NULL UNIQUE,
+    keys TEXT NOT NULL,
+    digest TEXT NOT NULL
+);
+"""
+
+
+class ContentError(ValueError):
+    pass
+
+
+def check(text, where, reserve=0):
+    if len(text) + reserve > LIMIT:
+        raise ContentError(f"{where}: {len(text) + reserve} символов, лимит Telegram {LIMIT}")
+    return text
+
+
+def _digest(path):
+    with open(path, "rb") as f:
+        return hashlib.sha256(FORMAT.encode() + f.read()).hexdigest()
+
+
+def _rule_dicts(tree):
+    # Словари, которые попадают в RULES: RULES = {...} и RULES.update({...})
+    for node in ast.walk(tree):
+        if isinstance(node, ast.Assign) and any(
+            isinstance(t, ast.Name) and t.id == "RULES" for t in node.targets
+        ):
+            value = node.value
+        elif (
+            isinstance(node, ast.Call)
+            and isinstance(node.func, ast.Attribute)
+            and node.func.attr == "update"
+            and isinstance(node.func.value, ast.Name)
+            and node.func.value.id == "RULES"
+            and node.args
+        ):
+            value = node.args[0]
+        else:
+            continue
+        # RULES.update(section("имя", {...}))
+        if isinstance(value, ast.Call) and len(value.args) == 2:
+            value = value.args[1]
+        if isinstance(value, ast.Dict):
+            yield value
+
+
+def check_duplicates(path):
+    """dict.update молча перезаписывает тему с тем же ключом — ищем такие."""
+    with open(path, encoding="utf-8") as f:
+        tree = ast.parse(f.read(), path)
+    seen = {}
+    errors = []
+    for node in _rule_dicts(tree):
+        for key in node.keys:
+            if not (isinstance(key, ast.Constant) and isinstance(key.value, str)):
+                continue
+            if key.value in seen:
+                errors.append(f"ключ {key.value!r} в строке {key.lineno} уже был в строке {seen[key.value]}")
+            else:
+                seen[key.value] = key.lineno
+    if errors:
+        raise ContentError("повторяющиеся темы:\n" + "\n".join(errors))
+
+
+def validate(rules, sections=None):
+    errors = []
+    sections = sections or {}
+    for key, data in rules.items():
+        if not isinstance(key, str) or not key or key != key.strip().lower():
+            errors.append(f"{key!r}: ключ должен быть непустой строкой в нижнем регистре")
+            continue
+        if not isinstance(data, dict) or not FIELDS <= set(data) <= FIELDS | OPTIONAL:
+            errors.append(f"{key!r}: нужны поля {sorted(FIELDS)} и, по желанию, {sorted(OPTIONAL)}")
+            continue
+        if data.get("section") is not None and data["section"] not in sections:
+            errors.append(f"{key!r}: неизвестный раздел {data['section']!r}")
+        if not all(isinstance(data[f], str) and data[f].strip() for f in ("title", "rule")):
+            errors.append(f"{key!r}: title и rule должны быть непустыми строками")
+        examples = data["examples"]
+        if not isinstance(examples, list) or not examples or not all(
+            isinstance(e, str) and e.strip() for e in examples
+        ):
+            errors.append(f"{key!r}: examples должен быть непустым списком строк")
+    if errors:
+        raise ContentError("ошибки в темах:\n" + "\n".join(errors))
+
+
+def load_source(path=SOURCE):
+    """RULES и SECTIONS из исходника после всех проверок."""
+    check_duplicates(path)
+    namespace = runpy.run_path(path)
+    rules, sections = namespace["RULES"], namespace.get("SECTIONS", {})
+    validate(rules, sections)
+    return rules, sections
+
+
+def topic_digest(data):
+    raw = json.dumps(
+        [data["title"], data["rule"], data["examples"], data.get("section")], ensure_ascii=False
+    )
+    return hashlib.sha1(raw.encode()).hexdigest()
+
+
+def section_digest(button, topics):
+    raw = json.dumps([button, topics], ensure_ascii=False)
+    return hashlib.sha1(raw.encode()).hexdigest()
+
+
+def _topic_row(pos, key, data, digest):
+    return (
+        key, pos, data["title"], data["rule"],
+        json.dumps(data["examples"], ensure_ascii=False),
+        check(rule_card(data), f"тема {key!r}", reserve=len(FUZZY_HINT)),
+        data.get("section"), digest,
+    )
+
+
+def compile_content(rules, path=CONTENT_DB, digest="", sections=None, previous=None):
+    """Пишет файл с темами. previous — прошлая сборка: тогда заново
+    готовятся только новые и изменённые темы, остальное копируется."""
+    sections = sections or {}
+    validate(rules, sections)
+    tmp = f"{path}.{os.getpid()}.tmp"
+    if os.path.exists(tmp):
+        os.remove(tmp)
+    incremental = previous is not None and os.path.exists(previous)
+    if incremental:
+        shutil.copyfile(previous, tmp)
+    db = sqlite3.connect(tmp)
+    try:
+        if incremental:
+            try:
+                # Файл со старой схемой копировать бессмысленно
+                if db.execute("SELECT value FROM meta WHERE name = 'format'").fetchone() != (FORMAT,):
+                    raise sqlite3.DatabaseError("другой формат")
+                old = {key: (pos, d) for key, pos, d in db.execute("SELECT key, pos, digest FROM topics")}
+            except sqlite3.DatabaseError:
+                db.close()
+                return compile_content(rules, path, digest, sections)
+        else:
+            db.executescript(SCHEMA)
+            old = {}
+
+        removed = [(key,) for key in old.keys() - rules.keys()]
+        changed, moved = [], []
+        for pos, (key, data) in enumerate(rules.items()):
+            new = topic_digest(data)
+            was = old.get(key)
+            if was is None or was[1] != new:
+                changed.append(_topic_row(pos, key, data, new))
+            elif was[0] != pos:
+                moved.append((pos, key))
+        db.executemany("DELETE FROM topics WHERE key = ?", removed)
+        db.executemany("INSERT OR REPLACE INTO topics VALUES (?, ?, ?, ?, ?, ?, ?, ?)", changed)
+        db.executemany("UPDATE topics SET pos = ? WHERE key = ?", moved)
+
+        # Разделы — списки ключей их тем; по отпечатку (кнопка, ключи и
+        # заголовки) снимок видит, у каких разделов пересобрать страницы
+        members = {name: [] for name in sections}
+        for key, data in rules.items():
+            if data.get("section") is not None:
+                members[data["section"]].append(key)
+        db.execute("DELETE FROM sections")
+        db.executemany(
+            "INSERT INTO sections VALUES (?, ?, ?, ?, ?)",
+            (
+                (name, pos, button, json.dumps(members[name], ensure_ascii=False),
+                 section_digest(button, [(key, rules[key]["title"]) for key in members[name]]))
+                for pos, (name, button) in enumerate(sections.items())
+            ),
+        )
+        # Вопросы викторины тоже: группы вариантов собираются по всем темам
+        questions = [
+            (qid, pos, key, question, json.dumps(choices, ensure_ascii=False), answer)
+            for pos, (qid, key, question, choices, answer) in enumerate(build_questions(rules))
+        ]
+        db.execute("DELETE FROM questions")
+        db.executemany("INSERT INTO questions VALUES (?, ?, ?, ?, ?, ?)", questions)
+        # По отпечатку вопросов снимок видит, что банк викторины можно не пересобирать
+        quiz = hashlib.sha1()
+        for row in questions:
+            quiz.update(json.dumps(row, ensure_ascii=False).encode())
+        db.execute("DELETE FROM meta")
+        db.execute("INSERT INTO meta VALUES ('format', ?)", (FORMAT,))
+        db.execute("INSERT INTO meta VALUES ('digest', ?)", (digest,))
+        db.execute("INSERT INTO meta VALUES ('questions', ?)", (quiz.hexdigest(),))
+        db.commit()
+        if not incremental:
+            db.execute("VACUUM")
+    finally:
+        db.close()
+    logger.info("Сборка %s: изменено %d, удалено %d, сдвинуто %d тем",
+                path, len(changed), len(removed), len(moved))
+    # Несколько воркеров могут собирать файл одновременно: замена атомарна
+    os.replace(tmp, path)
+    return path
+
+
+def build(source=SOURCE, path=CONTENT_DB, previous=None):
+    digest = _digest(source)
+    rules, sections = load_source(source)
+    compile_content(rules, path, digest, sections=sections, previous=previous)
+    return digest
+
+
+class Rule:
+    """Тема в памяти: поля вместо словаря, кортеж примеров вместо списка.
+    Ключ, заголовок и раздел — общие (intern) строки, те же объекты, что в
+    индексах снимка, а card — готовый HTML-ответ."""
+
+    __slots__ = ("key", "title", "rule", "examples", "section", "card")
+
+    def __init__(self, key, title, rule, examples, section=None, card=None):
+        self.key = intern(key)
+        self.title = intern(title)
+        self.rule = rule
+        self.examples = tuple(examples)
+        self.section = intern(section) if section is not None else None
+        self.card = card
+
+    def __repr__(self):
+        return f"Rule({self.key!r})"
+
+
+def _interned(rows):
+    # Один объект строки на ключ и заголовок, сколько бы раз их ни прочитали
+    return ((intern(key), intern(title), value) for key, title, value in rows)
+
+
+class ContentStore:
+    def __init__(self, path=CONTENT_DB):
+        self.path = path
+        self._db = self._connect()
+        self.digest = self._meta("digest")
+        self.questions_digest = self._meta("questions")
+        self.rule = lru_cache(CACHE_SIZE)(self._rule)
+
+    def _connect(self):
+        db = sqlite3.connect(f"file:{self.path}?mode=ro", uri=True, check_same_thread=False)
+        db.execute(f"PRAGMA mmap_size = {MMAP_SIZE}")
+        return db
+
+    def reopen(self):
+        """Новое соединение с тем же файлом — для процесса, запущенного fork'ом:
+        соединением SQLite родителя в нём пользоваться нельзя."""
+        self._db = self._connect()
+
+    def _meta(self, name):
+        row = self._db.execute("SELECT value FROM meta WHERE name = ?", (name,)).fetchone()
+        return row[0] if row else None
+
+    def __len__(self):
+        return self._db.execute("SELECT count(*) FROM topics").fetchone()[0]
+
+    def texts(self):
+        """Четвёрки (ключ, заголовок, правило, примеры) в исходном порядке."""
+        return (
+            (intern(key), intern(title), rule, json.loads(examples))
+            for key, title, rule, examples in self._db.execute(
+                "SELECT key, title, rule, examples FROM topics ORDER BY pos"
+            )
+        )
+
+    def cards(self):
+        """Тройки (ключ, заголовок, готовый HTML) в исходном порядке."""
+        return _interned(self._db.execute("SELECT key, title, card FROM topics ORDER BY pos"))
+
+    def topics(self, keys):
+        """Ключ -> (заголовок, правило, примеры, HTML) для выбранных тем."""
+        found = {}
+        for key in keys:
+            row = self._db.execute(
+                "SELECT title, rule, examples, card FROM topics WHERE key = ?", (key,)
+            ).fetchone()
+            if row is not None:
+                title, rule, examples, card = row
+                found[intern(key)] = (intern(title), rule, json.loads(examples), card)
+        return found
+
+    def digests(self):
+        """Пары (ключ, отпечаток темы) в исходном порядке: по ним видно, что изменилось."""
+        return self._db.execute("SELECT key, digest FROM topics ORDER BY pos")
+
+    def sections(self):
+        """Четвёрки (раздел, текст кнопки, ключи тем JSON, отпечаток) в порядке SECTIONS."""
+        return self._db.execute("SELECT name, button, keys, digest FROM sections ORDER BY pos")
+
+    def questions(self):
+        """Вопросы викторины: (id, ключ темы, вопрос, варианты JSON, номер верного)."""
+        return self._db.execute(
+            "SELECT id, key, question, choices, answer FROM questions ORDER BY pos"
+        )
+
+    def title(self, key):
+        return self.rule(key).title
+
+    def _rule(self, key):
+        row = self._db.execute(
+            "SELECT key, title, rule, examples, section, card FROM topics WHERE key = ?", (key,)
+        ).fetchone()
+        if row is None:
+            raise KeyError(key)
+        key, title, rule, examples, section, card = row
+        return Rule(key, title, rule, json.loads(examples), section, card)
+
+    def card(self, key):
+        return self.rule(key).card
+
+    def close(self):
+        self._db.close()
+
+
+def open_store(source=SOURCE, path=CONTENT_DB):
+    """Открывает собранный файл, пересобирая его, если rules.py изменился."""
+    digest = _digest(source)
+    if os.path.exists(path):
+        try:
+            store = ContentStore(path)
+        except sqlite3.DatabaseError:
+            logger.warning("%s повреждён или устарел, пересобираю", path)
+        else:
+            if store.digest == digest:
+                return store
+            store.close()
+    logger.info("Собираю %s из %s", path, source)
+    build(source, path, previous=path)
+    return ContentStore(path)
+
+
+if __name__ == "__main__":
+    try:
+        build()
+    except ContentError as exc:
+        sys.exit(f"❌ {exc}")
+    store = ContentStore()
+    print(f"✅ {CONTENT_DB}: {len(store)} тем, {os.path.getsize(CONTENT_DB)} байт")
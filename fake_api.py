@@ -0,0 +1,318 @@
+import asyncio
+import json
+import random
+import time
+from collections import Counter, deque
+from email import policy
+from email.parser import BytesParser
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from threading import Condition, Lock, Thread
+from urllib.parse import parse_qsl
+
+from telegram.request import BaseRequest
+
+# --- Поддельный Bot API для локальных проверок и бенчмарков ---
+# FakeRequest подключается к Application вместо HTTPXRequest
+# (build_application(request=...)), и все вызовы Bot API обрабатываются
+# в памяти, без сети и без настоящего токена. FakeServer отдаёт тот же
+# FakeBotAPI по HTTP: бот с BOT_API_URL, указывающим на него, работает
+# как есть, с getUpdates и настоящим HTTPXRequest.
+BOT_USER = {"id": 1, "is_bot": True, "first_name": "Fake", "username": "fake_bot"}
+
+
+def make_update(update_id, chat_id, text):
+    """JSON обновления с текстовым сообщением, как его присылает Telegram."""
+    user = {"id": chat_id, "is_bot": False, "first_name": "Ученик"}
+    message = {
+        "message_id": update_id,
+        "date": int(time.time()),
+        "chat": {"id": chat_id, "type": "private", "first_name": "Ученик"},
+        "from": user,
+        "text": text,
+    }
+    if text.startswith("/"):
+        command = text.split()[0]
+        message["entities"] = [{"type": "bot_command", "offset": 0, "length": len(command)}]
+    return {"update_id": update_id, "message": message}
+
+
+def make_callback(update_id, chat_id, data, message_id=1):
+    """JSON нажатия инлайн-кнопки под сообщением бота."""
+    user = {"id": chat_id, "is_bot": False, "first_name": "Ученик"}
+    message = {
+        "message_id": message_id,
+        "date": int(time.time()),
+        "chat": {"id": chat_id, "type": "private", "first_name": "Ученик"},
+        "from": BOT_USER,
+        "text": "…",
+    }
+    callback = {"id": str(update_id), "from": user, "chat_instance": str(chat_id), "message": message, "data": data}
+    return {"update_id": update_id, "callback_query": callback}
+
+
+def parse_body(content_type, body):
+    """Параметры вызова из тела POST: JSON, urlencoded или multipart/form-data.
+
+    HTTPXRequest шлёт вложенные объекты (reply_markup и т. п.) строками
+    JSON — они раскодируются, как это делает Telegram."""
+    if content_type.startswith("application/json"):
+        return json.loads(body or b"{}")
+    if content_type.startswith("multipart/form-data"):
+        message = BytesParser(policy=policy.HTTP).parsebytes(f"Content-Type: {content_type}\r\n\r\n".encode() + body)
+        params = {}
+        for part in message.iter_parts():
+            value = part.get_payload(decode=True)
+            # У файлов есть имя, их содержимое остаётся байтами
+            if part.get_filename() is None:
+                value = value.decode(part.get_content_charset() or "utf-8")
+            params[part.get_param("name", header="content-disposition")] = value
+    else:
+        params = dict(parse_qsl(body.decode()))
+    for name, value in params.items():
+        if isinstance(value, str) and value[:1] in ("{", "["):
+            try:
+                params[name] = json.loads(value)
+            except ValueError:
+                pass
+    return params
+
+
+def error(code, description, retry_after=None):
+    payload = {"ok": False, "error_code": code, "description": description}
+    if retry_after is not None:
+        payload["parameters"] = {"retry_after": retry_after}
+    return code, payload
+
+
+# Чем бот отвечает на обновление: по первому такому вызову считается
+# время от появления обновления до ответа
+REPLIES = {
+    "message": ("sendMessage", "chat_id"),
+    "callback_query": ("answerCallbackQuery", "callback_query_id"),
+    "inline_query": ("answerInlineQuery", "inline_query_id"),
+}
+
+
+def reply_key(update):
+    """(метод, значение параметра), которым бот ответит на обновление, или None."""
+    for kind, (method, param) in REPLIES.items():
+        body = update.get(kind)
+        if body is not None:
+            value = body["chat"]["id"] if kind == "message" else body["id"]
+            return method, str(value)
+    return None
+
+
+class FakeBotAPI:
+    def __init__(self, latency=0.0, flood_limit=None, jitter=0.0, error_rate=0.0, error_code=500):
+        self.latency = latency
+        # Случайная добавка к задержке: ответы приходят не в том порядке,
+        # в каком ушли запросы, как в настоящей сети
+        self.jitter = jitter
+        # Как настоящий Telegram: больше flood_limit отправок за секунду — 429
+        self.flood_limit = flood_limit
+        # Доля ответов бота (см. REPLIES), которые завершатся ошибкой error_code
+        self.error_rate = error_rate
+        self.error_code = error_code
+        self.calls = Counter()
+        self.errors = Counter()
+        self.sent = []
+        # Секунды от publish() обновления до ответа на него и время
+        # (perf_counter) последнего ответа
+        self.latencies = []
+        self.answered_at = None
+        self._message_id = 0
+        self._recent = deque()
+        self._faults = []
+        # Обновления для getUpdates: (update_id, JSON) и ждущие ответа
+        self._updates = deque()
+        self._waiting = {}  # (метод, параметр) -> очередь времён publish()
+        self._arrived = Condition()
+
+    def publish(self, update):
+        """Новое обновление для getUpdates."""
+        key = reply_key(update)
+        with self._arrived:
+            if key is not None:
+                self._waiting.setdefault(key, deque()).append(time.perf_counter())
+            self._updates.append((update["update_id"], update))
+            self._arrived.notify_all()
+
+    def wait_updates(self, offset, timeout):
+        """Ждёт (не дольше timeout) обновлений с update_id >= offset, как long polling."""
+        with self._arrived:
+            self._arrived.wait_for(lambda: self._updates and self._updates[-1][0] >= offset, timeout)
+
+    @property
+    def unanswered(self):
+        return sum(len(times) for times in self._waiting.values())
+
+    def _answered(self, method, params, failed=False):
+        # На ошибку 5xx бот не повторяет ответ: такое обновление больше не ждём
+        for name, param in REPLIES.values():
+            if name == method:
+                with self._arrived:
+                    times = self._waiting.get((method, str(params.get(param))))
+                    if times:
+                        published = times.popleft()
+                        if not failed:
+                            self.answered_at = time.perf_counter()
+                            self.latencies.append(self.answered_at - published)
+                return
+
+    def fail(self, method, code, description="Injected error", times=1, retry_after=None, chat_id=None):
+        """Следующие times вызовов method (для chat_id, если задан) вернут ошибку."""
+        self._faults.append([method, chat_id, times, error(code, description, retry_after)])
+
+    def _fault(self, method, params):
+        for fault in self._faults:
+            name, chat_id, times, response = fault
+            if name == method and (chat_id is None or str(chat_id) == str(params.get("chat_id"))):
+                if times is not None:
+                    fault[2] -= 1
+                    if fault[2] <= 0:
+                        self._faults.remove(fault)
+                return response
+        return None
+
+    def _flooded(self, method):
+        if self.flood_limit is None or not method.startswith("send"):
+            return False
+        now = time.monotonic()
+        while self._recent and now - self._recent[0] > 1:
+            self._recent.popleft()
+        if len(self._recent) >= self.flood_limit:
+            return True
+        self._recent.append(now)
+        return False
+
+    def handle(self, method, params):
+        self.calls[method] += 1
+        response = self._fault(method, params)
+        if response is None and self._flooded(method):
+            response = error(429, "Too Many Requests: retry after 1", retry_after=1)
+        if response is None and self.error_rate and method in ANSWERS and random.random() < self.error_rate:
+            response = error(self.error_code, "Injected error")
+            self._answered(method, params, failed=True)
+        if response is not None:
+            self.errors[method, response[0]] += 1
+            return response
+        self._answered(method, params)
+        handler = getattr(self, f"on_{method}", None)
+        if handler is None:
+            return 200, {"ok": True, "result": True}
+        try:
+            result = handler(params)
+        except KeyError as missing:
+            response = error(400, f"Bad Request: parameter {missing.args[0]} is required")
+        except (TypeError, ValueError) as bad:
+            response = error(400, f"Bad Request: {bad}")
+        else:
+            return 200, {"ok": True, "result": result}
+        self.errors[method, response[0]] += 1
+        return response
+
+    def on_getUpdates(self, params):
+        # Подтверждённые (update_id < offset) больше не отдаются
+        offset = int(params.get("offset") or 0)
+        limit = int(params.get("limit") or 100)
+        with self._arrived:
+            while self._updates and self._updates[0][0] < offset:
+                self._updates.popleft()
+            return [update for _, update in list(self._updates)[:limit]]
+
+    def on_getMe(self, params):
+        return BOT_USER
+
+    def on_getWebhookInfo(self, params):
+        return {"url": "", "has_custom_certificate": False, "pending_update_count": 0}
+
+    def on_sendMessage(self, params):
+        self._message_id += 1
+        chat_id = int(params["chat_id"])
+        self.sent.append((chat_id, params["text"]))
+        return {
+            "message_id": self._message_id,
+            "date": int(time.time()),
+            "chat": {"id": chat_id, "type": "private"},
+            "from": BOT_USER,
+            "text": params["text"],
+        }
+
+
+ANSWERS = {method for method, _ in REPLIES.values()}
+
+
+class FakeRequest(BaseRequest):
+    def __init__(self, api):
+        self.api = api
+
+    @property
+    def read_timeout(self):
+        return None
+
+    async def initialize(self):
+        pass
+
+    async def shutdown(self):
+        pass
+
+    async def do_request(self, url, method, request_data=None, read_timeout=None,
+                         write_timeout=None, connect_timeout=None, pool_timeout=None):
+        if self.api.latency or self.api.jitter:
+            await asyncio.sleep(self.api.latency + random.uniform(0, self.api.jitter))
+        params = request_data.parameters if request_data is not None else {}
+        status, payload = self.api.handle(url.rsplit("/", 1)[-1], params)
+        return status, json.dumps(payload).encode()
+
+
+class FakeServer:
+    """FakeBotAPI по HTTP: POST /bot<токен>/<метод>, как у api.telegram.org.
+
+    Задержка api.latency + jitter добавляется к каждому вызову, кроме
+    getUpdates: тот ждёт обновлений до своего timeout."""
+
+    def __init__(self, api, host="127.0.0.1", port=0):
+        self.api = api
+        lock = Lock()
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def do_POST(self):
+                method = self.path.rsplit("/", 1)[-1]
+                body = self.rfile.read(int(self.headers.get("Content-Length") or 0))
+                try:
+                    params = parse_body(self.headers.get("Content-Type", ""), body)
+                    if method == "getUpdates":
+                        offset, timeout = int(params.get("offset") or 0), float(params.get("timeout") or 0)
+                except (TypeError, ValueError) as bad:
+                    status, payload = error(400, f"Bad Request: {bad}")
+                else:
+                    if method == "getUpdates":
+                        api.wait_updates(offset, timeout)
+                    elif api.latency or api.jitter:
+                        time.sleep(api.latency + random.uniform(0, api.jitter))
+                    # Счётчики FakeBotAPI рассчитаны на один поток
+                    with lock:
+                        status, payload = api.handle(method, params)
+                data = json.dumps(payload).encode()
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            do_GET = do_POST
+
+            def log_message(self, format, *args):
+                pass
+
+        self._server = ThreadingHTTPServer((host, port), Handler)
+        self._server.daemon_threads = True
+        self.url = f"http://{host}:{self._server.server_port}"
+        Thread(target=self._server.serve_forever, daemon=True, name="fake-api").start()
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
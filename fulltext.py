@@ -0,0 +1,123 @@
+import heapq
+import math
+from collections import Counter
+from functools import lru_cache
+
+from chunks import ChunkMap, Chunks, TidMap
+from fuzzy import words
+from morph import CACHE_SIZE, STOP_WORDS, stem
+from search import Numbering, _cow
+
+# --- Полнотекстовый поиск по правилам и примерам (BM25) ---
+# Ключ, заголовок, текст правила и примеры темы разбиваются на основы
+# слов. Для каждой основы хранится, в каких темах и сколько раз она
+# встречается (tf), для каждой темы — её длина в основах. Запрос
+# оценивается по BM25 только на темах из списков своих основ, поэтому его
+# цена зависит от длины этих списков, а не от числа тем; лучшие k тем
+# выбираются кучей.
+K1 = 1.2
+B = 0.75
+# Ключ и заголовок короче правила, но говорят о теме больше
+HEAD_WEIGHT = 3
+
+
+def _terms(text):
+    # «-ться» в правиле и «ться» в запросе — одна основа
+    return [stem(w.strip("-")) for w in words(text) if w.strip("-") and w not in STOP_WORDS]
+
+
+@lru_cache(CACHE_SIZE)
+def query_terms(query):
+    """Основы запроса без повторов."""
+    return tuple(dict.fromkeys(_terms(query)))
+
+
+def document(key, title, rule, examples):
+    """Основа -> число вхождений в теме."""
+    counts = Counter()
+    for term in _terms(key) + _terms(title):
+        counts[term] += HEAD_WEIGHT
+    for text in (rule, *examples):
+        counts.update(_terms(text))
+    return counts
+
+
+class TextIndex:
+    def __init__(self, topics, numbering=None):
+        """topics — четвёрки (ключ, заголовок, правило, примеры) в порядке RULES."""
+        topics = {key: (title, rule, examples) for key, title, rule, examples in topics}
+        self.numbering = numbering or Numbering(topics)
+        self._lengths = Chunks()  # tid -> длина темы в основах, 0 — темы нет
+        self._total = 0
+        self._count = 0
+        self._postings = ChunkMap()  # основа -> TidMap {tid: tf}
+        self._apply({}, topics, {})
+
+    @property
+    def keys(self):
+        return self.numbering.keys
+
+    def _apply(self, old, new, old_tids):
+        touched = {}
+        self._lengths.extend([0] * (len(self.keys) - len(self._lengths)))
+        for key, (title, rule, examples) in old.items():
+            tid = old_tids[key]
+            for term in document(key, title, rule, examples):
+                _cow(self._postings, touched, term, TidMap).pop(tid, None)
+            self._total -= self._lengths[tid]
+            self._count -= 1
+            self._lengths[tid] = 0
+        for key, (title, rule, examples) in new.items():
+            tid = self.numbering.tids[key]
+            counts = document(key, title, rule, examples)
+            for term, tf in counts.items():
+                _cow(self._postings, touched, term, TidMap)[tid] = tf
+            self._lengths[tid] = sum(counts.values())
+            self._total += self._lengths[tid]
+            self._count += 1
+        for term in touched:
+            if not self._postings[term]:
+                del self._postings[term]
+
+    def updated(self, numbering, old, new):
+        """Новый индекс: пересобраны только темы из old и new (см. TopicIndex.updated)."""
+        index = TextIndex.__new__(TextIndex)
+        index.numbering = numbering
+        index._lengths = self._lengths.copy()
+        index._total = self._total
+        index._count = self._count
+        index._postings = self._postings.copy()
+        index._apply(old, new, self.numbering.tids)
+        return index
+
+    def matches(self, query, limit=None):
+        """Темы (tid), где есть все основы запроса, от лучшей по BM25."""
+        postings = []
+        for term in query_terms(query):
+            found = self._postings.get(term)
+            if not found:
+                return []
+            postings.append(found)
+        if not postings:
+            return []
+        postings.sort(key=len)
+
+        n = self._count
+        average = self._total / n
+        weights = [math.log(1 + (n - len(p) + 0.5) / (len(p) + 0.5)) for p in postings]
+        length = self._lengths.__getitem__
+        scores = {}
+        for tid, tfs in postings[0].join(*postings[1:]):
+            norm = K1 * (1 - B + B * length(tid) / average)
+            scores[tid] = sum(idf * tf * (K1 + 1) / (tf + norm) for tf, idf in zip(tfs, weights))
+        candidates = list(scores)
+        # При равной оценке — порядок RULES
+        rank = self.numbering.rank
+        key = lambda tid: (-scores[tid], rank[tid])
+        if limit is None:
+            return sorted(candidates, key=key)
+        return heapq.nsmallest(limit, candidates, key=key)
+
+    def lookup(self, query):
+        found = self.matches(query, 1)
+        return self.keys[found[0]] if found else None
@@ -0,0 +1,211 @@
+import heapq
+import re
+from collections import defaultdict
+from itertools import islice
+
+from chunks import ChunkMap, Chunks
+from search import Numbering, _cow
+
+# --- Поиск темы с опечатками ---
+# Кандидаты отбираются по общим триграммам, и только для них считается
+# расстояние Дамерау — Левенштейна. Перебора всех тем нет даже на промахе:
+# работа на запрос ограничена числами, а не часами — просмотренных записей
+# триграмм не больше MAX_SCAN, проверок не больше MAX_CANDIDATES, клеток
+# расстояния не больше MAX_STEPS. Поэтому один и тот же запрос находит одну и
+# ту же тему при любой загрузке машины, и ответ можно кэшировать.
+MAX_CANDIDATES = 64
+MAX_SCAN = 10000
+MAX_STEPS = 10000
+MIN_SCORE = 0.7
+WINDOW = 3
+
+_WORD = re.compile(r"[а-яёa-z0-9-]+")
+
+
+def words(text):
+    return _WORD.findall(text.lower())
+
+
+def _trigrams(text):
+    padded = f"  {text} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+def _size(text):
+    return min(len(text.split()), WINDOW + 1)
+
+
+def distance(a, b, limit):
+    """Расстояние Дамерау — Левенштейна (OSA) или limit + 1, если больше limit.
+
+    Считается только полоса |i - j| <= limit: клетки вне неё заведомо
+    больше limit."""
+    if abs(len(a) - len(b)) > limit:
+        return limit + 1
+    far = limit + 1
+    size = len(b)
+    prev2 = None
+    prev = [min(j, far) for j in range(size + 1)]
+    for i in range(1, len(a) + 1):
+        cur = [far] * (size + 1)
+        cur[0] = best = min(i, far)
+        for j in range(max(1, i - limit), min(size, i + limit) + 1):
+            cost = a[i - 1] != b[j - 1]
+            value = min(prev[j] + 1, cur[j - 1] + 1, prev[j - 1] + cost)
+            if (
+                prev2 is not None and j > 1
+                and a[i - 1] == b[j - 2] and a[i - 2] == b[j - 1]
+            ):
+                value = min(value, prev2[j - 2] + 1)
+            cur[j] = value
+            best = min(best, value)
+        if best > limit:
+            return far
+        prev2, prev = prev, cur
+    return min(prev[-1], far)
+
+
+class FuzzyMatcher:
+    def __init__(self, topics, numbering=None):
+        """topics — пары (ключ, заголовок) в порядке RULES."""
+        topics = dict(topics)
+        self.numbering = numbering or Numbering(topics)
+        # Словарь фраз: ключ целиком, заголовок без эмодзи и окна из 1..WINDOW
+        # слов. Если фраза — чей-то ключ целиком, она ведёт на эту тему,
+        # иначе на первую тему, где встретилась.
+        self._phrases = ChunkMap()  # фраза → eid
+        self._entries = Chunks()  # текст фразы
+        self._owners = Chunks()  # темы, где встретилась фраза
+        self._whole = ChunkMap()  # eid → темы, у которых фраза — ключ или заголовок целиком
+        self._target = Chunks()  # тема, на которую ведёт фраза, или None
+        # Списки ведутся отдельно по числу слов: запрос из двух слов
+        # сравнивается только с фразами из двух слов.
+        self._postings = ChunkMap()  # (число слов, триграмма) → Chunks с eid
+        self._apply({}, topics, {})
+
+    @property
+    def keys(self):
+        return self.numbering.keys
+
+    @staticmethod
+    def _split(key, title):
+        title = " ".join(words(title))
+        whole = {key, title} - {""}
+        phrases = set(whole)
+        for text in (key, title):
+            parts = words(text)
+            for size in range(1, min(WINDOW, len(parts)) + 1):
+                for i in range(len(parts) - size + 1):
+                    phrases.add(" ".join(parts[i:i + size]))
+        return phrases, whole
+
+    def _eid(self, phrase, touched):
+        eid = self._phrases.get(phrase)
+        if eid is None:
+            # Фразы только добавляются: eid не переиспользуются, и старый
+            # снимок не видит новых записей в своих списках
+            eid = self._phrases[phrase] = len(self._entries)
+            self._entries.append(phrase)
+            self._owners.append(())
+            self._target.append(None)
+            size = _size(phrase)
+            for gram in _trigrams(phrase):
+                _cow(self._postings, touched, (size, gram), Chunks).append(eid)
+        return eid
+
+    def _apply(self, old, new, old_tids):
+        touched = {}
+        owners, whole = {}, {}
+
+        def edit(edits, eid, current):
+            if eid not in edits:
+                edits[eid] = list(current)
+            return edits[eid]
+
+        for key, title in old.items():
+            tid = old_tids[key]
+            phrases, full = self._split(key, title)
+            for phrase in phrases:
+                eid = self._phrases[phrase]
+                edit(owners, eid, self._owners[eid]).remove(tid)
+                if phrase in full:
+                    edit(whole, eid, self._whole.get(eid, ())).remove(tid)
+        for key, title in new.items():
+            tid = self.numbering.tids[key]
+            phrases, full = self._split(key, title)
+            for phrase in phrases:
+                eid = self._eid(phrase, touched)
+                edit(owners, eid, self._owners[eid]).append(tid)
+                if phrase in full:
+                    edit(whole, eid, self._whole.get(eid, ())).append(tid)
+        # Кортежи неизменяемы, поэтому старый снимок их не увидит изменёнными
+        for eid, tids in whole.items():
+            if tids:
+                self._whole[eid] = tuple(tids)
+            else:
+                del self._whole[eid]
+        rank = self.numbering.rank.__getitem__
+        for eid, tids in owners.items():
+            self._owners[eid] = tuple(tids)
+            tids = self._whole.get(eid) or tids
+            self._target[eid] = min(tids, key=rank) if tids else None
+
+    def updated(self, numbering, old, new):
+        """Новый словарь фраз: пересобраны только темы из old и new (см. TopicIndex.updated).
+        Порядок оставшихся тем между собой должен сохраниться — переставленные
+        темы передаются в old и new."""
+        matcher = FuzzyMatcher.__new__(FuzzyMatcher)
+        matcher.numbering = numbering
+        matcher._phrases = self._phrases.copy()
+        matcher._entries = self._entries.copy()
+        matcher._owners = self._owners.copy()
+        matcher._whole = self._whole.copy()
+        matcher._target = self._target.copy()
+        matcher._postings = self._postings.copy()
+        matcher._apply(old, new, self.numbering.tids)
+        return matcher
+
+    def _candidates(self, query):
+        size = _size(query)
+        postings = [self._postings.get((size, gram), ()) for gram in _trigrams(query)]
+        postings = sorted((p for p in postings if p), key=len)
+        # Сначала редкие триграммы: они лучше всего отсеивают. Частые
+        # просматриваются, только пока не исчерпан лимит MAX_SCAN.
+        counts = defaultdict(int)
+        scanned = 0
+        for posting in postings:
+            if scanned and scanned + len(posting) > MAX_SCAN:
+                break
+            for eid in islice(posting, MAX_SCAN):
+                counts[eid] += 1
+            scanned += len(posting)
+        return heapq.nlargest(MAX_CANDIDATES, counts, key=counts.__getitem__)
+
+    def match(self, query, min_score=MIN_SCORE, steps=MAX_STEPS):
+        """Лучшая тема и уверенность 0..1 или None."""
+        query = " ".join(words(query))
+        if len(query) < 3:
+            return None
+        limit = max(1, int(len(query) * (1 - min_score)))
+
+        best = None
+        for eid in self._candidates(query):
+            tid = self._target[eid]
+            if tid is None:
+                continue
+            text = self._entries[eid]
+            # Клетки полосы, которую посчитает distance
+            steps -= len(query) * min(len(text), 2 * limit + 1)
+            if steps < 0:
+                break
+            d = distance(query, text, limit)
+            if d <= limit:
+                score = 1 - d / max(len(query), len(text))
+                rank = self.numbering.rank[tid]
+                if best is None or (score, -rank) > (best[1], -best[2]):
+                    best = (tid, score, rank)
+                    limit = d
+
+        if best is None or best[1] < min_score:
+            return None
+        return self.keys[best[0]], round(best[1], 3)
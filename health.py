@@ -0,0 +1,39 @@
+import time
+from threading import Event
+
+# --- Живость и готовность ---
+# Процесс жив (liveness), как только Flask отвечает на запросы: для этого
+# не нужен ни python-telegram-bot, ни индексы. Готов (readiness) — когда
+# бот принимает обновления. Пока идёт запуск, видно, какие стадии уже
+# пройдены и сколько секунд от старта на это ушло.
+STARTED = time.monotonic()
+READY = Event()
+stages = {}
+error = None
+# Имя -> функция, чей результат добавляется в status() (например, опоздание event loop)
+probes = {}
+
+
+def mark(stage):
+    stages[stage] = round(time.monotonic() - STARTED, 3)
+
+
+def ready():
+    mark("ready")
+    READY.set()
+
+
+def fail(message):
+    global error
+    error = message
+    mark("failed")
+
+
+def status():
+    return {
+        "ready": READY.is_set(),
+        "error": error,
+        "uptime": round(time.monotonic() - STARTED, 3),
+        "stages": dict(stages),
+        **{name: probe() for name, probe in list(probes.items())},
+    }
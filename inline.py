@@ -0,0 +1,74 @@
+from functools import lru_cache
+
+from telegram import InlineQueryResultArticle, InputTextMessageContent
+
+from chunks import Chunks
+
+# --- Инлайн-режим: @bot безударные гласные в любом чате ---
+# Карточка-результат для каждой темы собирается один раз при загрузке.
+# Инлайн-запросы приходят на каждое нажатие клавиши, поэтому списки
+# результатов кэшируются по нормализованному тексту запроса, а Telegram
+# дополнительно держит ответ у себя CACHE_TIME секунд.
+MAX_RESULTS = 10
+CACHE_TIME = 300
+CACHE_SIZE = 4096
+
+
+def normalize_query(text):
+    return " ".join(text.lower().split())
+
+
+def _article(tid, key, title, card):
+    return InlineQueryResultArticle(
+        id=str(tid),
+        title=title,
+        input_message_content=InputTextMessageContent(card, parse_mode="HTML"),
+        description=key,
+    )
+
+
+class InlineResults:
+    def __init__(self, store, index, lemmas, fulltext, fuzzy, articles=None):
+        self.index = index
+        self.lemmas = lemmas
+        self.fulltext = fulltext
+        self.fuzzy = fuzzy
+        self.numbering = index.numbering
+        if articles is None:
+            articles = Chunks([None] * len(self.numbering.keys))
+            for key, title, card in store.cards():
+                tid = self.numbering.tids[key]
+                articles[tid] = _article(tid, key, title, card)
+        self.articles = articles
+        # Кэш у каждого снимка свой: после перезагрузки старые ответы не нужны
+        self._results = lru_cache(CACHE_SIZE)(self._search)
+
+    def updated(self, index, lemmas, fulltext, fuzzy, removed, cards):
+        """Результаты для нового снимка: карточки пересобираются только для
+        removed (ключи удалённых тем) и cards (тройки изменённых и новых)."""
+        numbering = index.numbering
+        articles = self.articles.copy()
+        articles.extend([None] * (len(numbering.keys) - len(articles)))
+        for key in removed:
+            articles[self.numbering.tids[key]] = None
+        for key, title, card in cards:
+            tid = numbering.tids[key]
+            articles[tid] = _article(tid, key, title, card)
+        return InlineResults(None, index, lemmas, fulltext, fuzzy, articles)
+
+    def _search(self, query):
+        if not query:
+            return tuple(self.articles[tid] for tid in self.numbering.order[:MAX_RESULTS])
+        # Подстрока, словоформы, текст правил, потом опечатки — без повторов
+        tids = dict.fromkeys(self.index.matches(query, MAX_RESULTS))
+        for more in (self.lemmas, self.fulltext):
+            if len(tids) < MAX_RESULTS:
+                tids.update(dict.fromkeys(more.matches(query, MAX_RESULTS)))
+        if not tids:
+            found = self.fuzzy.match(query)
+            if found is not None:
+                tids[self.numbering.tids[found[0]]] = None
+        return tuple(self.articles[tid] for tid in list(tids)[:MAX_RESULTS])
+
+    def results(self, text):
+        return self._results(normalize_query(text))
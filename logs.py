@@ -0,0 +1,246 @@
+import atexit
+import json
+import logging
+import os
+import queue
+import random
+import sys
+import time
+from collections import Counter
+from contextvars import ContextVar
+from logging.handlers import QueueHandler
+from threading import Thread
+
+# --- Логи без ожидания вывода ---
+# Обработчик на корневом логгере только кладёт запись в очередь, а в stdout
+# её пишет отдельный поток. Event loop бота не ждёт вывода, даже когда
+# сборщик логов Render читает медленно. Каждая запись — строка JSON; если
+# она пишется при обработке обновления, в ней есть update_id, chat_id и
+# обработчик, а в итоговой записи об обновлении — ещё тема и время.
+# Болтливые библиотеки (httpx пишет строку на каждый вызов Bot API)
+# можно проредить: LOG_SAMPLE="httpx=0.1" оставит каждую десятую запись.
+# Предупреждения и ошибки не прореживаются и не теряются: последние RESERVE
+# мест очереди — только для них, а если занято и это, запись ждёт места.
+# Когда вывод не успевает, отбрасываются только INFO и DEBUG.
+LOG_FORMAT = os.environ.get("LOG_FORMAT", "json")  # json или text
+LOG_SAMPLE = os.environ.get("LOG_SAMPLE", "httpx=0.1")
+QUEUE_SIZE = int(os.environ.get("LOG_QUEUE", 10_000))
+RESERVE = int(os.environ.get("LOG_RESERVE", 1_000))
+TEXT_FORMAT = "%(asctime)s - %(name)s - %(levelname)s - %(message)s"
+
+# Поля обновления, которое сейчас обрабатывается (у каждой задачи asyncio свои)
+TRACE = ContextVar("trace", default=None)
+# Записи, которым не хватило места в очереди: уровень -> сколько
+dropped = Counter()
+
+_handler = None
+_writer = None
+updates = logging.getLogger("bot.updates")
+
+
+def parse_rates(spec):
+    """ "httpx=0.1,telegram=0.5" -> {"httpx": 0.1, "telegram": 0.5}"""
+    rates = {}
+    for part in spec.split(","):
+        name, _, rate = part.partition("=")
+        if name.strip():
+            rates[name.strip()] = float(rate)
+    return rates
+
+
+class Sampler(logging.Filter):
+    """Пропускает долю rate записей ниже WARNING от логгера и его потомков."""
+
+    def __init__(self, rates):
+        super().__init__()
+        self.rates = rates
+        self._cache = {}  # имя логгера -> доля
+
+    def rate(self, name):
+        rate = self._cache.get(name)
+        if rate is None:
+            rate = 1.0
+            parts = name.split(".")
+            for i in range(len(parts), 0, -1):
+                prefix = ".".join(parts[:i])
+                if prefix in self.rates:
+                    rate = self.rates[prefix]
+                    break
+            self._cache[name] = rate
+        return rate
+
+    def filter(self, record):
+        if record.levelno >= logging.WARNING:
+            return True
+        rate = self.rate(record.name)
+        return rate >= 1 or random.random() < rate
+
+
+class _QueueHandler(QueueHandler):
+    def handle(self, record):
+        # Очередь потокобезопасна сама, замок обработчика не нужен
+        if self.filter(record):
+            self.enqueue(self.prepare(record))
+        return True
+
+    def prepare(self, record):
+        # В потоке event loop — только то, что нельзя отложить: аргументы
+        # могут измениться, трейсбек и контекст обновления есть лишь сейчас.
+        # Запись больше никому не нужна, поэтому не копируется
+        record.message = record.getMessage()
+        if record.exc_info:
+            record.exc_text = _TEXT.formatException(record.exc_info)
+        record.msg = record.message
+        record.args = None
+        record.exc_info = None
+        trace = TRACE.get()
+        record.trace = dict(trace) if trace else None
+        return record
+
+    def enqueue(self, record):
+        if record.levelno >= logging.WARNING:
+            self.queue.put(record)
+            return
+        try:
+            if self.queue.qsize() >= QUEUE_SIZE:
+                raise queue.Full
+            self.queue.put_nowait(record)
+        except queue.Full:
+            dropped[record.levelname] += 1
+
+
+class JsonFormatter(logging.Formatter):
+    def format(self, record):
+        entry = {
+            "time": time.strftime("%Y-%m-%dT%H:%M:%S", time.gmtime(record.created)) + f".{int(record.msecs):03d}Z",
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.message,
+        }
+        if getattr(record, "trace", None):
+            entry.update(record.trace)
+        if record.exc_text:
+            entry["exc"] = record.exc_text
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+class TextFormatter(logging.Formatter):
+    def formatMessage(self, record):
+        line = super().formatMessage(record)
+        trace = getattr(record, "trace", None)
+        if trace:
+            line += " [" + " ".join(f"{k}={v}" for k, v in trace.items()) + "]"
+        return line
+
+
+_TEXT = TextFormatter(TEXT_FORMAT)
+
+
+_STOP = object()
+
+
+class Writer:
+    """Поток, который пишет записи из очереди в stream.
+
+    Всё, что накопилось, форматируется и уходит одной записью в stream:
+    при всплеске потоку не нужен отдельный системный вызов на строку."""
+
+    def __init__(self, records, stream, formatter, batch=512):
+        self.records = records
+        self.stream = stream
+        self.formatter = formatter
+        self.batch = batch
+        self._thread = Thread(target=self._run, daemon=True, name="logs")
+        self._thread.start()
+
+    def _run(self):
+        while True:
+            batch = [self.records.get()]
+            try:
+                while len(batch) < self.batch:
+                    batch.append(self.records.get_nowait())
+            except queue.Empty:
+                pass
+            stop = batch[-1] is _STOP
+            lines = [self.formatter.format(record) for record in batch if record is not _STOP]
+            if lines:
+                try:
+                    self.stream.write("\n".join(lines) + "\n")
+                    self.stream.flush()
+                except (OSError, ValueError):
+                    pass
+            if stop:
+                return
+
+    def stop(self):
+        # Ждёт места в очереди: записи перед остановкой не теряются
+        self.records.put(_STOP)
+        self._thread.join()
+
+
+def setup(stream=None, fmt=LOG_FORMAT, sample=LOG_SAMPLE, level=logging.INFO):
+    """Ставит очередь на корневой логгер и запускает поток вывода."""
+    global _handler, _writer
+    stop()
+    formatter = JsonFormatter() if fmt == "json" else _TEXT
+    _handler = _QueueHandler(queue.Queue(QUEUE_SIZE + RESERVE))
+    rates = parse_rates(sample)
+    if rates:
+        _handler.addFilter(Sampler(rates))
+    root = logging.getLogger()
+    for handler in list(root.handlers):
+        root.removeHandler(handler)
+    root.addHandler(_handler)
+    root.setLevel(level)
+    _writer = Writer(_handler.queue, stream or sys.stderr, formatter)
+
+
+def stop():
+    """Дописывает очередь и останавливает поток вывода."""
+    global _writer
+    if _writer is not None:
+        _writer.stop()
+        _writer = None
+
+
+def _after_fork():
+    # Поток вывода в дочерний процесс не переходит, а очередь могла
+    # остаться под замком: воркеру нужны свои
+    global _writer
+    if _writer is None:
+        return
+    _handler.queue = queue.Queue(QUEUE_SIZE + RESERVE)
+    _writer = Writer(_handler.queue, _writer.stream, _writer.formatter)
+
+
+os.register_at_fork(after_in_child=_after_fork)
+# Остановки бота тоже пишут в лог, а их atexit зарегистрированы позже и
+# выполняются раньше этого
+atexit.register(stop)
+
+
+# --- Контекст обновления ---
+def begin(update, handler):
+    """Начало обработки: записи до end() получат поля обновления."""
+    chat = getattr(update, "effective_chat", None)
+    user = getattr(update, "effective_user", None)
+    return TRACE.set({
+        "update_id": getattr(update, "update_id", None),
+        "chat_id": chat.id if chat is not None else None,
+        "user_id": user.id if user is not None else None,
+        "handler": handler,
+    })
+
+
+def annotate(**fields):
+    """Дописывает поля (например, найденную тему) к текущему обновлению."""
+    trace = TRACE.get()
+    if trace is not None:
+        trace.update(fields)
+
+
+def end(token, seconds):
+    """Итоговая запись об обновлении со временем обработки."""
+    TRACE.get()["latency_ms"] = round(seconds * 1000, 2)
+    updates.info("обновление обработано")
+    TRACE.reset(token)
@@ -0,0 +1,159 @@
+import asyncio
+import glob
+import logging
+import os
+import sys
+import threading
+import time
+from collections import Counter, deque
+
+import health
+import metrics
+
+# --- Сторож event loop ---
+# Задача в event loop просыпается каждые LAG_INTERVAL секунд; насколько
+# она опоздала — столько loop не мог заняться ничем другим (CPU в
+# обработчике, синхронный вызов, ожидание GIL). Опоздание идёт в /metrics
+# и /healthz. Отдельный поток следит за тем, когда задача просыпалась в
+# последний раз: если loop молчит дольше STALL_THRESHOLD, поток, пока
+# loop не оживёт, снимает стек его потока раз в SAMPLE_INTERVAL и пишет
+# сложенные стеки (формат flamegraph.pl) в STALL_DIR. Хранятся последние
+# STALL_KEEP профилей; STALL_KEEP=0 — профили не пишутся, остаётся запись
+# в логе. С SHARDS > 1 гистограмма опоздания остаётся в воркере, а
+# /metrics главного процесса показывает последнее опоздание каждого
+# воркера (см. shard.py).
+HERE = os.path.dirname(os.path.abspath(__file__))
+LAG_INTERVAL = float(os.environ.get("LAG_INTERVAL", 0.1))
+STALL_THRESHOLD = float(os.environ.get("STALL_THRESHOLD", 1.0))
+STALL_DIR = os.environ.get("STALL_DIR", os.path.join(HERE, "stalls"))
+STALL_KEEP = int(os.environ.get("STALL_KEEP", 20))
+SAMPLE_INTERVAL = 0.005
+# Дольше профиль не снимается, даже если loop так и не ожил
+MAX_PROFILE_SECONDS = 60
+# За какое время показывать наибольшее опоздание в /healthz
+WINDOW_SECONDS = 60
+
+logger = logging.getLogger(__name__)
+
+LAG = metrics.REGISTRY.add(metrics.Histogram(
+    "bot_loop_lag_seconds", "Опоздание event loop на LAG_INTERVAL"))
+STALLS = metrics.REGISTRY.add(metrics.Counter(
+    "bot_loop_stalls_total", "Зависания event loop дольше STALL_THRESHOLD"))
+
+
+def collapse(frame):
+    """Стек потока одной строкой: «файл:функция:строка;...», снаружи внутрь."""
+    parts = []
+    while frame is not None:
+        code = frame.f_code
+        parts.append(f"{os.path.basename(code.co_filename)}:{code.co_name}:{frame.f_lineno}")
+        frame = frame.f_back
+    return ";".join(reversed(parts))
+
+
+class Watchdog:
+    def __init__(self, interval=LAG_INTERVAL, threshold=STALL_THRESHOLD, directory=STALL_DIR,
+                 keep=STALL_KEEP, report=None):
+        """report(опоздание) вызывается на каждом такте, например чтобы его видел главный процесс."""
+        self.interval = interval
+        self.threshold = threshold
+        self.directory = directory
+        self.keep = keep
+        self.report = report
+        self.lag = 0.0
+        self.stalls = 0
+        self.last_profile = None
+        self._lags = deque(maxlen=max(1, int(WINDOW_SECONDS / interval)))
+        self._beat = time.monotonic()
+        self._thread_id = None
+        self._task = None
+        self._stopped = threading.Event()
+
+    def start(self):
+        """Запуск из event loop, за которым надо следить."""
+        self._thread_id = threading.get_ident()
+        self._beat = time.monotonic()
+        self._task = asyncio.get_running_loop().create_task(self._tick())
+        threading.Thread(target=self._watch, daemon=True, name="loopwatch").start()
+        health.probes["loop"] = self.status
+        return self
+
+    def stop(self):
+        self._stopped.set()
+        if self._task is not None:
+            self._task.cancel()
+        health.probes.pop("loop", None)
+
+    async def _tick(self):
+        while True:
+            await asyncio.sleep(self.interval)
+            now = time.monotonic()
+            self.lag = max(0.0, now - self._beat - self.interval)
+            self._beat = now
+            self._lags.append(self.lag)
+            LAG.observe(self.lag)
+            if self.report is not None:
+                self.report(self.lag)
+
+    def _watch(self):
+        while not self._stopped.wait(self.interval):
+            if time.monotonic() - self._beat - self.interval > self.threshold:
+                self._profile()
+
+    def _profile(self):
+        beat = self._beat
+        stacks = Counter()
+        deadline = time.monotonic() + MAX_PROFILE_SECONDS
+        while self._beat == beat and time.monotonic() < deadline and not self._stopped.is_set():
+            frame = sys._current_frames().get(self._thread_id)
+            if frame is None:
+                return
+            stacks[collapse(frame)] += 1
+            del frame
+            time.sleep(SAMPLE_INTERVAL)
+        stalled = time.monotonic() - beat - self.interval
+        self.stalls += 1
+        STALLS.inc()
+        try:
+            self.last_profile = self._save(stalled, stacks)
+        except OSError as exc:
+            logger.warning("Профиль зависания не сохранён: %s", exc)
+            self.last_profile = None
+        logger.warning("Event loop не отвечал %.2f с, профиль: %s", stalled, self.last_profile)
+
+    def _save(self, stalled, stacks):
+        if self.keep <= 0:
+            return None
+        os.makedirs(self.directory, exist_ok=True)
+        stamp = time.strftime("%Y%m%d-%H%M%S")
+        path = os.path.join(self.directory, f"stall-{stamp}-{os.getpid()}-{self.stalls}.txt")
+        with open(path, "w", encoding="utf-8") as f:
+            f.write(f"# event loop не отвечал {stalled:.2f} с, снимков стека {sum(stacks.values())}"
+                    f" раз в {SAMPLE_INTERVAL * 1000:g} мс\n")
+            for stack, count in stacks.most_common():
+                f.write(f"{stack} {count}\n")
+        # Старые профили удаляются: на диске не больше keep файлов. В
+        # каталог пишут все воркеры SHARDS, и файл может удалить другой
+        saved = []
+        for name in glob.glob(os.path.join(self.directory, "stall-*.txt")):
+            try:
+                saved.append((os.path.getmtime(name), name))
+            except FileNotFoundError:
+                pass
+        saved.sort()
+        for _, old in saved[:-self.keep]:
+            try:
+                os.remove(old)
+            except FileNotFoundError:
+                pass
+        return path
+
+    def status(self):
+        behind = time.monotonic() - self._beat - self.interval
+        return {
+            "lag": round(self.lag, 4),
+            "max_lag": round(max(self._lags, default=0.0), 4),
+            "stalled": behind > self.threshold,
+            "stalls": self.stalls,
+            "last_profile": self.last_profile,
+        }
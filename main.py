@@ -1,24 +1,24 @@
 import os
 import logging
-from flask import Flask
 from threading import Thread
-from telegram import Update, ReplyKeyboardMarkup
-from telegram.ext import (
-    Application,
-    CommandHandler,
-    MessageHandler,
-    ContextTypes,
-    filters,
-)
-from rules import RULES
+from flask import Flask, Response, abort, jsonify, request
+import health
+import logs
 
 # --- Логирование ---
-logging.basicConfig(
-    format="%(asctime)s - %(name)s - %(levelname)s - %(message)s",
-    level=logging.INFO
-)
+# JSON через очередь и фоновый поток, см. logs.py
+logs.setup()
 logger = logging.getLogger(__name__)
 
+# --- Быстрый запуск ---
+# gunicorn импортирует main:app и открывает порт, только когда импорт
+# закончился. Поэтому здесь лишь Flask и проверки здоровья, а бот
+# (python-telegram-bot, индексы, инициализация) импортируется и
+# запускается в фоновом потоке. Render видит живой процесс через доли
+# секунды, а /readyz отвечает 200, когда бот принимает обновления.
+WEBHOOK_SECRET = os.environ.get("WEBHOOK_SECRET")
+bot = None
+
 # --- Flask для Render ---
 app = Flask(__name__)
 
@@ -26,78 +26,55 @@ app = Flask(__name__)
 def home():
     return "Bot is running!"
 
-# --- Переменная окружения ---
-BOT_TOKEN = os.environ.get("BOT_TOKEN")
-
-# --- Клавиатура ---
-def main_keyboard():
-    keyboard = [
-        ["📚 Синтаксис", "📦 Части речи"],
-        ["✍️ Орфография", "⚡ Глаголы"],
-        ["📑 Все темы", "❓ Помощь"]
-    ]
-    return ReplyKeyboardMarkup(keyboard, resize_keyboard=True)
-
-# --- Команды ---
-async def cmd_start(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    await update.message.reply_text(
-        "👋 Привет! Я бот по русскому языку для 3 класса.\n\n"
-        "Выбирай раздел на клавиатуре или напиши название темы.\n"
-        "Команды:\n"
-        "/rules — список всех тем\n"
-        "/help — подсказка.",
-        reply_markup=main_keyboard()
-    )
-
-async def cmd_help(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    await update.message.reply_text(
-        "ℹ️ Используй кнопки или напиши название темы.\n"
-        "/rules — полный список тем."
-    )
-
-async def cmd_rules(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    text = "📑 <b>Все доступные темы:</b>\n\n"
-    for key, data in RULES.items():
-        text += f"- {data['title']}\n"
-    await update.message.reply_text(text, parse_mode="HTML")
-
-async def handle_message(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    query = update.message.text.lower().strip()
-
-    for key, data in RULES.items():
-        if query in key or query in data["title"].lower():
-            text = f"<b>{data['title']}</b>\n\n"
-            text += f"<b>Правило:</b> {data['rule']}\n\n"
-            text += "<b>Примеры:</b>\n" + "\n".join(data["examples"])
-            await update.message.reply_text(text, parse_mode="HTML")
-            return
-
-    await update.message.reply_text("❌ Тема не найдена. Используй /rules")
+@app.route("/healthz")
+def healthz():
+    return jsonify(health.status())
+
+@app.route("/readyz")
+def readyz():
+    return jsonify(health.status()), 200 if health.READY.is_set() else 503
+
+@app.route("/metrics")
+def prometheus_metrics():
+    # Метрики появляются вместе с ботом
+    import metrics
+    return Response(metrics.REGISTRY.render(), mimetype="text/plain; version=0.0.4")
+
+# --- Webhook: Telegram присылает обновления POST-запросом ---
+@app.post("/webhook")
+def webhook():
+    if WEBHOOK_SECRET and request.headers.get("X-Telegram-Bot-Api-Secret-Token") != WEBHOOK_SECRET:
+        abort(403)
+    # Бот ещё запускается: 503 — Telegram пришлёт обновление ещё раз
+    if not health.READY.is_set():
+        abort(503)
+    data = request.get_json(force=True, silent=True)
+    if not isinstance(data, dict):
+        abort(400)
+    if not bot.receive(data, request.get_data()):
+        abort(503)
+    return "ok"
 
 # --- Основной запуск ---
 def run_flask():
     port = int(os.environ.get("PORT", 5000))
     app.run(host="0.0.0.0", port=port)
 
-def main():
-    if not BOT_TOKEN:
-        logger.error("❌ BOT_TOKEN не найден!")
-        return
-
-    tg_app = Application.builder().token(BOT_TOKEN).build()
-
-    tg_app.add_handler(CommandHandler("start", cmd_start))
-    tg_app.add_handler(CommandHandler("help", cmd_help))
-    tg_app.add_handler(CommandHandler("rules", cmd_rules))
-    tg_app.add_handler(MessageHandler(filters.TEXT & ~filters.COMMAND, handle_message))
-
-    logger.info("✅ Бот запущен...")
-
-    # Запускаем Flask в отдельном потоке
-    Thread(target=run_flask, daemon=True).start()
-
-    tg_app.run_polling(drop_pending_updates=True)
-
-
-# Запускаем сразу при загрузке (важно для Render!)
-main()
+def start_bot():
+    global bot
+    try:
+        import bot as module
+        bot = module
+        health.mark("import")
+        bot.main()
+    except Exception as exc:
+        logger.exception("❌ Бот не запустился")
+        health.fail(repr(exc))
+
+# Запускаем сразу при загрузке (важно для Render!), но в фоне: порт
+# открывается, не дожидаясь бота
+Thread(target=start_bot, daemon=True, name="startup").start()
+
+# python main.py: gunicorn нет, поэтому Flask поднимаем сами
+if __name__ == "__main__":
+    run_flask()
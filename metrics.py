@@ -0,0 +1,171 @@
+import time
+from bisect import bisect_left
+from functools import wraps
+
+from telegram.request import BaseRequest
+
+import logs
+
+# --- Метрики в текстовом формате Prometheus ---
+# Пишет в метрики только поток event loop бота, поэтому блокировок нет:
+# запись — это пара операций со списком или словарём под GIL. Flask
+# читает значения из своего потока; в худшем случае выдача на долю
+# секунды отстаёт от счётчиков, для мониторинга это неважно.
+BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+def _labels(names, values, extra=""):
+    parts = [f'{n}="{v}"' for n, v in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+class Counter:
+    kind = "counter"
+
+    def __init__(self, name, help, labels=()):
+        self.name = name
+        self.help = help
+        self.labels = labels
+        self._values = {}
+
+    def inc(self, *labels, amount=1):
+        self._values[labels] = self._values.get(labels, 0) + amount
+
+    def value(self, *labels):
+        return self._values.get(labels, 0)
+
+    def samples(self):
+        for labels, value in sorted(self._values.items()):
+            yield f"{self.name}{_labels(self.labels, labels)} {value}"
+
+
+class Gauge:
+    kind = "gauge"
+
+    def __init__(self, name, help, read, labels=()):
+        """read() — значение, а с labels — словарь {значения меток: значение}."""
+        self.name = name
+        self.help = help
+        self.read = read
+        self.labels = labels
+
+    def samples(self):
+        if not self.labels:
+            yield f"{self.name} {self.read()}"
+            return
+        for labels, value in sorted(self.read().items()):
+            yield f"{self.name}{_labels(self.labels, labels)} {value}"
+
+
+class ReadCounter(Gauge):
+    """Счётчик, который ведут вне метрик (например, logs.dropped): значения
+    берёт read(), как у Gauge, но для Prometheus это counter."""
+
+    kind = "counter"
+
+
+class Histogram:
+    kind = "histogram"
+
+    def __init__(self, name, help, labels=(), buckets=BUCKETS):
+        self.name = name
+        self.help = help
+        self.labels = labels
+        self.buckets = buckets
+        self._series = {}
+
+    def observe(self, value, *labels):
+        series = self._series.get(labels)
+        if series is None:
+            # [счётчики по корзинам..., +Inf, сумма]
+            series = self._series[labels] = [0] * (len(self.buckets) + 1) + [0.0]
+        series[bisect_left(self.buckets, value)] += 1
+        series[-1] += value
+
+    def samples(self):
+        for labels, series in sorted(self._series.items()):
+            total = 0
+            for bound, count in zip(self.buckets + ("+Inf",), series):
+                total += count
+                le = _labels(self.labels, labels, f'le="{bound}"')
+                yield f"{self.name}_bucket{le} {total}"
+            yield f"{self.name}_sum{_labels(self.labels, labels)} {series[-1]:.6f}"
+            yield f"{self.name}_count{_labels(self.labels, labels)} {total}"
+
+
+class Registry:
+    def __init__(self):
+        self.metrics = []
+
+    def add(self, metric):
+        self.metrics.append(metric)
+        return metric
+
+    def render(self):
+        lines = []
+        for metric in self.metrics:
+            lines.append(f"# HELP {metric.name} {metric.help}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            lines.extend(metric.samples())
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+
+HANDLER_SECONDS = REGISTRY.add(Histogram(
+    "bot_handler_seconds", "Время работы обработчика", ("handler",)))
+MESSAGES = REGISTRY.add(Counter(
+    "bot_messages_total", "Текстовые запросы по способу, которым нашлась тема", ("result",)))
+API_SECONDS = REGISTRY.add(Histogram(
+    "bot_api_seconds", "Время вызова Bot API", ("method",)))
+API_ERRORS = REGISTRY.add(Counter(
+    "bot_api_errors_total", "Ошибки Bot API по методу и коду (429 — flood wait)", ("method", "code")))
+
+
+def timed(name, callback):
+    """Обёртка обработчика, которая пишет его время в HANDLER_SECONDS, а
+    поля обновления — во все записи лога, сделанные при его обработке."""
+    @wraps(callback)
+    async def wrapper(update, context):
+        start = time.perf_counter()
+        token = logs.begin(update, name)
+        try:
+            return await callback(update, context)
+        finally:
+            spent = time.perf_counter() - start
+            HANDLER_SECONDS.observe(spent, name)
+            logs.end(token, spent)
+    return wrapper
+
+
+class MeteredRequest(BaseRequest):
+    """Пропускает вызовы Bot API через другой BaseRequest и меряет их."""
+
+    def __init__(self, request):
+        self.request = request
+
+    @property
+    def read_timeout(self):
+        return self.request.read_timeout
+
+    async def initialize(self):
+        await self.request.initialize()
+
+    async def shutdown(self):
+        await self.request.shutdown()
+
+    async def do_request(self, url, method, request_data=None, *args, **kwargs):
+        api_method = url.rsplit("/", 1)[-1]
+        start = time.perf_counter()
+        try:
+            code, payload = await self.request.do_request(url, method, request_data, *args, **kwargs)
+        except Exception:
+            API_ERRORS.inc(api_method, "exception")
+            raise
+        finally:
+            API_SECONDS.observe(time.perf_counter() - start, api_method)
+        if code >= 400:
+            API_ERRORS.inc(api_method, str(code))
+        return code, payload
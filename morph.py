@@ -0,0 +1,111 @@
+import heapq
+from functools import lru_cache
+
+import snowballstemmer
+
+from chunks import ChunkMap, Chunks, TidSet
+from fuzzy import words
+from search import Numbering, _cow
+
+# --- Нормализация словоформ ---
+# «глаголы», «глаголов», «о существительных» сводятся к основам слов
+# (стеммер Snowball, работает без сети). Основы ключей и заголовков
+# считаются один раз при загрузке, а запросы нормализуются через кэш, так
+# что стеммер почти не вызывается. Тексты правил ищет fulltext.TextIndex.
+CACHE_SIZE = 10_000
+
+# Служебные слова ничего не говорят о теме. «не» сюда не входит:
+# есть тема «не с глаголами».
+STOP_WORDS = {"а", "в", "во", "и", "к", "ко", "на", "о", "об", "обо", "по", "про", "с", "со", "у", "для", "что", "как", "это", "такое"}
+
+_stemmer = snowballstemmer.stemmer("russian")
+
+
+@lru_cache(CACHE_SIZE)
+def stem(word):
+    return _stemmer.stemWord(word.replace("ё", "е"))
+
+
+def _normalize(text):
+    return tuple(dict.fromkeys(stem(w) for w in words(text) if w not in STOP_WORDS))
+
+
+@lru_cache(CACHE_SIZE)
+def normalize(text):
+    """Основы значимых слов без повторов, в порядке появления."""
+    return _normalize(text)
+
+
+class LemmaIndex:
+    def __init__(self, topics, numbering=None):
+        """topics — пары (ключ, заголовок) в порядке RULES."""
+        topics = dict(topics)
+        self.numbering = numbering or Numbering(topics)
+        self._stems = Chunks()
+        self._head = ChunkMap()  # основа ключа или заголовка -> TidSet
+        self._apply({}, topics, {})
+
+    @property
+    def keys(self):
+        return self.numbering.keys
+
+    def _apply(self, old, new, old_tids):
+        # Тексты индекса нормализуются без кэша запросов, чтобы не вытеснять из него запросы
+        touched = {}
+        self._stems.extend([()] * (len(self.keys) - len(self._stems)))
+        for key, title in old.items():
+            tid = old_tids[key]
+            for s in _normalize(key) + _normalize(title):
+                _cow(self._head, touched, s, TidSet).discard(tid)
+            self._stems[tid] = ()
+        for key, title in new.items():
+            tid = self.numbering.tids[key]
+            head = _normalize(key)
+            self._stems[tid] = head
+            for s in head + _normalize(title):
+                _cow(self._head, touched, s, TidSet).add(tid)
+        for s in touched:
+            if not self._head[s]:
+                del self._head[s]
+
+    def updated(self, numbering, old, new):
+        """Новый индекс: пересобраны только темы из old и new (см. TopicIndex.updated)."""
+        index = LemmaIndex.__new__(LemmaIndex)
+        index.numbering = numbering
+        index._stems = self._stems.copy()
+        index._head = self._head.copy()
+        index._apply(old, new, self.numbering.tids)
+        return index
+
+    def matches(self, query, limit=None):
+        """Подходящие темы (tid), самые близкие первыми."""
+        stems = normalize(query)
+        if not stems:
+            return []
+        sets = []
+        for s in stems:
+            tids = self._head.get(s)
+            if not tids:
+                return []
+            sets.append(tids)
+        sets.sort(key=len)
+        found = sets[0].intersection(*sets[1:])
+
+        # Ближе всего тема, в ключе которой меньше лишних слов
+        exact = set(stems)
+        size = len(exact)
+        order = self.numbering.rank
+        stems_of = self._stems.__getitem__
+
+        def rank(t):
+            # Основы ключа без повторов: совпадают с запросом, если их столько же и все из него
+            own = stems_of(t)
+            return len(own) != size or not exact.issuperset(own), len(own), order[t]
+
+        if limit is None:
+            return sorted(found, key=rank)
+        return heapq.nsmallest(limit, found, key=rank)
+
+    def lookup(self, query):
+        found = self.matches(query, 1)
+        return self.keys[found[0]] if found else None
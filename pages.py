@@ -0,0 +1,144 @@
+import json
+import zlib
+
+from telegram import InlineKeyboardButton, InlineKeyboardMarkup
+
+from chunks import Chunks
+from render import NEXT_PAGE, PREV_PAGE, section_page, topic_page
+
+# --- Список тем /rules по страницам ---
+# Один список всех тем перерос бы лимит сообщения Telegram. /rules
+# показывает страницу из PAGE_SIZE кнопок тем и ◀ ▶; листание правит то же
+# сообщение. Страницы с клавиатурами собираются вместе со снимком, поэтому
+# листание — это выбор готовой страницы по номеру. Меню разделов листаются
+# так же и собраны из тех же кнопок тем.
+PAGE_SIZE = 10
+PAGE_PREFIX = "page"
+# В callback_data кнопки темы — номер темы и контрольная сумма ключа. Номер
+# за ключом закреплён навсегда (см. Numbering), но не переживает
+# перезапуск бота; по сумме видно, что кнопка из старого сообщения
+# указывает уже на другую тему.
+TOPIC_PREFIX = "topic"
+# Страницы разделов: section:<номер раздела в SECTIONS>:<страница>
+SECTION_PREFIX = "section"
+
+
+def topic_data(tid, key):
+    return f"{TOPIC_PREFIX}:{tid}:{zlib.crc32(key.encode()) & 0xffff:x}"
+
+
+def _count(topics, size):
+    return max(1, -(-topics // size))
+
+
+def _page(text, buttons, page, count, prefix):
+    rows = [[button] for button in buttons]
+    nav = []
+    if page > 0:
+        nav.append(InlineKeyboardButton(PREV_PAGE, callback_data=f"{prefix}:{page - 1}"))
+    if page < count - 1:
+        nav.append(InlineKeyboardButton(NEXT_PAGE, callback_data=f"{prefix}:{page + 1}"))
+    if nav:
+        rows.append(nav)
+    return text, InlineKeyboardMarkup(rows)
+
+
+class TopicPages:
+    def __init__(self, topics, numbering, size=PAGE_SIZE):
+        """topics — пары (ключ, заголовок) в порядке RULES."""
+        self.numbering = numbering
+        self.size = size
+        self._buttons = Chunks()  # tid -> кнопка темы
+        self._apply({}, dict(topics), {})
+        self._pages = Chunks(self._page(page) for page in range(self._count()))
+
+    def _apply(self, old, new, old_tids):
+        self._buttons.extend([None] * (len(self.numbering.keys) - len(self._buttons)))
+        for key in old:
+            self._buttons[old_tids[key]] = None
+        for key, title in new.items():
+            tid = self.numbering.tids[key]
+            self._buttons[tid] = InlineKeyboardButton(title, callback_data=topic_data(tid, key))
+
+    def _count(self):
+        return _count(len(self.numbering.order), self.size)
+
+    def _page(self, page):
+        count = self._count()
+        tids = self.numbering.order[page * self.size:(page + 1) * self.size]
+        return _page(topic_page(page, count), [self._buttons[tid] for tid in tids], page, count, PAGE_PREFIX)
+
+    def __len__(self):
+        return len(self._pages)
+
+    def button(self, tid):
+        return self._buttons[tid]
+
+    def page(self, number):
+        """(текст, клавиатура) страницы; за концом списка — последняя."""
+        return self._pages[max(0, min(number, len(self._pages) - 1))]
+
+    def updated(self, numbering, old, new):
+        """Новые страницы: кнопки пересобраны только для тем из old и new
+        (см. TopicIndex.updated). Если порядок тем прежний, пересобираются
+        только страницы с этими темами, иначе — все."""
+        pages = TopicPages.__new__(TopicPages)
+        pages.numbering = numbering
+        pages.size = self.size
+        pages._buttons = self._buttons.copy()
+        pages._apply(old, new, self.numbering.tids)
+        if numbering is self.numbering:
+            pages._pages = self._pages.copy()
+            for page in {numbering.rank[numbering.tids[key]] // self.size for key in new}:
+                pages._pages[page] = pages._page(page)
+        else:
+            pages._pages = Chunks(pages._page(page) for page in range(pages._count()))
+        return pages
+
+
+class SectionPages:
+    """Меню разделов по страницам из тех же кнопок тем, что у TopicPages."""
+
+    def __init__(self, sections, topics, size=PAGE_SIZE):
+        """sections — четвёрки из ContentStore.sections(), topics — TopicPages."""
+        self.size = size
+        self.buttons = []  # тексты кнопок разделов в порядке SECTIONS
+        self._digests = []
+        self._pages = []
+        self._apply(sections, topics)
+
+    def _apply(self, sections, topics, old=None):
+        for pos, (name, button, keys, digest) in enumerate(sections):
+            self.buttons.append(button)
+            self._digests.append(digest)
+            if old is not None and pos < len(old._digests) and old._digests[pos] == digest:
+                # Ни кнопка, ни темы раздела не менялись
+                self._pages.append(old._pages[pos])
+            else:
+                self._pages.append(self._section(pos, button, json.loads(keys), topics))
+
+    def _section(self, pos, button, keys, topics):
+        tids = [topics.numbering.tids[key] for key in keys]
+        count = _count(len(tids), self.size)
+        return [
+            _page(section_page(button, page, count),
+                  [topics.button(tid) for tid in tids[page * self.size:(page + 1) * self.size]],
+                  page, count, f"{SECTION_PREFIX}:{pos}")
+            for page in range(count)
+        ]
+
+    def page(self, section, number):
+        """(текст, клавиатура) страницы раздела или None, если раздела больше нет."""
+        if not 0 <= section < len(self._pages):
+            return None
+        pages = self._pages[section]
+        return pages[max(0, min(number, len(pages) - 1))]
+
+    def updated(self, sections, topics):
+        """Новые меню: страницы пересобираются только у разделов, у которых
+        изменился отпечаток (кнопка, ключи или заголовки тем)."""
+        new = SectionPages.__new__(SectionPages)
+        new.size = self.size
+        new.buttons, new._digests, new._pages = [], [], []
+        new._apply(sections, topics, self)
+        return new
@@ -0,0 +1,205 @@
+import copy
+import hashlib
+import heapq
+import json
+import random
+import re
+
+from telegram import InlineKeyboardButton, InlineKeyboardMarkup
+
+import metrics
+from fuzzy import words
+from render import quiz_card, quiz_result
+
+# --- Викторина /quiz по примерам из правил ---
+# Вопросы собираются вместе с rules.sqlite. Пример с пометкой в скобках
+# («Сегодня хорошая погода. (повествовательное)») или после тире
+# («Мама читает книгу — предложение.») даёт вопрос, пометка — верный
+# ответ, а неверные варианты берутся из пометок той же группы: в группу
+# попадают пометки одной темы и тем, где встречаются общие пометки.
+#
+# Повторение — по системе Лейтнера: верный ответ переносит вопрос в
+# следующую коробку с интервалом подлиннее, неверный возвращает в первую.
+# Повторения ученика лежат в куче по времени, поэтому следующий вопрос
+# выбирается за O(log n). Состояние хранится в chat_data и сохраняется
+# вместе с сессией.
+CHOICES = 4
+MAX_LABEL = 25
+# Интервал для каждой коробки, секунды
+INTERVALS = (60, 10 * 60, 3600, 24 * 3600, 3 * 24 * 3600, 7 * 24 * 3600, 30 * 24 * 3600)
+PREFIX = "quiz"
+
+ANSWERS = metrics.REGISTRY.add(metrics.Counter(
+    "bot_quiz_answers_total", "Ответы в викторине", ("result",)))
+
+_PAREN = re.compile(r"^([^()]+?)\s*\(([^()]+)\)$")
+_DASH = re.compile(r"^([^—]+?) — ([^—]+)$")
+
+
+def _overlap(question, answer):
+    # «друг — дружба», «кот — котик»: ответ виден в самом вопросе
+    q, a = words(question), words(answer)
+    return any(x[:3] in y for x in q for y in a if len(x) >= 3) or any(
+        y[:3] in x for x in q for y in a if len(y) >= 3
+    )
+
+
+def split_example(example):
+    """(вопрос, ответ) из примера с пометкой или None."""
+    example = example.strip()
+    for pattern in (_PAREN, _DASH):
+        m = pattern.match(example)
+        if m is None:
+            continue
+        question, answer = m.group(1).strip(), m.group(2).strip()
+        if answer.endswith(".") and answer.count(".") == 1:
+            # Точка конца предложения, а не сокращения «ж.р.»
+            answer = answer[:-1]
+        # Пометки-пояснения («главное: читать, зависимое: книгу») не годятся в варианты
+        if len(answer) > MAX_LABEL or set(answer) & set(":,—") or _overlap(question, answer):
+            return None
+        return question, answer
+    return None
+
+
+def _families(labelled):
+    # Объединение пометок: одна тема или общая пометка — одна группа
+    parent = {}
+
+    def find(x):
+        while parent.setdefault(x, x) != x:
+            parent[x] = parent[parent[x]]
+            x = parent[x]
+        return x
+
+    for labels in labelled.values():
+        labels = list(labels)
+        for label in labels[1:]:
+            parent[find(label)] = find(labels[0])
+    families = {}
+    for labels in labelled.values():
+        for label in labels:
+            families.setdefault(find(label), set()).add(label)
+    return {label: families[find(label)] for label in parent}
+
+
+def question_id(key, example):
+    # Стабилен между сборками: прогресс учеников переживает правку других тем
+    return hashlib.sha1(f"{key}\0{example}".encode()).hexdigest()[:10]
+
+
+def build_questions(rules):
+    """Вопросы (id, ключ темы, текст, варианты, номер верного) в порядке RULES."""
+    found = []
+    labelled = {}
+    for key, data in rules.items():
+        for example in data["examples"]:
+            pair = split_example(example)
+            if pair is not None:
+                found.append((key, example, *pair))
+                labelled.setdefault(key, []).append(pair[1])
+    families = _families(labelled)
+
+    questions = []
+    for key, example, question, answer in found:
+        wrong = sorted(families[answer] - {answer})
+        if not wrong:
+            continue
+        qid = question_id(key, example)
+        rnd = random.Random(qid)
+        choices = rnd.sample(wrong, min(len(wrong), CHOICES - 1))
+        position = rnd.randrange(len(choices) + 1)
+        choices.insert(position, answer)
+        questions.append((qid, key, question, choices, position))
+    return questions
+
+
+class QuizBank:
+    def __init__(self, rows, title):
+        """rows — (id, ключ темы, вопрос, варианты JSON, номер верного) в порядке RULES,
+        title(ключ) — заголовок темы."""
+        self.title = title
+        self.order = []
+        self._rows = {}
+        for qid, key, question, choices, answer in rows:
+            self._rows[qid] = (key, question, choices, answer)
+            self.order.append(qid)
+        # Варианты и клавиатура вопроса собираются при первом показе: из
+        # десятков тысяч вопросов ученики видят малую часть
+        self._built = {}
+
+    def rebound(self, title):
+        """Тот же банк для снимка, где вопросы не менялись: общие вопросы и
+        клавиатуры, заголовки тем — новые."""
+        bank = copy.copy(self)
+        bank.title = title
+        return bank
+
+    def __contains__(self, qid):
+        return qid in self._rows
+
+    def __len__(self):
+        return len(self.order)
+
+    def _choices(self, qid):
+        built = self._built.get(qid)
+        if built is None:
+            choices = json.loads(self._rows[qid][2])
+            keyboard = InlineKeyboardMarkup([
+                [InlineKeyboardButton(choice, callback_data=f"{PREFIX}:{qid}:{i}")]
+                for i, choice in enumerate(choices)
+            ])
+            built = self._built[qid] = (choices, keyboard)
+        return built
+
+    def card(self, qid):
+        """Текст вопроса и клавиатура с вариантами."""
+        key, question, _, _ = self._rows[qid]
+        return quiz_card(self.title(key), question), self._choices(qid)[1]
+
+    def check(self, qid, choice):
+        key, question, _, answer = self._rows[qid]
+        choices = self._choices(qid)[0]
+        correct = choice == answer
+        return correct, quiz_result(self.title(key), question, choices[answer], correct)
+
+
+def state(chat_data):
+    # due — куча [время, id]; box — коробка каждого пройденного вопроса;
+    # new — сколько вопросов банка уже выдано впервые; asked — текущий вопрос
+    return chat_data.setdefault("quiz", {"due": [], "box": {}, "new": 0, "asked": None})
+
+
+def next_question(quiz, bank, now):
+    """id следующего вопроса: сначала текущий, потом пора повторить, потом новый."""
+    if quiz["asked"] in bank:
+        return quiz["asked"]
+    due = quiz["due"]
+    # Вопросы, пропавшие после перезагрузки контента, выбрасываются по пути
+    while due and due[0][1] not in bank:
+        heapq.heappop(due)
+
+    qid = None
+    if due and due[0][0] <= now:
+        qid = heapq.heappop(due)[1]
+    else:
+        while quiz["new"] < len(bank.order):
+            candidate = bank.order[quiz["new"]]
+            quiz["new"] += 1
+            if candidate not in quiz["box"]:
+                qid = candidate
+                break
+        if qid is None and due:
+            # Новых нет и повторять рано — берём ближайший
+            qid = heapq.heappop(due)[1]
+    quiz["asked"] = qid
+    return qid
+
+
+def grade(quiz, qid, correct, now):
+    box = quiz["box"].get(qid, 0)
+    box = min(box + 1, len(INTERVALS)) if correct else 1
+    quiz["box"][qid] = box
+    heapq.heappush(quiz["due"], [now + INTERVALS[box - 1], qid])
+    quiz["asked"] = None
+    ANSWERS.inc("correct" if correct else "wrong")
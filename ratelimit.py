@@ -0,0 +1,129 @@
+import asyncio
+import heapq
+import itertools
+import logging
+import time
+
+from telegram.error import RetryAfter
+from telegram.ext import BaseRateLimiter
+
+# --- Очередь исходящих сообщений с учётом лимитов Telegram ---
+# Все вызовы Bot API проходят через Application.rate_limiter, поэтому
+# обработчики по-прежнему просто вызывают reply_text. Сначала запрос ждёт
+# своей очереди в чате, затем — общего окна (~30 сообщений в секунду),
+# где важнее тот, у кого меньше приоритет. Ответ с retry_after (429)
+# ставит на паузу все отправки, а сам запрос повторяется.
+logger = logging.getLogger(__name__)
+
+PRIORITY_REPLY = 0  # ответы на сообщения учеников
+PRIORITY_BULK = 10  # рассылки и прочее, что может подождать
+
+
+class TokenBucket:
+    """Ведро токенов в форме GCRA: reserve() сразу бронирует место и
+    возвращает, сколько секунд ждать до него."""
+
+    def __init__(self, rate, burst=1):
+        self.interval = 1 / rate
+        self.tolerance = (burst - 1) * self.interval
+        self._tat = 0.0
+
+    def reserve(self):
+        now = time.monotonic()
+        tat = max(self._tat, now)
+        self._tat = tat + self.interval
+        return max(0.0, tat - self.tolerance - now)
+
+    def idle(self, now):
+        return self._tat < now
+
+
+class PriorityRateLimiter(BaseRateLimiter):
+    def __init__(self, rate=30, chat_rate=1, group_rate=20 / 60, burst=3, max_retries=3):
+        self.rate = rate
+        self.chat_rate = chat_rate
+        self.group_rate = group_rate
+        self.burst = burst
+        self.max_retries = max_retries
+        self._global = TokenBucket(rate)
+        self._chats = {}
+        self._waiters = []
+        self._seq = itertools.count()
+        self._dispatcher = None
+        self._resume = None
+
+    async def initialize(self):
+        # Event создаётся уже внутри event loop бота
+        self._resume = asyncio.Event()
+        self._resume.set()
+
+    async def shutdown(self):
+        if self._dispatcher is not None:
+            self._dispatcher.cancel()
+            self._dispatcher = None
+
+    @property
+    def pending(self):
+        # Не __len__: ExtBot проверяет «if self.rate_limiter», и пустая
+        # очередь отключила бы лимитер
+        return len(self._waiters)
+
+    def _chat_bucket(self, chat_id):
+        bucket = self._chats.get(chat_id)
+        if bucket is None:
+            if len(self._chats) > 10_000:
+                now = time.monotonic()
+                self._chats = {c: b for c, b in self._chats.items() if not b.idle(now)}
+            # Отрицательные id — группы, там лимит жёстче
+            rate = self.group_rate if str(chat_id).startswith("-") else self.chat_rate
+            bucket = self._chats[chat_id] = TokenBucket(rate, self.burst)
+        return bucket
+
+    async def _dispatch(self):
+        while self._waiters:
+            await self._resume.wait()
+            delay = self._global.reserve()
+            if delay:
+                await asyncio.sleep(delay)
+            # Пока ждали окна, мог прийти запрос важнее — берём вершину кучи
+            _, _, future = heapq.heappop(self._waiters)
+            if not future.done():
+                future.set_result(None)
+
+    async def _acquire(self, priority):
+        future = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._waiters, (priority, next(self._seq), future))
+        if self._dispatcher is None or self._dispatcher.done():
+            self._dispatcher = asyncio.create_task(self._dispatch())
+        await future
+
+    async def process_request(self, callback, args, kwargs, endpoint, data, rate_limit_args):
+        priority = PRIORITY_REPLY if rate_limit_args is None else rate_limit_args
+        chat_id = data.get("chat_id")
+
+        for attempt in range(self.max_retries + 1):
+            if chat_id is not None:
+                delay = self._chat_bucket(chat_id).reserve()
+                if delay:
+                    await asyncio.sleep(delay)
+            await self._acquire(priority)
+            await self._resume.wait()
+            try:
+                return await callback(*args, **kwargs)
+            except RetryAfter as exc:
+                if attempt == self.max_retries:
+                    raise
+                pause = exc.retry_after
+                pause = pause.total_seconds() if hasattr(pause, "total_seconds") else pause
+                logger.warning("Telegram просит подождать %.1f с (%s)", pause, endpoint)
+                await self._pause(pause)
+
+    async def _pause(self, seconds):
+        # Пауза общая: пока она идёт, не уходит ни один запрос
+        if not self._resume.is_set():
+            return await self._resume.wait()
+        self._resume.clear()
+        try:
+            await asyncio.sleep(seconds)
+        finally:
+            self._resume.set()
@@ -0,0 +1,51 @@
+import json
+import time
+from threading import Lock
+
+# --- Запись входящих обновлений ---
+# С RECORD_UPDATES=путь бот дописывает каждое принятое обновление в JSONL:
+# {"time": unix-время прихода, "update": {...}}. Такой файл проигрывает
+# bench.py replay (с теми же паузами, быстрее или подряд) и принимает
+# bench.py webhook --updates. В файле — сообщения учеников: включать на
+# время, нужное для записи, и не хранить дольше.
+FLUSH_SECONDS = 1
+
+
+class Recorder:
+    def __init__(self, path, flush=FLUSH_SECONDS):
+        self.path = path
+        self.flush = flush
+        self.count = 0
+        self._file = open(path, "a", encoding="utf-8", buffering=1 << 16)
+        # Flask принимает webhook в нескольких потоках
+        self._lock = Lock()
+        self._flushed = time.monotonic()
+
+    def write(self, data, body=None):
+        """Дописывает обновление. body — его JSON в байтах, если уже есть."""
+        now = time.time()
+        if body is not None and b"\n" not in body:
+            update = body.decode()
+        else:
+            update = json.dumps(data, ensure_ascii=False)
+        line = f'{{"time": {now:.3f}, "update": {update}}}\n'
+        with self._lock:
+            self._file.write(line)
+            self.count += 1
+            # На диск — раз в flush секунд, а не на каждое обновление
+            if time.monotonic() - self._flushed >= self.flush:
+                self._file.flush()
+                self._flushed = time.monotonic()
+
+    def close(self):
+        with self._lock:
+            if not self._file.closed:
+                self._file.close()
+
+
+def read(path):
+    """[(время, JSON обновления)] из записи; строки без времени — с None."""
+    with open(path, encoding="utf-8") as f:
+        entries = [json.loads(line) for line in f if line.strip()]
+    return [(entry.get("time"), entry["update"]) if "update" in entry else (None, entry)
+            for entry in entries]
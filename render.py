@@ -0,0 +1,61 @@
+from html import escape
+
+# --- Готовые тексты ответов ---
+# Всё содержимое RULES статично, поэтому HTML для каждой темы и для списка
+# тем собирается один раз при загрузке. Обработчикам остаётся только
+# взять готовую строку по ключу.
+LIMIT = 4096  # максимальная длина сообщения в Telegram
+
+FUZZY_HINT = "🔎 Возможно, нужна эта тема:\n\n"
+NOT_FOUND = "❌ Тема не найдена. Используй /rules"
+HELP = (
+    "ℹ️ Используй кнопки или напиши название темы.\n"
+    "/rules — полный список тем."
+)
+QUIZ_EMPTY = "🧩 Вопросов для викторины пока нет."
+QUIZ_DONE = "Этот вопрос уже позади 🙂"
+TOPIC_GONE = "Этой темы уже нет, напиши её название ещё раз"
+DAILY_HEADER = "📅 <b>Правило дня</b>\n\n"  # не длиннее FUZZY_HINT: под него оставлено место в карточке
+SUBSCRIBED = "📅 Готово! Каждый день буду присылать одно правило. Отписаться: /unsubscribe"
+UNSUBSCRIBED = "Больше не буду присылать правило дня. Подписаться снова: /subscribe"
+NO_HISTORY = "🕘 Пока нет открытых тем. Напиши название темы или используй /rules"
+ALL_TOPICS_BUTTON = "📑 Все темы"
+PREV_PAGE = "◀"
+NEXT_PAGE = "▶"
+HELP_BUTTON = "❓ Помощь"
+
+
+def _e(text):
+    return escape(text, quote=False)
+
+
+def rule_card(data):
+    return "".join((
+        f"<b>{_e(data['title'])}</b>\n\n",
+        f"<b>Правило:</b> {_e(data['rule'])}\n\n",
+        "<b>Примеры:</b>\n",
+        "\n".join(_e(example) for example in data["examples"]),
+    ))
+
+
+def topic_page(page, pages):
+    return f"📑 <b>Все доступные темы</b> ({page + 1} из {pages})\n\nВыбери тему, и я покажу правило."
+
+
+def history_list(titles):
+    lines = ["🕘 <b>Недавние темы:</b>\n"]
+    lines.extend(f"- {_e(title)}" for title in reversed(titles))
+    return "\n".join(lines)
+
+
+def quiz_card(title, question):
+    return f"🧩 <b>{_e(title)}</b>\n\n{_e(question)}\n\nВыбери ответ:"
+
+
+def quiz_result(title, question, answer, correct):
+    verdict = "✅ Верно!" if correct else "❌ Неверно."
+    return f"🧩 <b>{_e(title)}</b>\n\n{_e(question)}\n\n{verdict} Ответ: <b>{_e(answer)}</b>"
+
+
+def section_page(button, page, pages):
+    return f"<b>{_e(button)}</b> ({page + 1} из {pages})\n\nВыбери тему, и я покажу правило."
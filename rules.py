@@ -1,4 +1,20 @@
-RULES = {
+# Разделы главной клавиатуры: имя раздела -> текст кнопки
+SECTIONS = {
+    "syntax": "📚 Синтаксис",
+    "parts_of_speech": "📦 Части речи",
+    "spelling": "✍️ Орфография",
+    "verbs": "⚡ Глаголы",
+}
+
+
+def section(name, topics):
+    """Относит темы блока к разделу, если у темы не указан свой."""
+    for data in topics.values():
+        data.setdefault("section", name)
+    return topics
+
+
+RULES = section("syntax", {
     "предложение и словосочетание": {
         "title": "📝 Предложение и словосочетание",
         "rule": "Предложение выражает законченную мысль, а словосочетание — нет.",
@@ -63,7 +79,7 @@ RULES = {
         ]
     },
 
-    "памятка разбор предложения": {
+    "памятка разбор предложения по членам": {
         "title": "📋 Памятка «Как разобрать предложение по членам»",
         "rule": "1. Найти грамматическую основу. 2. Определить главные члены. 3. Выделить второстепенные. 4. Указать части речи.",
         "examples": [
@@ -73,6 +89,7 @@ RULES = {
 
     "всё о слове": {
         "title": "📖 Всё о слове. Звуки и буквы",
+        "section": "spelling",
         "rule": "Слово состоит из звуков и букв. Буквы мы пишем, а звуки произносим.",
         "examples": [
             "Слово «кот»: 3 буквы, 3 звука.",
@@ -82,6 +99,7 @@ RULES = {
 
     "омонимы и фразеологизмы": {
         "title": "✨ Омонимы и фразеологизмы",
+        "section": "spelling",
         "rule": "Омонимы — это слова, совпадающие по звучанию, но разные по смыслу. Фразеологизмы — устойчивые выражения.",
         "examples": [
             "ключ (родник) — ключ (от двери).",
@@ -91,14 +109,15 @@ RULES = {
 
     "звуко-буквенный разбор": {
         "title": "🔊 Звуко-буквенный разбор",
+        "section": "spelling",
         "rule": "1. Записать слово. 2. Поставить ударение. 3. Разделить на слоги. 4. Дать характеристику звуков.",
         "examples": [
             "КОТ: к — согласный, твёрдый, глухой; о — гласный, ударный; т — согласный, твёрдый, глухой."
         ]
     }
-}
+})
 # === Орфоэпия и буквы ===
-RULES.update({
+RULES.update(section("spelling", {
     "орфоэпия": {
         "title": "🗣 Орфоэпия",
         "rule": "Орфоэпия изучает правильное произношение слов. Иногда ударение и произношение отличаются от написания.",
@@ -207,9 +226,9 @@ RULES.update({
             "дома — основа дом-"
         ]
     }
-})
+}))
 # === Правописание ===
-RULES.update({
+RULES.update(section("spelling", {
     "правописание частей слова": {
         "title": "📝 Правописание частей слова",
         "rule": "Каждая часть слова (корень, приставка, суффикс, окончание) пишется по своим правилам.",
@@ -234,8 +253,8 @@ RULES.update({
             "гора — горы"
         ]
     }
-})
-RULES.update({
+}))
+RULES.update(section("spelling", {
     "парные согласные": {
         "title": "🔊 Парные согласные",
         "rule": "На конце слова и перед глухими согласными звонкие согласные оглушаются.",
@@ -262,8 +281,8 @@ RULES.update({
             "сердце, солнце, праздник"
         ]
     }
-})
-RULES.update({
+}))
+RULES.update(section("spelling", {
     "удвоенные согласные": {
         "title": "〰 Удвоенные согласные",
         "rule": "В некоторых словах пишутся две одинаковые согласные.",
@@ -291,8 +310,8 @@ RULES.update({
             "ключик — ключика (и сохраняется, значит -ик)"
         ]
     }
-})
-RULES.update({
+}))
+RULES.update(section("spelling", {
     "суффикс ок после шипящих": {
         "title": "🧩 Суффикс -ок после шипящих",
         "rule": "После шипящих в суффиксе -ок пишется О.",
@@ -321,8 +340,8 @@ RULES.update({
             "цирк"
         ]
     }
-})
-RULES.update({
+}))
+RULES.update(section("spelling", {
     "имена существительные на ий ия ие": {
         "title": "📘 Существительные на -ий, -ия, -ие",
         "rule": "В окончаниях этих существительных всегда пишется И.",
@@ -341,9 +360,9 @@ RULES.update({
             "семья, вьюга (Ь)"
         ]
     }
-})
+}))
 # === Части речи ===
-RULES.update({
+RULES.update(section("parts_of_speech", {
     "имя существительное": {
         "title": "📦 Имя существительное",
         "rule": "Имя существительное обозначает предмет и отвечает на вопросы кто? что?.",
@@ -368,8 +387,8 @@ RULES.update({
             "мальчик (м.р.), девочка (ж.р.), окно (ср.р.)"
         ]
     }
-})
-RULES.update({
+}))
+RULES.update(section("parts_of_speech", {
     "мягкий знак после шипящих": {
         "title": "✏ Мягкий знак (ь) после шипящих",
         "rule": "В именах существительных женского рода после шипящих на конце пишется мягкий знак.",
@@ -399,8 +418,8 @@ RULES.update({
             "Предложный — о ком? о чём?"
         ]
     }
-})
-RULES.update({
+}))
+RULES.update(section("parts_of_speech", {
     "именительный падеж": {
         "title": "📍 Именительный падеж",
         "rule": "Отвечает на вопросы кто? что?. Указывает на предмет. В предложении часто бывает подлежащим.",
@@ -454,8 +473,8 @@ RULES.update({
             "Говорю о маме. (о ком?)"
         ]
     }
-})
-RULES.update({
+}))
+RULES.update(section("parts_of_speech", {
     "разбор имени существительного": {
         "title": "📍 Разбор имени существительного как части речи",
         "rule": "Разбор имени существительного включает:\n1. Начальная форма (именительный падеж, ед. число).\n2. Род (мужской, женский, средний).\n3. Число (единственное или множественное).\n4. Падеж (по вопросам).\n5. Синтаксическая роль (подлежащее, дополнение и др.).",
@@ -464,8 +483,8 @@ RULES.update({
             "Друзья — начальная форма: друг; род: м.р.; число: мн.; падеж: им.; роль: подлежащее."
         ]
     }
-})
-RULES.update({
+}))
+RULES.update(section("parts_of_speech", {
     "распознавание прилагательных": {
         "title": "🎨 Распознавание имён прилагательных",
         "rule": "Имя прилагательное отвечает на вопросы «какой? какая? какое? какие?» и обозначает признак предмета. В предложении связано с существительным.",
@@ -518,8 +537,8 @@ RULES.update({
             "весёлый (от: весёлая, весёлое, весёлые)"
         ]
     }
-})
-RULES.update({
+}))
+RULES.update(section("parts_of_speech", {
     "местоимение": {
         "title": "🙋‍♂️ Местоимение",
         "rule": "Местоимение — часть речи, которая указывает на предметы, признаки или количество, но не называет их. Отвечает на вопросы существительных, прилагательных или числительных.",
@@ -538,8 +557,8 @@ RULES.update({
             "3-е лицо: он, она, оно, они"
         ]
     }
-})
-RULES.update({
+}))
+RULES.update(section("verbs", {
     "глагол": {
         "title": "⚡ Глагол",
         "rule": "Глагол — часть речи, которая обозначает действие или состояние предмета. Отвечает на вопросы: что делать? что сделать?",
@@ -605,10 +624,11 @@ RULES.update({
             "Читал: инфинитив — читать; вид — несовершенный; время — прошедшее; лицо — нет; число — единственное; род — мужской."
         ]
     }
-})
+}))
 RULES.update({
     "повторение частей речи": {
         "title": "🔄 Повторение частей речи",
+        "section": "parts_of_speech",
         "rule": "Повторим всё, что узнали о частях речи: существительное, прилагательное, местоимение, глагол. У каждой части речи есть свои вопросы, роль в предложении и особенности написания.",
         "examples": [
             "Существительное — что? кто?",
@@ -628,6 +648,7 @@ RULES.update({
     },
     "памятка разбор слова": {
         "title": "📖 Памятка по разбору слова",
+        "section": "spelling",
         "rule": "Чтобы разобрать слово по составу: выдели окончание, основу, корень, приставку и суффикс. Запомни: сначала находят форму слова, потом проверяют корень, приставку и суффикс.",
         "examples": [
             "лесник: корень — лес, суффикс — ник, окончание — нулевое",
@@ -636,6 +657,7 @@ RULES.update({
     },
     "памятка разбор предложения": {
         "title": "📝 Памятка по разбору предложения",
+        "section": "syntax",
         "rule": "1. Определи количество грамматических основ.\n2. Найди подлежащее и сказуемое.\n3. Укажи второстепенные члены.\n4. Определи вид предложения по цели и интонации.",
         "examples": [
             "Дети читают книги. (подлежащее — дети, сказуемое — читают, дополнение — книги)",
@@ -0,0 +1,191 @@
+import heapq
+from itertools import islice
+
+from chunks import ChunkMap, Chunks, TidSet
+
+# --- Индекс для поиска темы по подстроке ---
+# Каждой теме присваивается номер (tid) в порядке RULES. Для ключа и
+# заголовка (в нижнем регистре) сохраняются все n-граммы длиной 1..GRAM,
+# поэтому любой запрос сводится к пересечению нескольких списков тем
+# вместо прохода по всему RULES.
+GRAM = 3
+# Частые n-граммы («о», «ни»): совпадения густые, и первые limit тем
+# быстрее найти проходом по порядку RULES, чем собрать и упорядочить всех
+# кандидатов. Проход не длиннее WALK ожидаемых, дальше — обычный путь
+WALK = 4
+
+
+def _grams(text, n=GRAM):
+    size = len(text)
+    for length in range(1, n + 1):
+        for i in range(size - length + 1):
+            yield text[i:i + length]
+
+
+def _query_grams(query):
+    if len(query) <= GRAM:
+        return {query}
+    return {query[i:i + GRAM] for i in range(len(query) - GRAM + 1)}
+
+
+def _cow(container, touched, key, factory):
+    # Копирование при записи: внутренний список или множество копируется
+    # один раз за обновление (factory(старое) делит с ним неизменённые
+    # блоки, см. chunks.py), а старый снимок индекса остаётся нетронутым
+    value = touched.get(key)
+    if value is None:
+        value = touched[key] = factory(container.get(key, ()))
+        container[key] = value
+    return value
+
+
+class Numbering:
+    """Номера тем (tid), общие для всех индексов одного снимка.
+
+    Номер за ключом закрепляется навсегда: удалённая тема оставляет дыру,
+    новая получает следующий номер. Порядок RULES хранится отдельно
+    (order и rank), поэтому вставка темы в середину не перенумеровывает
+    остальные."""
+
+    def __init__(self, keys=()):
+        self.keys = list(keys)
+        self.tids = {key: tid for tid, key in enumerate(self.keys)}
+        self.order = list(range(len(self.keys)))
+        self.rank = list(range(len(self.keys)))
+
+    def __len__(self):
+        return len(self.tids)
+
+    def updated(self, keys):
+        """Нумерация для нового списка ключей (в новом порядке)."""
+        keys = list(keys)
+        new = Numbering()
+        new.keys = list(self.keys)
+        new.tids = dict(self.tids)
+        for key in self.tids.keys() - set(keys):
+            new.keys[new.tids.pop(key)] = None
+        for key in keys:
+            if key not in new.tids:
+                new.tids[key] = len(new.keys)
+                new.keys.append(key)
+        new.order = [new.tids[key] for key in keys]
+        new.rank = [len(keys)] * len(new.keys)
+        for pos, tid in enumerate(new.order):
+            new.rank[tid] = pos
+        return new
+
+
+class TopicIndex:
+    def __init__(self, topics, numbering=None):
+        """topics — пары (ключ, заголовок) в порядке RULES."""
+        topics = dict(topics)
+        self.numbering = numbering or Numbering(topics)
+        self.titles = Chunks()
+        self._postings = ChunkMap()  # n-грамма -> TidSet
+        self._apply({}, topics, {})
+
+    @property
+    def keys(self):
+        return self.numbering.keys
+
+    def __len__(self):
+        return len(self.numbering)
+
+    def _apply(self, old, new, old_tids):
+        touched = {}
+        tids = self.numbering.tids
+        self.titles.extend([None] * (len(self.keys) - len(self.titles)))
+        for key, title in old.items():
+            tid = old_tids[key]
+            for gram in set(_grams(key)) | set(_grams(title.lower())):
+                _cow(self._postings, touched, gram, TidSet).discard(tid)
+            self.titles[tid] = None
+        for key, title in new.items():
+            tid = tids[key]
+            title = title.lower()
+            self.titles[tid] = title
+            for gram in set(_grams(key)) | set(_grams(title)):
+                _cow(self._postings, touched, gram, TidSet).add(tid)
+        for gram in touched:
+            if not self._postings[gram]:
+                del self._postings[gram]
+
+    def updated(self, numbering, old, new):
+        """Новый индекс, где пересобраны только темы из old (прежние
+        заголовки изменённых и удалённых) и new (новые заголовки).
+        Остальное новый индекс делит со старым."""
+        index = TopicIndex.__new__(TopicIndex)
+        index.numbering = numbering
+        index.titles = self.titles.copy()
+        index._postings = self._postings.copy()
+        index._apply(old, new, self.numbering.tids)
+        return index
+
+    def _postings_of(self, query):
+        """Списки тем n-грамм запроса от самого короткого или None, если
+        какой-то n-граммы нет ни у одной темы."""
+        postings = []
+        for gram in _query_grams(query):
+            tids = self._postings.get(gram)
+            if not tids:
+                return None
+            postings.append(tids)
+        postings.sort(key=len)
+        return postings
+
+    def _contains(self, tid, query):
+        return query in self.keys[tid] or query in self.titles[tid]
+
+    def _verified(self, tids, query, limit):
+        found = []
+        for tid in tids:
+            if self._contains(tid, query):
+                found.append(tid)
+                if len(found) == limit:
+                    break
+        return found
+
+    def matches(self, query, limit=None):
+        """Подходящие темы (tid) в порядке RULES, не больше limit."""
+        if not query:
+            return self.numbering.order[:limit]
+        postings = self._postings_of(query)
+        if postings is None:
+            return []
+        size, smallest = len(self.numbering), len(postings[0])
+        if limit is not None and limit * size < smallest * smallest:
+            steps = WALK * limit * size // smallest
+            found = self._verified(islice(self.numbering.order, steps), query, limit)
+            if len(found) == limit or steps >= size:
+                return found
+        candidates = postings[0].intersection(*postings[1:])
+        rank = self.numbering.rank
+        if limit is None or len(candidates) <= limit:
+            return self._verified(sorted(candidates, key=rank.__getitem__), query, limit)
+        # Нужны первые limit по рангу: куча вместо сортировки всех кандидатов
+        heap = [(rank[tid], tid) for tid in candidates]
+        heapq.heapify(heap)
+        return self._verified((heapq.heappop(heap)[1] for _ in range(len(heap))), query, limit)
+
+    def first(self, query):
+        """Совместимый режим: первая тема в порядке RULES, как в старом цикле."""
+        found = self.matches(query, 1)
+        return self.keys[found[0]] if found else None
+
+    def best(self, query):
+        """Точное совпадение ключа или заголовка важнее порядка в RULES."""
+        tid = self.numbering.tids.get(query)
+        if tid is not None:
+            return self.keys[tid]
+        found = self.matches(query)
+        if not found:
+            return None
+        for tid in found:
+            if self.titles[tid].endswith(query) or self.keys[tid].startswith(query):
+                return self.keys[tid]
+        return self.keys[found[0]]
+
+    def lookup(self, query, mode="first"):
+        if mode == "best":
+            return self.best(query)
+        return self.first(query)
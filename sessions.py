@@ -0,0 +1,168 @@
+import asyncio
+import json
+import logging
+import os
+import sqlite3
+import time
+
+from telegram.ext import BasePersistence, PersistenceInput
+
+import metrics
+from shard import shard_of
+
+# --- Сессии чатов: последняя тема и история ---
+# Данные чата лежат в context.chat_data, как обычно в python-telegram-bot.
+# Application держит их в памяти и раз в FLUSH_INTERVAL секунд отдаёт
+# изменённые сюда; все они пишутся в SQLite (WAL) одной транзакцией в
+# отдельном потоке. Поток сообщений от класса не превращается в fsync на
+# каждое обновление, а при остановке бота остаток дописывается в flush().
+logger = logging.getLogger(__name__)
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+# Пустая строка — сессии не сохраняются между перезапусками
+SESSION_DB = os.environ.get("SESSION_DB", os.path.join(HERE, "sessions.sqlite"))
+FLUSH_INTERVAL = float(os.environ.get("SESSION_FLUSH_INTERVAL", 5))
+HISTORY_SIZE = 10
+
+SCHEMA = "CREATE TABLE IF NOT EXISTS chats (chat_id INTEGER PRIMARY KEY, data TEXT NOT NULL)"
+
+FLUSH_SECONDS = metrics.REGISTRY.add(metrics.Histogram(
+    "bot_session_flush_seconds", "Время записи пачки сессий в SQLite"))
+FLUSHED = metrics.REGISTRY.add(metrics.Counter(
+    "bot_session_writes_total", "Записанные и удалённые сессии чатов"))
+
+
+def remember(chat_data, key):
+    """Запоминает открытую тему: последняя — в конце истории, без повторов."""
+    history = [k for k in chat_data.get("history", ()) if k != key]
+    history.append(key)
+    chat_data["history"] = history[-HISTORY_SIZE:]
+    chat_data["last"] = key
+
+
+class SessionPersistence(BasePersistence):
+    def __init__(self, path=SESSION_DB, update_interval=FLUSH_INTERVAL, shard=None):
+        super().__init__(
+            store_data=PersistenceInput(bot_data=False, chat_data=True, user_data=False, callback_data=False),
+            update_interval=update_interval,
+        )
+        self.path = path
+        # (номер, всего): воркер загружает только сессии своих чатов
+        self.shard = shard
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        # WAL: чтение не ждёт записи, а synchronous=NORMAL синхронизирует
+        # диск на контрольных точках, а не на каждой транзакции
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.execute(SCHEMA)
+        self._pending = {}  # chat_id -> JSON или None, если сессию удалили
+        self._writer = None
+        self._scheduled = False
+        self._closing = False
+        self._lock = None
+
+    def _commit(self, batch):
+        start = time.perf_counter()
+        with self._db:
+            self._db.executemany(
+                "INSERT OR REPLACE INTO chats VALUES (?, ?)",
+                [(chat_id, data) for chat_id, data in batch.items() if data is not None],
+            )
+            self._db.executemany(
+                "DELETE FROM chats WHERE chat_id = ?",
+                [(chat_id,) for chat_id, data in batch.items() if data is None],
+            )
+        FLUSH_SECONDS.observe(time.perf_counter() - start)
+        FLUSHED.inc(amount=len(batch))
+
+    async def _write(self):
+        async with self._lock:
+            self._scheduled = False
+            # При остановке пул потоков может быть уже закрыт: всё, что
+            # осталось, пишет flush() в своём потоке
+            if self._closing or not self._pending:
+                return
+            batch, self._pending = self._pending, {}
+            try:
+                await asyncio.to_thread(self._commit, batch)
+            except BaseException as failure:
+                # Пачка не записана: она вернётся в следующую, более новые
+                # данные важнее. Задачу записи никто не ждёт, кроме flush(),
+                # поэтому сбой пишется в лог здесь
+                self._pending = {**batch, **self._pending}
+                if not isinstance(failure, Exception):
+                    raise
+                logger.warning("Фоновая запись сессий не удалась, пачка останется до следующей",
+                               exc_info=True)
+
+    def _schedule(self, chat_id, data):
+        # Application вызывает update_chat_data для всех изменённых чатов
+        # разом; запись запускается после них и забирает всю пачку
+        self._pending[chat_id] = data
+        if not self._scheduled:
+            self._scheduled = True
+            if self._lock is None:
+                self._lock = asyncio.Lock()
+            self._writer = asyncio.create_task(self._write())
+
+    async def get_chat_data(self):
+        rows = await asyncio.to_thread(lambda: self._db.execute("SELECT chat_id, data FROM chats").fetchall())
+        if self.shard is not None:
+            index, count = self.shard
+            rows = [(chat_id, data) for chat_id, data in rows if shard_of(chat_id, count) == index]
+        return {chat_id: json.loads(data) for chat_id, data in rows}
+
+    async def update_chat_data(self, chat_id, data):
+        self._schedule(chat_id, json.dumps(data, ensure_ascii=False))
+
+    async def drop_chat_data(self, chat_id):
+        self._schedule(chat_id, None)
+
+    async def refresh_chat_data(self, chat_id, chat_data):
+        pass
+
+    async def flush(self):
+        self._closing = True
+        if self._writer is not None:
+            # Несделанное писателем осталось в _pending, его сбой уже в логе
+            await asyncio.wait([self._writer])
+        try:
+            if self._pending:
+                self._commit(self._pending)
+                self._pending = {}
+        finally:
+            self._db.close()
+
+    # Остальное бот не хранит
+    async def get_user_data(self):
+        return {}
+
+    async def get_bot_data(self):
+        return {}
+
+    async def get_callback_data(self):
+        return None
+
+    async def get_conversations(self, name):
+        return {}
+
+    async def update_user_data(self, user_id, data):
+        pass
+
+    async def update_bot_data(self, data):
+        pass
+
+    async def update_callback_data(self, data):
+        pass
+
+    async def update_conversation(self, name, key, new_state):
+        pass
+
+    async def drop_user_data(self, user_id):
+        pass
+
+    async def refresh_user_data(self, user_id, user_data):
+        pass
+
+    async def refresh_bot_data(self, bot_data):
+        pass
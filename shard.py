@@ -0,0 +1,188 @@
+import asyncio
+import gc
+import json
+import logging
+import multiprocessing
+import os
+import signal
+from multiprocessing.connection import wait
+from threading import Lock, Thread
+
+from telegram import Update
+from telegram.error import NetworkError
+
+import metrics
+
+# --- Несколько процессов-воркеров ---
+# Главный процесс только принимает обновления (webhook или getUpdates) и
+# раскладывает их по воркерам по chat_id: все обновления чата попадают в
+# один воркер, поэтому порядок внутри чата и chat_data остаются там же.
+# Воркеры запускаются fork'ом, когда снимок контента уже собран, и делят
+# его страницы памяти с главным процессом; сам rules.sqlite каждый читает
+# через mmap из общего кэша страниц ОС. Упал воркер — главный процесс
+# завершается, и gunicorn перезапускает всё вместе.
+logger = logging.getLogger(__name__)
+
+ROUTED = metrics.REGISTRY.add(metrics.Counter(
+    "bot_shard_updates_total", "Обновления, переданные воркерам", ("shard",)))
+# /metrics отдаёт главный процесс, а метрики воркеров остаются в воркерах.
+# Опоздание event loop (см. loopwatch.py) воркеры пишут в общую память,
+# по числу на воркер, и главный процесс показывает последнее значение
+_lags = []
+_slot = None  # номер воркера в этом процессе
+LAGS = metrics.REGISTRY.add(metrics.Gauge(
+    "bot_shard_loop_lag_seconds", "Последнее опоздание event loop воркера",
+    lambda: {(str(index),): lag for index, lag in enumerate(_lags)}, ("shard",)))
+
+
+def shard_key(data):
+    """Чат обновления из его JSON, а без чата — ("user", id), как chat_key."""
+    for body in data.values():
+        if not isinstance(body, dict):
+            continue
+        chat = body.get("chat") or (body.get("message") or {}).get("chat")
+        if chat:
+            return chat["id"]
+        user = body.get("from") or body.get("user")
+        if user:
+            return ("user", user["id"])
+    return None
+
+
+def shard_of(key, count):
+    # У лички chat_id равен id пользователя: его инлайн-запросы идут туда же
+    if key is None:
+        return 0
+    if isinstance(key, tuple):
+        key = key[1]
+    return key % count
+
+
+def report_lag(seconds):
+    """Опоздание event loop этого воркера для /metrics главного процесса."""
+    if _slot is not None:
+        _lags[_slot] = seconds
+
+
+def _child(target, index, conn, senders):
+    global _slot
+    _slot = index
+    # Чужие концы каналов закрываем, иначе воркер не узнает, что главный
+    # процесс закрыл свой
+    for sender in senders:
+        sender.close()
+    # Ctrl+C приходит всей группе процессов; воркер останавливается сам,
+    # когда главный процесс закроет канал. Обработчики gunicorn не наследуем
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    for sig in (signal.SIGTERM, signal.SIGQUIT, signal.SIGUSR1, signal.SIGUSR2, signal.SIGHUP):
+        signal.signal(sig, signal.SIG_DFL)
+    target(index, conn)
+
+
+class Shards:
+    def __init__(self, count, target):
+        """Запускает count воркеров: target(номер, канал) в каждом.
+
+        Вызывать до того, как в процессе появятся потоки и event loop."""
+        context = multiprocessing.get_context("fork")
+        # Всё, что уже собрано, переходит в постоянное поколение: сборщик
+        # мусора в воркерах не обходит эти объекты и не копирует их страницы
+        gc.freeze()
+        global _lags
+        _lags = context.Array("d", count, lock=False)
+        self._senders = []
+        self._locks = []
+        self.processes = []
+        self._stopping = False
+        for index in range(count):
+            receiver, sender = context.Pipe(duplex=False)
+            self._senders.append(sender)
+            self._locks.append(Lock())
+            process = context.Process(
+                target=_child, args=(target, index, receiver, list(self._senders)),
+                name=f"shard-{index}", daemon=True,
+            )
+            process.start()
+            receiver.close()
+            self.processes.append(process)
+        Thread(target=self._watch, daemon=True, name="shards").start()
+
+    def __len__(self):
+        return len(self.processes)
+
+    def route(self, data, body=None):
+        """Передаёт обновление воркеру его чата. body — тот же JSON в байтах, если есть."""
+        index = shard_of(shard_key(data), len(self.processes))
+        if body is None:
+            body = json.dumps(data).encode()
+        try:
+            # Flask обслуживает запросы в нескольких потоках, а сообщение
+            # в канал должно уйти целиком
+            with self._locks[index]:
+                self._senders[index].send_bytes(body)
+        except OSError:
+            logger.error("Воркер %d недоступен, обновление не передано", index)
+            return False
+        ROUTED.inc(str(index))
+        return True
+
+    def _watch(self):
+        wait([process.sentinel for process in self.processes])
+        if self._stopping:
+            return
+        dead = [p.name for p in self.processes if not p.is_alive()]
+        logger.error("Воркер %s завершился, останавливаю процесс", ", ".join(dead))
+        os.kill(os.getpid(), signal.SIGTERM)
+
+    def stop(self, timeout=10):
+        """Закрывает каналы и ждёт, пока воркеры доработают и сохранят сессии."""
+        self._stopping = True
+        for sender in self._senders:
+            sender.close()
+        for process in self.processes:
+            process.join(timeout)
+            if process.is_alive():
+                process.terminate()
+
+
+def serve(conn, application, start, stop):
+    """Работа воркера: start(application), затем обновления из conn, пока
+    главный процесс его не закроет, и stop(application)."""
+
+    async def run():
+        loop = asyncio.get_running_loop()
+        closed = loop.create_future()
+        await start(application)
+
+        def read():
+            try:
+                while True:
+                    update = Update.de_json(json.loads(conn.recv_bytes()), application.bot)
+                    loop.call_soon_threadsafe(application.update_queue.put_nowait, update)
+            except (EOFError, OSError):
+                pass
+            loop.call_soon_threadsafe(closed.set_result, None)
+
+        Thread(target=read, daemon=True, name="shard-reader").start()
+        await closed
+        # stop() дожидается обновлений, которые уже в очереди
+        await stop(application)
+
+    asyncio.run(run())
+
+
+async def poll(bot, route, timeout=30):
+    """getUpdates в главном процессе: каждое обновление уходит в route(JSON)."""
+    async with bot:
+        await bot.delete_webhook(drop_pending_updates=True)
+        offset = None
+        while True:
+            try:
+                updates = await bot.get_updates(offset=offset, timeout=timeout, allowed_updates=Update.ALL_TYPES)
+            except NetworkError as exc:
+                logger.warning("getUpdates: %s", exc)
+                await asyncio.sleep(1)
+                continue
+            for update in updates:
+                route(update.to_dict())
+                offset = update.update_id + 1
@@ -0,0 +1,220 @@
+import logging
+import os
+import sqlite3
+import time
+from sys import intern
+from threading import Thread
+
+from cache import ResultCache
+from chunks import ChunkMap
+from content import CONTENT_DB, SOURCE, ContentError, ContentStore, _digest, build
+from fulltext import TextIndex
+from fuzzy import FuzzyMatcher
+from inline import InlineResults
+from morph import LemmaIndex
+from pages import SectionPages, TopicPages
+from quiz import QuizBank
+from render import ALL_TOPICS_BUTTON, HELP, HELP_BUTTON
+from search import Numbering, TopicIndex
+
+# --- Снимок контента и перезагрузка без перезапуска ---
+# Всё, что читают обработчики (файл с темами, индексы, кнопки), собрано в
+# один неизменяемый снимок. Новый снимок готовится в отдельном потоке из
+# старого: заново индексируются только изменённые темы, остальное общее
+# (см. chunks.py). Сравнение с новым файлом — один проход по парам
+# (ключ, отпечаток), в памяти остаются только изменённые.
+# Публикация — одно присваивание ссылки, поэтому обработчики читают
+# снимок без блокировок, а начатый ответ доживает на старом снимке.
+logger = logging.getLogger(__name__)
+
+
+def _rss():
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError):
+        return 0
+
+
+def _stamp(path):
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    return st.st_ino, st.st_mtime_ns, st.st_size
+
+
+def _moved(old_keys, new_keys, skip):
+    # Темы, порядок которых относительно остальных поменялся: для индексов
+    # это то же, что изменение (от порядка зависит, какая тема первая)
+    common = set(old_keys) & set(new_keys) - skip
+    old_keys = [key for key in old_keys if key in common]
+    new_keys = [key for key in new_keys if key in common]
+    return {a for a, b in zip(old_keys, new_keys) if a != b}
+
+
+class Snapshot:
+    def __init__(self, store, index, lemmas, fulltext, fuzzy, inline, pages, sections, digests, quiz=None):
+        self.store = store
+        self.numbering = index.numbering
+        self.index = index
+        self.lemmas = lemmas
+        self.fulltext = fulltext
+        self.fuzzy = fuzzy
+        self.inline = inline
+        self.pages = pages
+        self.sections = sections
+        self.digests = digests
+        self.section_buttons = sections.buttons
+        # Текст кнопки -> готовый ответ (текст, клавиатура): нажатие кнопки
+        # не доходит до поиска
+        self.buttons = {button: sections.page(pos, 0) for pos, button in enumerate(sections.buttons)}
+        self.buttons[ALL_TOPICS_BUTTON] = pages.page(0)
+        self.buttons[HELP_BUTTON] = (HELP, None)
+        # Банк викторины переходит в новый снимок, если вопросы не менялись
+        if quiz is None:
+            quiz = QuizBank(store.questions(), store.title)
+        else:
+            quiz = quiz.rebound(store.title)
+        self.quiz = quiz
+        # Ответы на текстовые запросы; у нового снимка — пустой
+        self.results = ResultCache()
+        self.changed = self.removed = 0
+
+    @classmethod
+    def build(cls, store):
+        texts = list(store.texts())
+        numbering = Numbering(key for key, _, _, _ in texts)
+        titles = [(key, title) for key, title, _, _ in texts]
+        index = TopicIndex(titles, numbering)
+        lemmas = LemmaIndex(titles, numbering)
+        fulltext = TextIndex(texts, numbering)
+        fuzzy = FuzzyMatcher(titles, numbering)
+        inline = InlineResults(store, index, lemmas, fulltext, fuzzy)
+        pages = TopicPages(titles, numbering)
+        sections = SectionPages(store.sections(), pages)
+        digests = ChunkMap((intern(key), digest) for key, digest in store.digests())
+        return cls(store, index, lemmas, fulltext, fuzzy, inline, pages, sections, digests)
+
+    def updated(self, store):
+        """Снимок для нового файла с темами, собранный из этого."""
+        digests = self.digests.copy()
+        changed, keys = set(), []
+        for key, digest in store.digests():
+            keys.append(key)
+            if digests.get(key) != digest:
+                key = intern(key)
+                changed.add(key)
+                digests[key] = digest
+        added = {key for key in changed if key not in self.digests}
+        if len(keys) - len(added) < len(self.digests):
+            # Темы удалены — редкий случай, ради него один проход по старым ключам
+            removed = set(self.digests).difference(keys)
+            for key in removed:
+                del digests[key]
+            changed |= removed
+        old_keys = [self.numbering.keys[tid] for tid in self.numbering.order]
+        if keys == old_keys:
+            # Обычный случай — темы правили на месте: нумерация та же
+            numbering = self.numbering
+        else:
+            changed |= _moved(old_keys, keys, changed)
+            numbering = self.numbering.updated(map(intern, keys))
+        # Старое соединение читает прежний файл, даже если его уже заменили
+        old = self.store.topics(key for key in changed if key in self.digests)
+        new = store.topics(key for key in changed if key in digests)
+
+        old_titles = {key: title for key, (title, _, _, _) in old.items()}
+        new_titles = {key: title for key, (title, _, _, _) in new.items()}
+        index = self.index.updated(numbering, old_titles, new_titles)
+        lemmas = self.lemmas.updated(numbering, old_titles, new_titles)
+        fulltext = self.fulltext.updated(
+            numbering,
+            {key: (title, rule, examples) for key, (title, rule, examples, _) in old.items()},
+            {key: (title, rule, examples) for key, (title, rule, examples, _) in new.items()},
+        )
+        fuzzy = self.fuzzy.updated(numbering, old_titles, new_titles)
+        inline = self.inline.updated(
+            index, lemmas, fulltext, fuzzy, old,
+            ((key, title, card) for key, (title, _, _, card) in new.items()),
+        )
+        pages = self.pages.updated(numbering, old_titles, new_titles)
+        sections = self.sections.updated(store.sections(), pages)
+        quiz = None
+        if store.questions_digest is not None and store.questions_digest == self.store.questions_digest:
+            quiz = self.quiz
+        snapshot = Snapshot(store, index, lemmas, fulltext, fuzzy, inline, pages, sections, digests, quiz)
+        snapshot.changed = len(new)
+        snapshot.removed = len(old.keys() - new.keys())
+        return snapshot
+
+
+class Reloader:
+    """Следит за rules.py и собранным файлом и публикует новые снимки.
+
+    current() возвращает действующий снимок, publish(snapshot) заменяет его."""
+
+    def __init__(self, current, publish, interval, source=SOURCE, path=CONTENT_DB):
+        self.current = current
+        self.publish = publish
+        self.interval = interval
+        self.source = source
+        self.path = path
+        self._source = _stamp(source)
+        self._artifact = _stamp(path)
+
+    def check(self):
+        """Один проход: пересобирает и публикует снимок, если что-то изменилось."""
+        stamp = _stamp(self.source)
+        if stamp != self._source:
+            self._source = stamp
+            if _digest(self.source) != self._artifact_digest():
+                try:
+                    # Другой воркер мог собрать файл раньше — тогда это повтор,
+                    # замена файла всё равно атомарна
+                    build(self.source, self.path, previous=self.path)
+                except ContentError as exc:
+                    logger.error("rules.py не собран, остаётся прежний контент: %s", exc)
+                    return None
+
+        stamp = _stamp(self.path)
+        if stamp == self._artifact:
+            return None
+        self._artifact = stamp
+        store = ContentStore(self.path)
+        current = self.current()
+        if store.digest == current.store.digest:
+            store.close()
+            return None
+
+        start, rss = time.perf_counter(), _rss()
+        snapshot = current.updated(store)
+        self.publish(snapshot)
+        logger.info(
+            "Контент перезагружен: изменено %d, удалено %d тем за %.1f мс, память %+.1f МБ",
+            snapshot.changed, snapshot.removed,
+            (time.perf_counter() - start) * 1000, (_rss() - rss) / 2**20,
+        )
+        return snapshot
+
+    def _artifact_digest(self):
+        try:
+            store = ContentStore(self.path)
+        except sqlite3.DatabaseError:
+            return None
+        try:
+            return store.digest
+        finally:
+            store.close()
+
+    def _run(self):
+        while True:
+            time.sleep(self.interval)
+            try:
+                self.check()
+            except Exception:
+                logger.exception("Ошибка при перезагрузке контента")
+
+    def start(self):
+        Thread(target=self._run, daemon=True, name="reload").start()
+        return self